@@ -28,7 +28,7 @@
         @loopSize
         D = M
         @SCREEN
-        A = A + D
+        A = D + A
         D = 0
         M = D
         @loopSize
@@ -44,7 +44,7 @@
         @loopSize
         D = M
         @SCREEN
-        A = A + D
+        A = D + A
         D = -1
         M = D
         @loopSize
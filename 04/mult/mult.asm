@@ -62,7 +62,7 @@ M = D
     @factor
     D = M
     @R2
-    M = M + D
+    M = D + M
     @counter
     M = M - 1
     D = M
@@ -1,11 +1,23 @@
 """
 This is assembler program for hack computer developed for nand2tetris coursera course
 """
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from enum import Enum
+from itertools import islice
 import argparse
 from pathlib import Path
 from pathlib import PurePath
 import time
+import warnings
+
+from assemblerCache import AssemblyCache, DEFAULT_CACHE_SIZE
+from assemblerProfile import PhaseProfiler
+import romFile
+
+# bump when output for the same source changes, invalidates assembler cache
+ASSEMBLER_VERSION = "1.1"
 
 class CommandType(Enum):
     """
@@ -177,17 +189,268 @@ class Command:
 # End of class Command
 
 
+# Lookup tables used by the Encoder, built once at import time.
+# Comp codes include the "a" bit, so every value is 7 bits wide.
+COMP_CODES = {
+    # a = 0
+    "0":   0b0101010,
+    "1":   0b0111111,
+    "-1":  0b0111010,
+    "D":   0b0001100,
+    "A":   0b0110000,
+    "!D":  0b0001101,
+    "!A":  0b0110001,
+    "-D":  0b0001111,
+    "-A":  0b0110011,
+    "D+1": 0b0011111,
+    "A+1": 0b0110111,
+    "D-1": 0b0001110,
+    "A-1": 0b0110010,
+    "D+A": 0b0000010,
+    "D-A": 0b0010011,
+    "A-D": 0b0000111,
+    "D&A": 0b0000000,
+    "D|A": 0b0010101,
+    # a = 1
+    "M":   0b1110000,
+    "!M":  0b1110001,
+    "-M":  0b1110011,
+    "M+1": 0b1110111,
+    "M-1": 0b1110010,
+    "D+M": 0b1000010,
+    "D-M": 0b1010011,
+    "M-D": 0b1000111,
+    "D&M": 0b1000000,
+    "D|M": 0b1010101,
+}
+
+DEST_CODES = {
+    "null": 0b000,
+    "M":    0b001,
+    "D":    0b010,
+    "MD":   0b011,
+    "A":    0b100,
+    "AM":   0b101,
+    "AD":   0b110,
+    "AMD":  0b111
+}
+
+JUMP_CODES = {
+    "null": 0b000,
+    "JGT":  0b001,
+    "JEQ":  0b010,
+    "JGE":  0b011,
+    "JLT":  0b100,
+    "JNE":  0b101,
+    "JLE":  0b110,
+    "JMP":  0b111
+}
+
+C_COMMAND_PREFIX = 0b111 << 13
+A_COMMAND_MASK = 0x7FFF
+
+
+def splitCCommand(line):
+    """
+    Splits cleaned C command to (dest, comp, jump), missing parts are "null"
+    """
+    dest, separator, rest = line.partition("=")
+    if not separator:
+        dest, rest = "null", line
+    comp, separator, jump = rest.partition(";")
+    if not separator:
+        jump = "null"
+    return dest, comp, jump
+
+
+def encodeCCommand(line, lineNumber = 0):
+    """
+    Encodes single cleaned C command (e.g. "AM=M-1" or "D;JGT") to integer opcode
+    """
+    dest, comp, jump = splitCCommand(line)
+    try:
+        return C_COMMAND_PREFIX | (COMP_CODES[comp] << 6) | (DEST_CODES[dest] << 3) | JUMP_CODES[jump]
+    except KeyError:
+        raise ValueError("Error on line number {}: {} is not a valid C command".format(lineNumber, line))
+
+
+class Encoder:
+    """
+    Table driven encoder, turns preprocessed lines into integer opcodes.
+    C commands are memoized, since generated code repeats the same few
+    hundred of them over and over.
+    """
+    def __init__(self, symbolsDict):
+        self.symbolsDict = symbolsDict
+        self.cCommandsCache = {}
+
+    def encodeLine(self, line, lineNumber = 0):
+        if line[0] == "@":
+            value = line[1:]
+            if value.isdigit():
+                return int(value) & A_COMMAND_MASK
+            return self.symbolsDict[value] & A_COMMAND_MASK
+        word = self.cCommandsCache.get(line)
+        if word is None:
+            word = encodeCCommand(line, lineNumber)
+            self.cCommandsCache[line] = word
+        return word
+
+    def encode(self, lines, startLine = 0):
+        encodeLine = self.encodeLine
+        return [encodeLine(line, lineNumber) for lineNumber, line in enumerate(lines, startLine)]
+
+# End of class Encoder
+
+
+def wordToBinary(word):
+    """
+    Formats integer opcode as 16 character binary string used in .hack files
+    """
+    return format(word, "016b")
+
+
+# Parallel encoding. Symbol table is frozen after preprocessing, so it is
+# sent to every worker process once and chunks are encoded independently.
+PARALLEL_MIN_CHUNK = 1 << 14
+__workerEncoder = None
+
+
+def initEncoderWorker(symbolsDict):
+    global __workerEncoder
+    __workerEncoder = Encoder(symbolsDict)
+    return None
+
+
+def encodeChunk(chunk):
+    startLine, lines = chunk
+    return array("H", __workerEncoder.encode(lines, startLine))
+
+
+def encodeParallel(preprocessedFile, symbolsDict, jobs):
+    """
+    Encodes preprocessed file in process pool, returns list of integer opcodes
+    in original order. Small inputs are encoded in current process.
+    """
+    lineCount = len(preprocessedFile)
+    chunkSize = max(PARALLEL_MIN_CHUNK, -(-lineCount // (jobs * 4)))
+    if jobs <= 1 or lineCount <= chunkSize:
+        return Encoder(symbolsDict).encode(preprocessedFile)
+
+    chunks = ((start, preprocessedFile[start:start + chunkSize])
+              for start in range(0, lineCount, chunkSize))
+    words = []
+    with ProcessPoolExecutor(max_workers = jobs, initializer = initEncoderWorker,
+                             initargs = (symbolsDict,)) as executor:
+        for chunkWords in executor.map(encodeChunk, chunks):
+            words.extend(chunkWords)
+    return words
+
+
+RAM_SIZE = 1 << 15
+
+
+class SymbolTable:
+    """
+    Symbol table with reverse index of used RAM addresses, kept as bitmap,
+    so allocation of new variable does not scan all symbols
+    """
+    def __init__(self, symbolsDict = None):
+        self.symbolsDict = {}
+        self.usedAddresses = bytearray(RAM_SIZE)
+        self.nextRef = 0
+        if symbolsDict is not None:
+            for symbol, address in symbolsDict.items():
+                self.addEntry(symbol, address)
+
+    def __contains__(self, symbol):
+        return symbol in self.symbolsDict
+
+    def __getitem__(self, symbol):
+        return self.symbolsDict[symbol]
+
+    def __len__(self):
+        return len(self.symbolsDict)
+
+    def addEntry(self, symbol, address, *, reserve = True):
+        """
+        Adds symbol, if reserve is set address is marked as used RAM
+        (labels point to ROM so they do not reserve anything)
+        """
+        self.symbolsDict[symbol] = address
+        if reserve and 0 <= address < RAM_SIZE:
+            self.usedAddresses[address] = 1
+        return address
+
+    def allocate(self, symbol):
+        """
+        Assigns first free RAM address to symbol. nextRef only moves forward,
+        so allocating n variables costs O(n) in total.
+        """
+        usedAddresses = self.usedAddresses
+        while self.nextRef < RAM_SIZE and usedAddresses[self.nextRef]:
+            self.nextRef += 1
+        if self.nextRef >= RAM_SIZE:
+            raise ValueError("Out of RAM, can not allocate variable {}".format(symbol))
+        address = self.addEntry(symbol, self.nextRef)
+        self.nextRef += 1
+        return address
+
+    def update(self, labelsDict):
+        for symbol, address in labelsDict.items():
+            self.addEntry(symbol, address, reserve = False)
+        return None
+
+    def writeSymFile(self, outFile):
+        """
+        Writes map file, one "symbol address" pair per line
+        """
+        with open(outFile, mode = "w") as f:
+            for symbol, address in self.symbolsDict.items():
+                f.write("{} {}\n".format(symbol, address))
+        return None
+
+# End of class SymbolTable
+
+
+def cleanLine(line):
+    """
+    Removes comment and all whitespaces from line
+    """
+    index = line.find("//")
+    if index != -1:
+        line = line[:index]
+    return "".join(line.split())
+
+
+def iterInstructions(lines):
+    """
+    Lazily yields cleaned instructions (without labels) from iterable of lines
+    """
+    for line in lines:
+        cLine = cleanLine(line)
+        if cLine == "" or cLine[0] == "(":
+            continue
+        yield cLine
+
+
 class Preprocessor:
     """
     This class is used to remove comments, remove whitespaces, and
     detect and catalog symbols
     """
-    def __init__(self, fileList):
+    def __init__(self, fileList, *, keepLines = True):
+        # fileList can be any iterable of lines, including open file
         self.fileList = fileList
-        # add next ref ,so you know which value to assign
-        self.symbolsDict = self.__getDefaultSymbolsDict()
+        # when keepLines is False only symbol tables are built, this is used
+        # for streaming where cleaned lines are produced again in second pass
+        self.keepLines = keepLines
+        self.symbolTable = SymbolTable(self.__getDefaultSymbolsDict())
+        self.symbolsDict = self.symbolTable.symbolsDict
         self.labelsDict = {}
-        self.nextRef = 0
+        # symbolic a command values in order of first appearance,
+        # dict is used as ordered set
+        self.symbolicValues = {}
         self.fileListClean = []
         self.lineNumber = 0
 
@@ -209,49 +472,247 @@ class Preprocessor:
         return symbolsDict
 
 
-    def process(self):
-
-        for line in self.fileList:
-            index = line.find("//")
-            if index == -1:
-                slice = line
-            else:
-                slice = line[:index]
-            cLine = "".join(slice.split())
-            if cLine == "":
-                continue
-
+    def scanLabels(self, cleanLines):
+        """
+        First pass over lines without comments and whitespaces, catalogs labels
+        and symbolic a command values
+        """
+        symbolicValues = self.symbolicValues
+        for cLine in cleanLines:
             currentCommand = Command(cLine, self.lineNumber)
+            commandType = currentCommand.getCommandType()
             # putting l commands in symbolic table (dict)
-            if currentCommand.getCommandType() == CommandType.L_COMMAND:
+            if commandType == CommandType.L_COMMAND:
                 value = currentCommand.parse()
                 if value in self.labelsDict.keys():
                     raise ValueError("line: {}, label {} declared multiple times".format(self.lineNumber, value))
                 self.labelsDict[value] = self.lineNumber
                 continue
+            if commandType == CommandType.A_COMMAND and currentCommand.isSymbolic():
+                symbolicValues[currentCommand.parse()] = None
 
-            self.fileListClean.append(cLine)
+            if self.keepLines:
+                self.fileListClean.append(cLine)
             self.lineNumber += 1
-        # due to oversight in architecture, this is done in two passes insted of one
-        for lineNumber, line in enumerate(self.fileListClean):
-            #putting a commands in symbolic table (dict)
-            currentCommand = Command(line, lineNumber)
-            if currentCommand.getCommandType() == CommandType.A_COMMAND:
-                value = currentCommand.parse()
-                # if value is symbolic and not seen before put it in dict
-                if (currentCommand.isSymbolic() and value not in self.symbolsDict.keys()
-                    and value not in self.labelsDict.keys()):
-                    while(self.nextRef in self.symbolsDict.values()):
-                        self.nextRef += 1
-
-                    self.symbolsDict[value] = self.nextRef
-                    self.nextRef += 1
+        return None
+
+    def allocateVariables(self):
+        """
+        Labels are known only after whole file is scanned, so variables are
+        allocated after first pass. Returns number of allocated variables.
+        """
+        variablesCount = 0
+        for value in self.symbolicValues:
+            # if value is not seen before put it in dict
+            if value not in self.symbolTable and value not in self.labelsDict.keys():
+                self.symbolTable.allocate(value)
+                variablesCount += 1
         
-        self.symbolsDict.update(self.labelsDict)
+        self.symbolTable.update(self.labelsDict)
+        return variablesCount
+
+    def process(self):
+        self.scanLabels(cLine for cLine in map(cleanLine, self.fileList) if cLine != "")
+        self.allocateVariables()
         return self.fileListClean, self.symbolsDict
 
 # End of class Preprocessor
 
+class Optimizer:
+    """
+    Peephole optimizer, runs between Preprocessor and Parser. Removes
+    instructions which can not change program state and moves labels
+    accordingly. Numeric ROM addresses are only recognized when used directly
+    as jump target (e.g. "@133", "0;JMP"). Program with computed jump (e.g.
+    "@R13", "A=M", "0;JMP") may keep numeric ROM addresses as data, if it
+    also loads numbers in ROM range otherwise, it is left unchanged.
+    """
+    def __init__(self, preprocessedFile, symbolTable, labelsDict):
+        self.lines = list(preprocessedFile)
+        self.symbolTable = symbolTable
+        self.labelsDict = dict(labelsDict)
+        self.stats = {
+            "unreachable code": 0,
+            "dead A load": 0,
+            "redundant A load": 0,
+            "reload after store": 0
+        }
+        self.wordsSaved = 0
+        self.disabledReason = None
+
+    def __isJump(self, line):
+        return line[0] != "@" and splitCCommand(line)[2] != "null"
+
+    def __pinNumericJumpTargets(self):
+        """
+        Replaces numeric jump targets with synthetic labels, so they are moved
+        together with other labels
+        """
+        lines = self.lines
+        self.romLabels = {}
+        for index in range(len(lines) - 1):
+            value = lines[index][1:]
+            if lines[index][0] == "@" and value.isdigit() and self.__isJump(lines[index + 1]):
+                address = int(value)
+                if address <= len(lines):
+                    label = "ROM.{}".format(address)
+                    while label in self.symbolTable and label not in self.romLabels:
+                        label = "_" + label
+                    self.romLabels[label] = address
+                    self.labelsDict[label] = address
+                    lines[index] = "@" + label
+        return None
+
+    def __hasComputedJump(self):
+        """
+        Jump which is not directly preceded by A command, or which is jump
+        target itself, goes to address computed at run time
+        """
+        lines = self.lines
+        targets = set(self.labelsDict.values())
+        for index, line in enumerate(lines):
+            if self.__isJump(line) and (index == 0 or lines[index - 1][0] != "@" or index in targets):
+                return True
+        return False
+
+    def __hasNumericROMAddresses(self):
+        """
+        Numeric A commands, left after pinning jump targets, which may
+        address ROM
+        """
+        return any(line[0] == "@" and line[1:].isdigit() and int(line[1:]) <= len(self.lines)
+                   for line in self.lines)
+
+    def __unpinNumericJumpTargets(self):
+        for index, line in enumerate(self.lines):
+            if line[0] == "@" and line[1:] in self.romLabels:
+                self.lines[index] = "@{}".format(self.labelsDict[line[1:]])
+        for label in self.romLabels:
+            del self.labelsDict[label]
+        return None
+
+    def __unreachableCode(self, targets):
+        """
+        Instructions after unconditional jump, up to next jump target
+        """
+        removed = []
+        reachable = True
+        for index, line in enumerate(self.lines):
+            if index in targets:
+                reachable = True
+            if not reachable:
+                removed.append(index)
+            elif line[0] != "@" and splitCCommand(line)[2] == "JMP":
+                reachable = False
+        return removed
+
+    def __deadALoad(self, targets):
+        """
+        A command immediately followed by another A command
+        """
+        lines = self.lines
+        return [index for index in range(len(lines) - 1)
+                if lines[index][0] == "@" and lines[index + 1][0] == "@"]
+
+    def __redundantALoad(self, targets):
+        """
+        A command loading value A already holds, e.g. second @SP in
+        "@SP", "M=M+1", "@SP", "A=M"
+        """
+        removed = []
+        knownA = None
+        for index, line in enumerate(self.lines):
+            if index in targets:
+                knownA = None
+            if line[0] == "@":
+                if line == knownA:
+                    removed.append(index)
+                knownA = line
+            elif "A" in splitCCommand(line)[0]:
+                knownA = None
+        return removed
+
+    def __reloadAfterStore(self, targets):
+        """
+        "D=M" right after instruction which left same value in D and M,
+        e.g. "M=D", "D=M" or "MD=M+1", "D=M"
+        """
+        removed = []
+        lines = self.lines
+        for index in range(1, len(lines)):
+            if lines[index] != "D=M" or index in targets or lines[index - 1][0] == "@":
+                continue
+            dest, comp, _ = splitCCommand(lines[index - 1])
+            if "M" in dest and "A" not in dest and (comp == "D" or "D" in dest):
+                removed.append(index)
+        return removed
+
+    def __remove(self, removed):
+        """
+        Removes instructions at given indices and moves labels to next kept
+        instruction
+        """
+        removed = set(removed)
+        newIndex = []
+        lines = []
+        for index, line in enumerate(self.lines):
+            newIndex.append(len(lines))
+            if index not in removed:
+                lines.append(line)
+        # label may point just past last instruction
+        newIndex.append(len(lines))
+        for label, address in self.labelsDict.items():
+            if address < len(newIndex):
+                self.labelsDict[label] = newIndex[address]
+        self.lines = lines
+        return None
+
+    def optimize(self):
+        """
+        Runs all rewrites until nothing changes, returns optimized
+        preprocessed file and symbols dict
+        """
+        wordsBefore = len(self.lines)
+        self.__pinNumericJumpTargets()
+        if self.__hasComputedJump() and self.__hasNumericROMAddresses():
+            # any of those numbers may be return address, moving code
+            # would break it
+            self.disabledReason = "computed jump with numeric ROM addresses"
+            warnings.warn("peephole optimizer disabled, {}".format(self.disabledReason))
+            self.__unpinNumericJumpTargets()
+            self.symbolTable.update(self.labelsDict)
+            return self.lines, self.symbolTable.symbolsDict
+        rules = [
+            ("unreachable code", self.__unreachableCode),
+            ("dead A load", self.__deadALoad),
+            ("redundant A load", self.__redundantALoad),
+            ("reload after store", self.__reloadAfterStore)
+        ]
+        changed = True
+        while changed:
+            changed = False
+            for name, rule in rules:
+                targets = set(self.labelsDict.values())
+                removed = rule(targets)
+                if removed:
+                    self.stats[name] += len(removed)
+                    self.__remove(removed)
+                    changed = True
+        self.__unpinNumericJumpTargets()
+        self.symbolTable.update(self.labelsDict)
+        self.wordsSaved = wordsBefore - len(self.lines)
+        return self.lines, self.symbolTable.symbolsDict
+
+    def report(self):
+        if self.disabledReason is not None:
+            return "Peephole optimizer disabled, {}".format(self.disabledReason)
+        lines = ["Peephole optimizer saved {} ROM words".format(self.wordsSaved)]
+        for name, count in self.stats.items():
+            lines.append("    {}: {}".format(name, count))
+        return "\n".join(lines)
+
+# End of class Optimizer
+
 class Parser:
     """
     This class parses preprocessed file and turns it into binary
@@ -262,16 +723,187 @@ class Parser:
         self.symbolsDict = symbolsDict
         self.binaryFile = []
 
-    def toBinary(self):
-        for lineNumber, line in enumerate(self.inFile):
-            currentCommand = Command(line, lineNumber)
-            binaryCommand = currentCommand.translateToBinary(self.symbolsDict)
-            self.binaryFile.append(binaryCommand)
+    def toWords(self, jobs = 1):
+        """
+        Returns list of integer opcodes, with jobs > 1 encoding is done
+        in that many processes
+        """
+        if jobs > 1:
+            return encodeParallel(self.inFile, self.symbolsDict, jobs)
+        return Encoder(self.symbolsDict).encode(self.inFile)
+
+    def toBinary(self, jobs = 1):
+        self.binaryFile = [wordToBinary(word) for word in self.toWords(jobs)]
         return self.binaryFile
 
+    def writeBinary(self, outStream):
+        """
+        Encodes and writes lines in chunks, so preprocessed file can be
+        any iterable (e.g. generator) and only one chunk is kept in memory
+        """
+        encodeLine = Encoder(self.symbolsDict).encodeLine
+        words = (encodeLine(line, lineNumber) for lineNumber, line in enumerate(self.inFile))
+        chunks = iter(lambda: array("H", islice(words, romFile.CHUNK_SIZE)), array("H"))
+        writeJoined(outStream, (romFile.wordsToHackText(chunk).decode("ascii") for chunk in chunks))
+        return None
+
+    def writeWords(self, outStream):
+        """
+        Encodes and writes lines as packed little-endian words to binary stream
+        """
+        encodeLine = Encoder(self.symbolsDict).encodeLine
+        romFile.writeWords(outStream, (encodeLine(line, lineNumber)
+                                       for lineNumber, line in enumerate(self.inFile)))
+        return None
+
 # End of class Parser
 
 
+STREAM_BUFFER_SIZE = 1 << 16
+
+
+def writeJoined(outStream, lines):
+    """
+    Same as outStream.write("\\n".join(lines)) but without building whole string
+    """
+    separator = ""
+    for line in lines:
+        outStream.write(separator)
+        outStream.write(line)
+        separator = "\n"
+    return None
+
+
+def assemble(source, jobs = 1, optimize = False):
+    """
+    Assembles program in memory, without touching filesystem. Source is
+    either text of whole program or iterable of lines; items of iterable may
+    hold several lines each (e.g. output of vm translator Parser.parse).
+    Returns encoded program as array('H') and SymbolTable.
+    """
+    if isinstance(source, str):
+        lines = source.splitlines()
+    else:
+        lines = (line for chunk in source for line in chunk.splitlines())
+    preprocessor = Preprocessor(lines)
+    preprocessedFile, symbolsDict = preprocessor.process()
+    if optimize:
+        optimizer = Optimizer(preprocessedFile, preprocessor.symbolTable, preprocessor.labelsDict)
+        preprocessedFile, symbolsDict = optimizer.optimize()
+    words = array("H", Parser(preprocessedFile, symbolsDict).toWords(jobs))
+    return words, preprocessor.symbolTable
+
+
+def nullPhase(name):
+    return nullcontext()
+
+
+def assembleStreaming(inFilePath, outFile, outFileTemp = None, symFile = None, outFormat = "hack",
+                      profiler = None):
+    """
+    Two pass assembly which never holds the program in memory. First pass
+    builds only symbol tables, second pass re-reads input and writes
+    encoded words through buffered writer. Returns number of instructions.
+    """
+    phase = profiler.phase if profiler is not None else nullPhase
+    # reading, comment stripping and label pass are fused in streaming mode
+    with phase("label pass"), open(inFilePath) as inFile:
+        preprocessor = Preprocessor(inFile, keepLines = False)
+        if profiler is not None:
+            inFile = profiler.countItems("lines read", inFile)
+        preprocessor.scanLabels(cLine for cLine in map(cleanLine, inFile) if cLine != "")
+    with phase("variable pass"):
+        variablesCount = preprocessor.allocateVariables()
+    symbolsDict = preprocessor.symbolsDict
+
+    if symFile is not None:
+        with phase("symbol file write"):
+            preprocessor.symbolTable.writeSymFile(symFile)
+
+    if outFileTemp is not None:
+        with phase("temp write"), open(inFilePath) as inFile, \
+                open(outFileTemp, mode = "w", buffering = STREAM_BUFFER_SIZE) as tempFile:
+            writeJoined(tempFile, iterInstructions(inFile))
+
+    # encoding and final write are fused in streaming mode
+    with phase("encoding and write"):
+        if outFormat == "bin":
+            with open(inFilePath) as inFile, open(outFile, mode = "wb", buffering = STREAM_BUFFER_SIZE) as outStream:
+                parser = Parser(iterInstructions(inFile), symbolsDict)
+                parser.writeWords(outStream)
+        else:
+            with open(inFilePath) as inFile, open(outFile, mode = "w", buffering = STREAM_BUFFER_SIZE) as outStream:
+                parser = Parser(iterInstructions(inFile), symbolsDict)
+                parser.writeBinary(outStream)
+
+    if profiler is not None:
+        profiler.count("labels", len(preprocessor.labelsDict))
+        profiler.count("variables", variablesCount)
+        profiler.count("instructions", preprocessor.lineNumber)
+    return preprocessor.lineNumber
+
+
+def assembleFile(inFilePath, outFile, outFileTemp = None, symFile = None,
+                 outFormat = "hack", jobs = 1, stream = False, profiler = None, optimize = False):
+    """
+    Assembles file at inFilePath, writes outFile and, if given, preprocessed
+    file (outFileTemp) and symbol map (symFile). Returns number of instructions.
+    If profiler (assemblerProfile.PhaseProfiler) is given, every phase is timed.
+    """
+    if stream and optimize:
+        raise ValueError("peephole optimizer needs whole program, it can not be used with streaming")
+    if stream:
+        return assembleStreaming(inFilePath, outFile, outFileTemp, symFile, outFormat, profiler)
+
+    phase = profiler.phase if profiler is not None else nullPhase
+    with phase("read"), open(inFilePath) as inFile:
+        lines = inFile.readlines()
+    with phase("comment stripping"):
+        cleanLines = [cLine for cLine in map(cleanLine, lines) if cLine != ""]
+    preprocessor = Preprocessor(lines)
+    with phase("label pass"):
+        preprocessor.scanLabels(cleanLines)
+        del cleanLines
+    with phase("variable pass"):
+        variablesCount = preprocessor.allocateVariables()
+    preprocessedFile, symbolsDict = preprocessor.fileListClean, preprocessor.symbolsDict
+
+    if optimize:
+        optimizer = Optimizer(preprocessedFile, preprocessor.symbolTable, preprocessor.labelsDict)
+        with phase("peephole optimization"):
+            preprocessedFile, symbolsDict = optimizer.optimize()
+        print(optimizer.report())
+        if profiler is not None:
+            profiler.count("words saved", optimizer.wordsSaved)
+
+    if symFile is not None:
+        with phase("symbol file write"):
+            preprocessor.symbolTable.writeSymFile(symFile)
+
+    if outFileTemp is not None:
+        with phase("temp write"):
+            open(outFileTemp, mode = "w").write("\n".join(preprocessedFile))
+
+    parser = Parser(preprocessedFile, symbolsDict)
+    if outFormat == "bin":
+        with phase("encoding"):
+            words = parser.toWords(jobs)
+        with phase("final write"):
+            romFile.writeBinaryRom(outFile, words)
+    else:
+        with phase("encoding"):
+            words = parser.toWords(jobs)
+        with phase("final write"):
+            romFile.writeHackText(outFile, words)
+
+    if profiler is not None:
+        profiler.count("lines read", len(lines))
+        profiler.count("labels", len(preprocessor.labelsDict))
+        profiler.count("variables", variablesCount)
+        profiler.count("instructions", len(preprocessedFile))
+    return len(preprocessedFile)
+
+
 def main():
     argumentParser = argparse.ArgumentParser(description = "Assembler for hack computer.")
     argumentParser.add_argument("inputFile", metavar = "inFile", type = str, nargs = 1,
@@ -280,23 +912,57 @@ def main():
     #                            help = "name of output file.")
     argumentParser.add_argument("--keep", action = "store_const", const = True,
                                 help = "keep temporary preprocessed file")
+    argumentParser.add_argument("--stream", action = "store_const", const = True,
+                                help = "assemble in two streaming passes with constant memory")
+    argumentParser.add_argument("--sym", action = "store_const", const = True,
+                                help = "write symbol map file (symbol address per line)")
+    argumentParser.add_argument("--format", type = str, choices = ["hack", "bin"], default = "hack",
+                                help = "output format, hack text or packed little-endian 16 bit words")
+    argumentParser.add_argument("--jobs", type = int, default = 1,
+                                help = "number of processes used for encoding (not used with --stream)")
+    argumentParser.add_argument("--cache", type = str, default = None, metavar = "DIR",
+                                help = "reuse output of previous runs stored in given directory")
+    argumentParser.add_argument("--cache-size", type = int, default = DEFAULT_CACHE_SIZE,
+                                help = "cache size limit in bytes, least recently used entries are evicted")
+    argumentParser.add_argument("--profile", action = "store_const", const = True,
+                                help = "report time and net live memory blocks of every phase")
+    argumentParser.add_argument("--profile-format", type = str, choices = ["text", "json"], default = "text",
+                                help = "format of profile report")
+    argumentParser.add_argument("--optimize", action = "store_const", const = True,
+                                help = "run peephole optimizer before encoding (not used with --stream)")
 
     args = vars(argumentParser.parse_args())
+    if args["optimize"] and args["stream"]:
+        argumentParser.error("--optimize can not be used with --stream")
     inFilePath = Path(args["inputFile"][0])
     #inFile = str(inFilePath.resolve())
 
-    outFile = inFilePath.resolve().parent.joinpath(inFilePath.stem + ".hack")
+    outFormat = args["format"]
+    outFile = inFilePath.resolve().parent.joinpath(inFilePath.stem + "." + outFormat)
     outFileTemp = inFilePath.resolve().parent.joinpath(inFilePath.stem + ".ohack")
-
-    preprocessor = Preprocessor(inFilePath.open().readlines())
-    preprocessedFile, symbolsDict = preprocessor.process()
-
-    open(outFileTemp, mode = "w").write("\n".join(preprocessedFile))
-
-    parser = Parser(preprocessedFile, symbolsDict)
-    binaryFile = parser.toBinary()
-    
-    open(outFile, mode = "w").write("\n".join(binaryFile))
+    symFile = inFilePath.resolve().parent.joinpath(inFilePath.stem + ".sym")
+    symFile = symFile if args["sym"] else None
+    outFileTemp = outFileTemp if args["keep"] else None
+
+    cache = None
+    if args["cache"] is not None:
+        cache = AssemblyCache(args["cache"], args["cache_size"], ASSEMBLER_VERSION)
+        cacheKey = cache.makeKey(inFilePath, outFormat, bool(args["optimize"]))
+        # cache holds only output and symbol files, --keep and --profile
+        # need real run, which refreshes cache entry
+        if not (args["keep"] or args["profile"]) and cache.restore(cacheKey, outFile, symFile):
+            print(cache.report())
+            return None
+
+    profiler = PhaseProfiler() if args["profile"] else None
+    assembleFile(inFilePath, outFile, outFileTemp, symFile, outFormat, args["jobs"], args["stream"],
+                 profiler, bool(args["optimize"]))
+    if profiler is not None:
+        print(profiler.toJson() if args["profile_format"] == "json" else profiler.toText())
+
+    if cache is not None:
+        cache.store(cacheKey, outFile, symFile)
+        print(cache.report())
 
     return None
 
@@ -0,0 +1,79 @@
+"""
+Benchmark for hack assembler encoding pass, compares per command
+translation (Command.translateToBinary) with table driven Encoder
+"""
+import argparse
+from pathlib import Path
+import time
+
+from assembler import Command, Preprocessor, Parser
+
+
+def legacyToBinary(preprocessedFile, symbolsDict):
+    binaryFile = []
+    for lineNumber, line in enumerate(preprocessedFile):
+        currentCommand = Command(line, lineNumber)
+        binaryFile.append(currentCommand.translateToBinary(symbolsDict))
+    return binaryFile
+
+
+def tableToBinary(preprocessedFile, symbolsDict):
+    return Parser(preprocessedFile, symbolsDict).toBinary()
+
+
+def measure(function, preprocessedFile, symbolsDict, repeat):
+    """
+    Returns best time of given number of runs and result of last run
+    """
+    bestTime = None
+    result = None
+    for _ in range(repeat):
+        tick = time.perf_counter()
+        result = function(preprocessedFile, symbolsDict)
+        timeDelta = time.perf_counter() - tick
+        if bestTime is None or timeDelta < bestTime:
+            bestTime = timeDelta
+    return bestTime, result
+
+
+def main():
+    argumentParser = argparse.ArgumentParser(description = "Benchmark for hack assembler encoding.")
+    argumentParser.add_argument("inputFile", metavar = "inFile", type = str, nargs = "?",
+                                default = str(Path(__file__).parent.joinpath("pong", "Pong.asm")),
+                                help = "location of input file.")
+    argumentParser.add_argument("--repeat", type = int, default = 5,
+                                help = "number of runs, best one is reported")
+    argumentParser.add_argument("--jobs", type = int, default = 1,
+                                help = "also measure parallel encoding with given number of processes")
+
+    args = vars(argumentParser.parse_args())
+    inFilePath = Path(args["inputFile"])
+
+    preprocessor = Preprocessor(inFilePath.open().readlines())
+    preprocessedFile, symbolsDict = preprocessor.process()
+    instructions = len(preprocessedFile)
+
+    legacyTime, legacyResult = measure(legacyToBinary, preprocessedFile, symbolsDict, args["repeat"])
+    tableTime, tableResult = measure(tableToBinary, preprocessedFile, symbolsDict, args["repeat"])
+
+    if legacyResult != tableResult:
+        raise ValueError("Encoder output differs from Command.translateToBinary output")
+
+    jobs = args["jobs"]
+    if jobs > 1:
+        parallelToBinary = lambda preprocessedFile, symbolsDict: Parser(preprocessedFile, symbolsDict).toBinary(jobs)
+        parallelTime, parallelResult = measure(parallelToBinary, preprocessedFile, symbolsDict, args["repeat"])
+        if parallelResult != tableResult:
+            raise ValueError("Parallel output differs from single process output")
+
+    print("File: {} ({} instructions)".format(inFilePath, instructions))
+    print("Command.translateToBinary: {:>12,.0f} instructions/s".format(instructions / legacyTime))
+    print("Encoder:                   {:>12,.0f} instructions/s".format(instructions / tableTime))
+    if jobs > 1:
+        print("Encoder, {:>2} jobs:          {:>12,.0f} instructions/s".format(jobs, instructions / parallelTime))
+    print("Speedup: {:.1f}x".format(legacyTime / tableTime))
+    return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+On-disk cache of assembler output, keyed by hash of the source file,
+assembler version and output options. Entries are evicted in least
+recently used order once the cache grows over its size limit.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+
+HASH_CHUNK_SIZE = 1 << 20
+DEFAULT_CACHE_SIZE = 64 << 20
+
+
+class AssemblyCache:
+    """
+    Every entry is stored as <key>.out (assembled program) and optional
+    <key>.sym (symbol map). Modification time of <key>.out is used as
+    last access time for LRU eviction.
+    """
+    def __init__(self, directory, maxSize = DEFAULT_CACHE_SIZE, version = ""):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents = True, exist_ok = True)
+        self.maxSize = maxSize
+        self.version = version
+        self.statsFile = self.directory.joinpath("stats.json")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def makeKey(self, inFilePath, *options):
+        """
+        Hashes source file in chunks together with version and options
+        """
+        digest = hashlib.sha256()
+        digest.update(self.version.encode())
+        for option in options:
+            digest.update(b"\0" + str(option).encode())
+        digest.update(b"\0")
+        with open(inFilePath, mode = "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def __entryPaths(self, key):
+        return self.directory.joinpath(key + ".out"), self.directory.joinpath(key + ".sym")
+
+    def restore(self, key, outFile, symFile = None):
+        """
+        Copies cached output to outFile (and symFile), returns True on hit
+        """
+        cachedOut, cachedSym = self.__entryPaths(key)
+        if not cachedOut.exists() or (symFile is not None and not cachedSym.exists()):
+            self.misses += 1
+            return False
+        shutil.copyfile(cachedOut, outFile)
+        if symFile is not None:
+            shutil.copyfile(cachedSym, symFile)
+        # touch entry, so it is evicted last
+        os.utime(cachedOut)
+        self.hits += 1
+        return True
+
+    def __copyAtomic(self, source, destination):
+        # other assembler processes may read the cache at the same time,
+        # so entries are written to temp file and moved in place
+        fd, tempPath = tempfile.mkstemp(dir = self.directory, suffix = ".tmp")
+        os.close(fd)
+        shutil.copyfile(source, tempPath)
+        os.replace(tempPath, destination)
+        return None
+
+    def __writeAtomic(self, text, destination):
+        fd, tempPath = tempfile.mkstemp(dir = self.directory, suffix = ".tmp")
+        with os.fdopen(fd, mode = "w") as tempFile:
+            tempFile.write(text)
+        os.replace(tempPath, destination)
+        return None
+
+    def store(self, key, outFile, symFile = None):
+        cachedOut, cachedSym = self.__entryPaths(key)
+        if symFile is not None:
+            self.__copyAtomic(symFile, cachedSym)
+        self.__copyAtomic(outFile, cachedOut)
+        self.evict()
+        return None
+
+    def __entries(self):
+        """
+        Returns list of (lastUsed, size, paths) for every entry
+        """
+        entries = []
+        for cachedOut in self.directory.glob("*.out"):
+            cachedSym = cachedOut.with_suffix(".sym")
+            try:
+                stat = cachedOut.stat()
+                size = stat.st_size
+                if cachedSym.exists():
+                    size += cachedSym.stat().st_size
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, size, (cachedOut, cachedSym)))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.__entries())
+
+    def evict(self):
+        """
+        Removes least recently used entries until cache fits in maxSize
+        """
+        entries = sorted(self.__entries(), key = lambda entry: entry[0])
+        totalSize = sum(size for _, size, _ in entries)
+        for _, size, paths in entries:
+            if totalSize <= self.maxSize:
+                break
+            for path in paths:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            totalSize -= size
+            self.evictions += 1
+        return None
+
+    def saveStats(self):
+        """
+        Adds this run's hits and misses to totals kept in stats.json,
+        returns the totals. Unreadable stats.json counts as empty, file is
+        replaced atomically, so parallel runs may lose counts, but never
+        leave it half written.
+        """
+        totals = {"hits": 0, "misses": 0, "evictions": 0}
+        try:
+            stored = json.loads(self.statsFile.read_text())
+            totals = {name: int(stored.get(name, 0)) for name in totals}
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+        totals["hits"] += self.hits
+        totals["misses"] += self.misses
+        totals["evictions"] += self.evictions
+        self.__writeAtomic(json.dumps(totals), self.statsFile)
+        self.hits = self.misses = self.evictions = 0
+        return totals
+
+    def report(self):
+        hits, misses = self.hits, self.misses
+        totals = self.saveStats()
+        entries = self.__entries()
+        lookups = totals["hits"] + totals["misses"]
+        hitRate = 100 * totals["hits"] / lookups if lookups else 0.0
+        return ("Cache: {} hits, {} misses this run; total {} hits, {} misses ({:.1f}% hit rate), "
+                "{} evictions, {} entries, {} bytes").format(
+                    hits, misses, totals["hits"], totals["misses"], hitRate,
+                    totals["evictions"], len(entries), sum(size for _, size, _ in entries))
+
+# End of class AssemblyCache
@@ -0,0 +1,302 @@
+import unittest
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from assembler import Command, Encoder, Preprocessor, Parser, COMP_CODES, DEST_CODES, JUMP_CODES
+from assembler import iterInstructions, SymbolTable, encodeParallel
+import assembler
+import romFile
+from assemblerCache import AssemblyCache
+from batchAssembler import collectSources, assembleBatch
+from assemblerProfile import PhaseProfiler
+from pathlib import Path
+
+class EncoderTest(unittest.TestCase):
+
+    def test_aCommand(self):
+        encoder = Encoder({"LOOP": 4})
+        self.assertEqual(encoder.encodeLine("@21"), 21)
+        self.assertEqual(encoder.encodeLine("@LOOP"), 4)
+
+    def test_cCommand(self):
+        encoder = Encoder({})
+        self.assertEqual(encoder.encodeLine("AM=M-1"), 0b1111110010101000)
+        self.assertEqual(encoder.encodeLine("0;JMP"), 0b1110101010000111)
+        self.assertEqual(encoder.encodeLine("D"), 0b1110001100000000)
+
+    def test_invalidCCommand(self):
+        encoder = Encoder({})
+        with self.assertRaises(ValueError):
+            encoder.encodeLine("D=M+D")
+
+    def test_matchesCommand(self):
+        symbolsDict = {"x": 16}
+        lines = ["@x", "@5"]
+        for comp in COMP_CODES.keys():
+            for dest in DEST_CODES.keys():
+                for jump in JUMP_CODES.keys():
+                    line = comp
+                    if dest != "null":
+                        line = dest + "=" + line
+                    if jump != "null":
+                        line = line + ";" + jump
+                    if dest != "null" or jump != "null":
+                        lines.append(line)
+        expected = [Command(line, lineNumber).translateToBinary(symbolsDict)
+                    for lineNumber, line in enumerate(lines)]
+        self.assertEqual(Parser(lines, symbolsDict).toBinary(), expected)
+
+class ParallelEncoderTest(unittest.TestCase):
+
+    def test_matchesSingleProcess(self):
+        lines = ["@i", "M=1", "@LOOP", "D;JGT", "AM=M-1", "@7"] * 50
+        symbolsDict = {"i": 16, "LOOP": 2}
+        minChunk = assembler.PARALLEL_MIN_CHUNK
+        assembler.PARALLEL_MIN_CHUNK = 16
+        try:
+            words = encodeParallel(lines, symbolsDict, 3)
+        finally:
+            assembler.PARALLEL_MIN_CHUNK = minChunk
+        self.assertEqual(words, Encoder(symbolsDict).encode(lines))
+
+class SymbolTableTest(unittest.TestCase):
+
+    def test_allocateSkipsUsedAddresses(self):
+        symbolTable = SymbolTable({"R0": 0, "R1": 1, "R3": 3})
+        self.assertEqual(symbolTable.allocate("a"), 2)
+        self.assertEqual(symbolTable.allocate("b"), 4)
+        self.assertEqual(symbolTable["a"], 2)
+
+    def test_labelsDoNotReserveRam(self):
+        symbolTable = SymbolTable()
+        symbolTable.update({"LOOP": 0})
+        self.assertEqual(symbolTable.allocate("a"), 0)
+        self.assertIn("LOOP", symbolTable)
+
+class PreprocessorTest(unittest.TestCase):
+
+    def test_process(self):
+        source = ["// comment\n", "@i\n", "M=1 // i = 1\n", "(LOOP)\n", "@LOOP\n", "0;JMP\n"]
+        preprocessedFile, symbolsDict = Preprocessor(source).process()
+        self.assertEqual(preprocessedFile, ["@i", "M=1", "@LOOP", "0;JMP"])
+        self.assertEqual(symbolsDict["i"], 16)
+        self.assertEqual(symbolsDict["LOOP"], 2)
+
+    def test_streaming(self):
+        source = ["@i\n", "M=1\n", "(LOOP)\n", "@LOOP // jump back\n", "0;JMP\n"]
+        preprocessedFile, symbolsDict = Preprocessor(source).process()
+        expected = "\n".join(Parser(preprocessedFile, symbolsDict).toBinary())
+
+        preprocessor = Preprocessor(iter(source), keepLines = False)
+        _, streamSymbolsDict = preprocessor.process()
+        self.assertEqual(preprocessor.fileListClean, [])
+        self.assertEqual(streamSymbolsDict, symbolsDict)
+        outStream = io.StringIO()
+        Parser(iterInstructions(iter(source)), streamSymbolsDict).writeBinary(outStream)
+        self.assertEqual(outStream.getvalue(), expected)
+
+class RomFileTest(unittest.TestCase):
+
+    def test_roundTrip(self):
+        words = [0, 1, 0x7FFF, 0xFC10, 0xFFFF]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.bin")
+            romFile.writeBinaryRom(path, words)
+            with open(path, mode = "rb") as f:
+                self.assertEqual(f.read()[:4], bytes([0, 0, 1, 0]))
+            with romFile.loadBinaryRom(path) as rom:
+                self.assertEqual(len(rom), len(words))
+                self.assertEqual(list(rom), words)
+                self.assertEqual(rom[3], 0xFC10)
+
+    def test_emptyImage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "empty.bin")
+            romFile.writeBinaryRom(path, [])
+            with romFile.loadBinaryRom(path) as rom:
+                self.assertEqual(len(rom), 0)
+
+    def test_hackText(self):
+        words = [(index * 7919) & 0xFFFF for index in range(5000)]
+        text = "\n".join(format(word, "016b") for word in words).encode()
+        self.assertEqual(romFile.wordsToHackText(words), text)
+        self.assertEqual(romFile.wordsToHackText([]), b"")
+        self.assertEqual(list(romFile.hackTextToWords(text + b"\n")), words)
+        self.assertEqual(list(romFile.hackTextToWords(text.replace(b"\n", b"\r\n"))), words)
+        for invalid in [b"0000000000000002", b"000000000000000", b"00000000000000000"]:
+            with self.assertRaises(ValueError):
+                romFile.hackTextToWords(invalid)
+
+    def test_hackTextWithoutNumpy(self):
+        numpy = romFile.numpy
+        romFile.numpy = None
+        try:
+            self.test_hackText()
+        finally:
+            romFile.numpy = numpy
+
+    def test_writeBinaryInChunks(self):
+        lines = ["@{}".format(index) for index in range(10)]
+        chunkSize = romFile.CHUNK_SIZE
+        romFile.CHUNK_SIZE = 3
+        try:
+            outStream = io.StringIO()
+            Parser(lines, {}).writeBinary(outStream)
+        finally:
+            romFile.CHUNK_SIZE = chunkSize
+        self.assertEqual(outStream.getvalue(), "\n".join(Parser(lines, {}).toBinary()))
+
+class AssemblyCacheTest(unittest.TestCase):
+
+    def test_hitAndMiss(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "Prog.asm")
+            outFile = os.path.join(directory, "Prog.hack")
+            Path(source).write_text("@0\nD=A\n")
+            cache = AssemblyCache(os.path.join(directory, "cache"), version = "test")
+            key = cache.makeKey(source, "hack")
+            self.assertFalse(cache.restore(key, outFile))
+            Path(outFile).write_text("binary")
+            cache.store(key, outFile)
+            os.remove(outFile)
+            self.assertTrue(cache.restore(key, outFile))
+            self.assertEqual(Path(outFile).read_text(), "binary")
+            self.assertNotEqual(cache.makeKey(source, "bin"), key)
+            self.assertEqual(cache.saveStats(), {"hits": 1, "misses": 1, "evictions": 0})
+
+    def test_unreadableStats(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = AssemblyCache(directory)
+            for stats in ["{\"hits\": 4", "[1, 2]", "{\"hits\": \"many\"}"]:
+                Path(directory, "stats.json").write_text(stats)
+                cache.misses = 1
+                self.assertEqual(cache.saveStats(), {"hits": 0, "misses": 1, "evictions": 0})
+            self.assertEqual(json.loads(Path(directory, "stats.json").read_text())["misses"], 1)
+            self.assertEqual(list(Path(directory).glob("*.tmp")), [])
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            outFile = os.path.join(directory, "out")
+            Path(outFile).write_text("x" * 100)
+            cache = AssemblyCache(os.path.join(directory, "cache"), maxSize = 250)
+            for key in ["a", "b", "c"]:
+                cache.store(key, outFile)
+                os.utime(os.path.join(directory, "cache", key + ".out"), (0, ord(key)))
+            self.assertTrue(cache.restore("b", outFile))
+            cache.store("d", outFile)
+            self.assertFalse(cache.restore("a", outFile))
+            self.assertFalse(cache.restore("c", outFile))
+            self.assertTrue(cache.restore("b", outFile))
+            self.assertTrue(cache.restore("d", outFile))
+
+    def test_keepAndProfileBypassCache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "Prog.asm")
+            with open(source, mode = "w") as sourceFile:
+                sourceFile.write("@0\nD=A\n")
+            arguments = ["assembler.py", source, "--cache", os.path.join(directory, "cache")]
+            for extra in [[], ["--keep", "--profile"]]:
+                with mock.patch("sys.argv", arguments + extra), contextlib.redirect_stdout(io.StringIO()) as output:
+                    assembler.main()
+            self.assertTrue(os.path.exists(os.path.join(directory, "Prog.ohack")))
+            self.assertIn("encoding", output.getvalue())
+
+class BatchAssemblerTest(unittest.TestCase):
+
+    def test_assembleBatch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, "sub"))
+            Path(directory, "Good.asm").write_text("@2\nD=A\n")
+            Path(directory, "sub", "Bad.asm").write_text("D=Q\n")
+            sources = collectSources([directory])
+            self.assertEqual([source.name for source in sources], ["Good.asm", "Bad.asm"])
+            summary = assembleBatch(sources, jobs = 1)
+            self.assertEqual(summary["files"], 2)
+            self.assertEqual(summary["failed"], 1)
+            self.assertEqual(summary["instructions"], 2)
+            self.assertEqual(Path(directory, "Good.hack").read_text(),
+                             "0000000000000010\n1110110000010000")
+
+class PhaseProfilerTest(unittest.TestCase):
+
+    def test_assembleFileProfile(self):
+        source = "// test\n@i\nM=1\n(LOOP)\n@LOOP\n0;JMP\n"
+        for stream in [False, True]:
+            with tempfile.TemporaryDirectory() as directory:
+                inFilePath = Path(directory, "Prog.asm")
+                inFilePath.write_text(source)
+                profiler = PhaseProfiler()
+                assembler.assembleFile(inFilePath, Path(directory, "Prog.hack"), stream = stream,
+                                       profiler = profiler)
+                self.assertEqual(profiler.counters, {"lines read": 6, "labels": 1,
+                                                     "variables": 1, "instructions": 4})
+                phases = [phase["phase"] for phase in profiler.phases]
+                self.assertIn("variable pass", phases)
+                self.assertIn("label pass", phases)
+                self.assertIn("netAllocatedBlocks", profiler.phases[0])
+                self.assertIn("netAllocatedBlocks", json.loads(profiler.toJson())["notes"])
+
+class AssembleTest(unittest.TestCase):
+
+    def test_assembleText(self):
+        words, symbolTable = assembler.assemble("@i\nM=1 // i = 1\n(LOOP)\n@LOOP\n0;JMP\n")
+        self.assertEqual(words.typecode, "H")
+        self.assertEqual(list(words), [16, 0b1110111111001000, 2, 0b1110101010000111])
+        self.assertEqual(symbolTable["i"], 16)
+        self.assertEqual(symbolTable["LOOP"], 2)
+
+    def test_assembleChunks(self):
+        words, _ = assembler.assemble(["@SP\nM=M+1\n", "// comment", "@SP\nA=M\n"])
+        expected, _ = assembler.assemble("@SP\nM=M+1\n@SP\nA=M")
+        self.assertEqual(words, expected)
+        self.assertEqual(len(words), 4)
+
+class OptimizerTest(unittest.TestCase):
+
+    def optimize(self, source):
+        preprocessor = Preprocessor(source.split())
+        preprocessedFile, _ = preprocessor.process()
+        optimizer = assembler.Optimizer(preprocessedFile, preprocessor.symbolTable, preprocessor.labelsDict)
+        lines, symbolsDict = optimizer.optimize()
+        return lines, symbolsDict, optimizer
+
+    def test_redundantALoad(self):
+        lines, _, optimizer = self.optimize("@SP M=M+1 @SP A=M M=D")
+        self.assertEqual(lines, ["@SP", "M=M+1", "A=M", "M=D"])
+        self.assertEqual(optimizer.wordsSaved, 1)
+
+    def test_redundantALoadAtLabel(self):
+        lines, _, _ = self.optimize("@SP M=M+1 (LOOP) @SP A=M @LOOP 0;JMP")
+        self.assertEqual(lines, ["@SP", "M=M+1", "@SP", "A=M", "@LOOP", "0;JMP"])
+
+    def test_deadALoadAndReloadAfterStore(self):
+        lines, _, optimizer = self.optimize("@x @y M=D @y D=M D;JGT")
+        self.assertEqual(lines, ["@y", "M=D", "D;JGT"])
+        self.assertEqual(optimizer.stats["dead A load"], 1)
+        self.assertEqual(optimizer.stats["reload after store"], 1)
+
+    def test_unreachableCodeAndLabels(self):
+        lines, symbolsDict, _ = self.optimize("@END 0;JMP D=M D=D+1 (END) @END 0;JMP")
+        self.assertEqual(lines, ["@END", "0;JMP", "@END", "0;JMP"])
+        self.assertEqual(symbolsDict["END"], 2)
+
+    def test_numericJumpTarget(self):
+        lines, _, _ = self.optimize("@6 D;JEQ @SP M=M+1 @SP A=M D=M @6 0;JMP")
+        self.assertEqual(lines, ["@5", "D;JEQ", "@SP", "M=M+1", "A=M", "D=M", "@5", "0;JMP"])
+
+    def test_computedJumpWithNumericAddresses(self):
+        # PongL keeps return addresses as plain numbers, returns by "A=M", "0;JMP"
+        with open(Path(__file__).parent.joinpath("pong", "PongL.asm")) as inFile:
+            source = inFile.read()
+        expected, _ = assembler.assemble(source)
+        with self.assertWarns(UserWarning):
+            words, _ = assembler.assemble(source, optimize = True)
+        self.assertEqual(words, expected)
+
+if __name__ == "__main__":
+    unittest.main()
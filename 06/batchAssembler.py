@@ -0,0 +1,112 @@
+"""
+Batch assembler for hack computer, assembles every .asm file found in given
+directories or glob patterns in a process pool and writes JSON summary
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import json
+from pathlib import Path
+import time
+
+from assembler import assembleFile
+
+
+def collectSources(patterns):
+    """
+    Expands directories (recursively) and glob patterns to sorted list of .asm files
+    """
+    sources = set()
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            sources.update(path.rglob("*.asm"))
+        elif path.is_file():
+            sources.add(path)
+        else:
+            sources.update(Path(match) for match in glob.glob(pattern, recursive = True)
+                           if match.endswith(".asm"))
+    return sorted(source.resolve() for source in sources)
+
+
+def assembleOne(task):
+    """
+    Assembles single file, runs in worker process. Errors are reported
+    in result instead of being raised, so one bad file does not stop the batch.
+    """
+    inFilePath, outFormat, writeSym, stream = task
+    outFile = inFilePath.parent.joinpath(inFilePath.stem + "." + outFormat)
+    symFile = inFilePath.parent.joinpath(inFilePath.stem + ".sym") if writeSym else None
+    result = {
+        "file": str(inFilePath),
+        "output": str(outFile),
+        "instructions": None,
+        "timeMs": None,
+        "error": None
+    }
+    tick = time.perf_counter()
+    try:
+        result["instructions"] = assembleFile(inFilePath, outFile, None, symFile, outFormat,
+                                              stream = stream)
+    except Exception as error:
+        result["output"] = None
+        result["error"] = "{}: {}".format(type(error).__name__, error)
+    result["timeMs"] = round((time.perf_counter() - tick) * 1000, 3)
+    return result
+
+
+def assembleBatch(sources, outFormat = "hack", writeSym = False, stream = False, jobs = None):
+    """
+    Assembles all sources in process pool, returns summary dict
+    """
+    tick = time.perf_counter()
+    tasks = [(source, outFormat, writeSym, stream) for source in sources]
+    if jobs == 1:
+        results = [assembleOne(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers = jobs) as executor:
+            results = list(executor.map(assembleOne, tasks))
+    failed = [result for result in results if result["error"] is not None]
+    summary = {
+        "files": len(results),
+        "failed": len(failed),
+        "instructions": sum(result["instructions"] or 0 for result in results),
+        "timeMs": round((time.perf_counter() - tick) * 1000, 3),
+        "results": results
+    }
+    return summary
+
+
+def main():
+    argumentParser = argparse.ArgumentParser(description = "Batch assembler for hack computer.")
+    argumentParser.add_argument("inputs", metavar = "input", type = str, nargs = "+",
+                                help = "directories, .asm files or glob patterns.")
+    argumentParser.add_argument("--jobs", type = int, default = None,
+                                help = "number of worker processes, default is number of cores")
+    argumentParser.add_argument("--summary", type = str, default = "assembler-summary.json",
+                                help = "location of JSON summary, - for stdout")
+    argumentParser.add_argument("--sym", action = "store_const", const = True,
+                                help = "write symbol map file for every input")
+    argumentParser.add_argument("--format", type = str, choices = ["hack", "bin"], default = "hack",
+                                help = "output format, hack text or packed little-endian 16 bit words")
+    argumentParser.add_argument("--stream", action = "store_const", const = True,
+                                help = "assemble every file in streaming mode")
+
+    args = vars(argumentParser.parse_args())
+    sources = collectSources(args["inputs"])
+    summary = assembleBatch(sources, args["format"], bool(args["sym"]), bool(args["stream"]),
+                            args["jobs"])
+
+    summaryText = json.dumps(summary, indent = 2)
+    if args["summary"] == "-":
+        print(summaryText)
+    else:
+        open(args["summary"], mode = "w").write(summaryText + "\n")
+        print("Assembled {} files ({} failed, {} instructions) in {} ms, summary written to {}".format(
+            summary["files"], summary["failed"], summary["instructions"], int(summary["timeMs"]),
+            args["summary"]))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
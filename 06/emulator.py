@@ -0,0 +1,680 @@
+"""
+Headless emulator for hack computer (Computer.hdl: CPU, ROM32K and Memory).
+Every possible 16 bit instruction is decoded once into table, so executing
+instruction is single lookup instead of parsing bits.
+"""
+from array import array
+import argparse
+from pathlib import Path
+import re
+import time
+
+import assembler
+from emulatorKeyboard import KeyboardScript, parseEvent
+from emulatorProfile import ExecutionProfiler, loadLabels, DEFAULT_SAMPLE_INTERVAL
+from emulatorSnapshot import Checkpointer, loadSnapshot, saveSnapshot
+import romFile
+
+ROM_SIZE = 1 << 15
+RAM_SIZE = 1 << 15
+WORD_MASK = 0xFFFF
+ADDRESS_MASK = 0x7FFF
+SCREEN_ADDRESS = 16384
+KBD_ADDRESS = 24576
+
+
+def toSigned(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def aluFunction(zx, nx, zy, ny, f, no):
+    """
+    Generic ALU, used for comp bits that have no mnemonic
+    """
+    def alu(x, y):
+        if zx: x = 0
+        if nx: x = ~x
+        if zy: y = 0
+        if ny: y = ~y
+        out = (x + y) if f else (x & y)
+        if no: out = ~out
+        return out & WORD_MASK
+    return alu
+
+
+# comp functions indexed by 6 c bits, called as comp(D, y) where y is
+# A or M, depending on a bit
+COMP_FUNCTIONS = [aluFunction(*[(c >> bit) & 1 for bit in range(5, -1, -1)]) for c in range(64)]
+COMP_FUNCTIONS[0b101010] = lambda x, y: 0
+COMP_FUNCTIONS[0b111111] = lambda x, y: 1
+COMP_FUNCTIONS[0b111010] = lambda x, y: WORD_MASK
+COMP_FUNCTIONS[0b001100] = lambda x, y: x
+COMP_FUNCTIONS[0b110000] = lambda x, y: y
+COMP_FUNCTIONS[0b001101] = lambda x, y: x ^ WORD_MASK
+COMP_FUNCTIONS[0b110001] = lambda x, y: y ^ WORD_MASK
+COMP_FUNCTIONS[0b001111] = lambda x, y: -x & WORD_MASK
+COMP_FUNCTIONS[0b110011] = lambda x, y: -y & WORD_MASK
+COMP_FUNCTIONS[0b011111] = lambda x, y: (x + 1) & WORD_MASK
+COMP_FUNCTIONS[0b110111] = lambda x, y: (y + 1) & WORD_MASK
+COMP_FUNCTIONS[0b001110] = lambda x, y: (x - 1) & WORD_MASK
+COMP_FUNCTIONS[0b110010] = lambda x, y: (y - 1) & WORD_MASK
+COMP_FUNCTIONS[0b000010] = lambda x, y: (x + y) & WORD_MASK
+COMP_FUNCTIONS[0b010011] = lambda x, y: (x - y) & WORD_MASK
+COMP_FUNCTIONS[0b000111] = lambda x, y: (y - x) & WORD_MASK
+COMP_FUNCTIONS[0b000000] = lambda x, y: x & y
+COMP_FUNCTIONS[0b010101] = lambda x, y: x | y
+
+# for every jump bits, table telling if jump is taken for given ALU output
+JUMP_TABLES = [None]
+for jumpBits in range(1, 8):
+    JUMP_TABLES.append(bytes(
+        1 if ((jumpBits & 4 and toSigned(out) < 0) or (jumpBits & 2 and out == 0)
+              or (jumpBits & 1 and toSigned(out) > 0)) else 0
+        for out in range(1 << 16)))
+
+# python expressions of comp functions, used by BlockCompiler. {x} is D
+# register, {y} is A register or M
+COMP_TEMPLATES = {
+    0b101010: "0",
+    0b111111: "1",
+    0b111010: "65535",
+    0b001100: "{x}",
+    0b110000: "{y}",
+    0b001101: "{x} ^ 65535",
+    0b110001: "{y} ^ 65535",
+    0b001111: "-{x} & 65535",
+    0b110011: "-{y} & 65535",
+    0b011111: "({x} + 1) & 65535",
+    0b110111: "({y} + 1) & 65535",
+    0b001110: "({x} - 1) & 65535",
+    0b110010: "({y} - 1) & 65535",
+    0b000010: "({x} + {y}) & 65535",
+    0b010011: "({x} - {y}) & 65535",
+    0b000111: "({y} - {x}) & 65535",
+    0b000000: "{x} & {y}",
+    0b010101: "{x} | {y}"
+}
+
+# python conditions on ALU output (kept unsigned) for every jump bits
+JUMP_CONDITIONS = [
+    None,
+    "0 < {out} < 32768",
+    "{out} == 0",
+    "{out} < 32768",
+    "{out} >= 32768",
+    "{out} != 0",
+    "{out} == 0 or {out} >= 32768",
+    "True"
+]
+
+# expressions BlockCompiler can use repeatedly without temporary variable
+ATOM = re.compile(r"\w+")
+# expressions which value changes with D register or RAM
+UNSTABLE = re.compile(r"\bD\b|ram\[|COMP\[")
+
+__decodeTable = None
+
+
+def isHaltLoop(rom, address):
+    """
+    True for "@address" at address followed by unconditional jump, loop
+    which hack programs use as their end. Both emulator paths halt on it.
+    """
+    instruction = lambda at: rom[at] if at < len(rom) else 0
+    return (0 <= address < ROM_SIZE - 1 and instruction(address) == address
+            and instruction(address + 1) & 0xE007 == 0xE007)
+
+
+def decodeInstruction(word):
+    """
+    A instruction decodes to its value (int), C instruction to tuple
+    (comp, usesM, destA, destD, destM, jumpTable)
+    """
+    if not word & 0x8000:
+        return word
+    return (COMP_FUNCTIONS[(word >> 6) & 0b111111], bool(word & 0x1000),
+            bool(word & 0b100000), bool(word & 0b10000), bool(word & 0b1000),
+            JUMP_TABLES[word & 0b111])
+
+
+def getDecodeTable():
+    """
+    Returns table of all 65536 decoded instructions, built on first use
+    """
+    global __decodeTable
+    if __decodeTable is None:
+        __decodeTable = [decodeInstruction(word) for word in range(1 << 16)]
+    return __decodeTable
+
+
+def loadProgram(path):
+    """
+    Loads ROM image from .hack, .bin or .asm file, returns array('H')
+    """
+    path = Path(path)
+    if path.suffix == ".asm":
+        words, _ = assembler.assemble(path.read_text())
+        return words
+    if path.suffix == ".bin":
+        with romFile.loadBinaryRom(path) as rom:
+            return rom.toArray()
+    return romFile.loadHackText(path)
+
+
+class Emulator:
+    """
+    Hack computer with 32K ROM and 32K RAM. Registers are kept as unsigned
+    16 bit values.
+    """
+    def __init__(self, rom = ()):
+        self.ram = array("H", bytes(2 * RAM_SIZE))
+        self.A = 0
+        self.D = 0
+        self.PC = 0
+        self.cycles = 0
+        self.halted = False
+        self.blockCompiler = None
+        self.loadRom(rom)
+
+    def loadRom(self, rom):
+        if len(rom) > ROM_SIZE:
+            raise ValueError("program has {} words, ROM holds only {}".format(len(rom), ROM_SIZE))
+        self.rom = array("H", rom)
+        decodeTable = getDecodeTable()
+        # empty ROM words hold 0, which is "@0"
+        self.program = [decodeTable[word] for word in self.rom] + [0] * (ROM_SIZE - len(self.rom))
+        self.blockCompiler = None
+        return None
+
+    def reset(self):
+        self.PC = 0
+        self.halted = False
+        return None
+
+    def __getitem__(self, address):
+        return self.ram[address]
+
+    def __setitem__(self, address, value):
+        self.ram[address] = value & WORD_MASK
+
+    def run(self, cycles, stopOnHalt = True):
+        """
+        Executes at most given number of instructions and returns number of
+        executed ones. With stopOnHalt, stops on "@n", "0;JMP" loop at address n.
+        """
+        program = self.program
+        rom = self.rom
+        ram = self.ram
+        haltTable = JUMP_TABLES[7] if stopOnHalt else None
+        A, D, pc = self.A, self.D, self.PC
+        executed = 0
+        halted = False
+        while executed < cycles and not halted:
+            try:
+                for executed in range(executed, cycles):
+                    entry = program[pc]
+                    if entry.__class__ is int:
+                        A = entry
+                        pc += 1
+                        continue
+                    comp, usesM, destA, destD, destM, jumpTable = entry
+                    address = A & ADDRESS_MASK
+                    out = comp(D, ram[address] if usesM else A)
+                    if destM:
+                        ram[address] = out
+                    if destA:
+                        A = out
+                    if destD:
+                        D = out
+                    if jumpTable is not None and jumpTable[out]:
+                        if address == pc - 1 and jumpTable is haltTable and isHaltLoop(rom, address):
+                            halted = True
+                        pc = address
+                        if halted:
+                            executed += 1
+                            break
+                    else:
+                        pc += 1
+                else:
+                    executed = cycles
+            except IndexError:
+                # program counter is 15 bits wide, it wraps to 0
+                pc = 0
+        # pc is past ROM when last instruction of ROM was executed last
+        self.A, self.D, self.PC = A, D, pc & ADDRESS_MASK
+        self.halted = halted
+        self.cycles += executed
+        return executed
+
+    def runCounting(self, cycles, hits, stopOnHalt = True):
+        """
+        Same as run, but hits[address] counts executions of address. Kept
+        apart from run, so that counting does not slow down its loop.
+        """
+        program = self.program
+        rom = self.rom
+        ram = self.ram
+        haltTable = JUMP_TABLES[7] if stopOnHalt else None
+        A, D, pc = self.A, self.D, self.PC
+        executed = 0
+        halted = False
+        while executed < cycles and not halted:
+            try:
+                for executed in range(executed, cycles):
+                    hits[pc] += 1
+                    entry = program[pc]
+                    if entry.__class__ is int:
+                        A = entry
+                        pc += 1
+                        continue
+                    comp, usesM, destA, destD, destM, jumpTable = entry
+                    address = A & ADDRESS_MASK
+                    out = comp(D, ram[address] if usesM else A)
+                    if destM:
+                        ram[address] = out
+                    if destA:
+                        A = out
+                    if destD:
+                        D = out
+                    if jumpTable is not None and jumpTable[out]:
+                        if address == pc - 1 and jumpTable is haltTable and isHaltLoop(rom, address):
+                            halted = True
+                        pc = address
+                        if halted:
+                            executed += 1
+                            break
+                    else:
+                        pc += 1
+                else:
+                    executed = cycles
+            except IndexError:
+                # program counter is 15 bits wide, it wraps to 0
+                pc = 0
+        # pc is past ROM when last instruction of ROM was executed last
+        self.A, self.D, self.PC = A, D, pc & ADDRESS_MASK
+        self.halted = halted
+        self.cycles += executed
+        return executed
+
+    def runCompiled(self, cycles, stopOnHalt = True):
+        """
+        Same as run, but executes blocks compiled by BlockCompiler. Block is
+        compiled when its start address gets hot and is cached by it, until
+        then code is interpreted up to its first jump.
+        """
+        if self.blockCompiler is None:
+            self.blockCompiler = BlockCompiler(self.rom)
+        blocks = self.blockCompiler.blocks
+        entries = self.blockCompiler.entries
+        compileBlock = self.blockCompiler.compileBlock
+        coldLength = self.blockCompiler.coldLength
+        threshold = self.blockCompiler.compileThreshold
+        ram = self.ram
+        A, D, pc = self.A, self.D, self.PC
+        executed = 0
+        interpreted = 0
+        halted = False
+        while True:
+            block = blocks[pc]
+            if block is None:
+                entries[pc] += 1
+                if entries[pc] < threshold:
+                    # cold code is interpreted up to its first jump
+                    length = coldLength(pc)
+                    if executed + length > cycles:
+                        break
+                    self.A, self.D, self.PC = A, D, pc
+                    count = self.run(length, stopOnHalt)
+                    A, D, pc = self.A, self.D, self.PC
+                    executed += count
+                    interpreted += count
+                    if self.halted:
+                        halted = True
+                        break
+                    continue
+                block = compileBlock(pc)
+            function, maxLength = block
+            if executed + maxLength > cycles:
+                break
+            A, D, pc, count = function(A, D, ram, cycles - executed)
+            if count < 0:
+                # block exited through "@n", "0;JMP" halt loop
+                executed -= count
+                if stopOnHalt:
+                    halted = True
+                    break
+            else:
+                executed += count
+        self.A, self.D, self.PC = A, D, pc & ADDRESS_MASK
+        self.halted = halted
+        # interpreted instructions are already counted by run
+        self.cycles += executed - interpreted
+        if not halted and executed < cycles:
+            # rest of the cycles does not fit in whole block
+            executed += self.run(cycles - executed, stopOnHalt)
+        return executed
+
+# End of class Emulator
+
+
+class BlockCompiler:
+    """
+    Compiles code reachable from entry address without computed jumps into
+    python function "block(A, D, ram, budget) -> (A, D, nextPC, executed)".
+    Unconditional jumps to known addresses are followed, conditional jumps
+    become early returns and jump back to entry address becomes loop, which
+    runs while budget allows. Value of A is tracked while compiling, so
+    "@SP", "M=M+1" becomes "ram[0] = (ram[0] + 1) & 65535", and values
+    stored to constant addresses are reused by later reads. Executed count
+    is negative when block exits through "@n", "0;JMP" halt loop.
+    """
+    MAX_BLOCK_LENGTH = 512
+    # entries of start address before its block is compiled, compiling
+    # costs as much as interpreting thousands of instructions
+    COMPILE_THRESHOLD = 16
+
+    def __init__(self, rom, compileThreshold = COMPILE_THRESHOLD):
+        self.rom = rom
+        self.compileThreshold = compileThreshold
+        # blocks by start address, (function, maxLength) tuples
+        self.blocks = [None] * ROM_SIZE
+        self.entries = array("I", bytes(4 * ROM_SIZE))
+        # instructions up to first jump by start address, 0 if not known yet
+        self.coldLengths = array("H", bytes(2 * ROM_SIZE))
+        self.namespace = {"COMP": COMP_FUNCTIONS}
+
+    def __instruction(self, address):
+        return self.rom[address] if address < len(self.rom) else 0
+
+    def coldLength(self, start):
+        """
+        Returns number of instructions from start to first jump instruction
+        including it, at most MAX_BLOCK_LENGTH
+        """
+        length = self.coldLengths[start]
+        if not length:
+            end = min(start + self.MAX_BLOCK_LENGTH, ROM_SIZE)
+            address = start
+            while address < end:
+                word = self.__instruction(address)
+                address += 1
+                if word & 0x8000 and word & 0b111:
+                    break
+            length = self.coldLengths[start] = address - start
+        return length
+
+    def generateSource(self, start):
+        """
+        Returns python source of block starting at given address and
+        greatest number of instructions it can execute in one iteration
+        """
+        lines = ["def block(A, D, ram, budget):", "    n = 0", "    while True:"]
+        emit = lambda line: lines.append("        " + line)
+        # value of A register, int if known while compiling, else python
+        # expression of it, which is assigned to A only when leaving block
+        aValue = "A"
+        # name of variable holding A & 32767, while A does not change
+        addressVariable = None
+        # values stored to constant RAM addresses, valid until store
+        # to computed address, which may alias them
+        knownCells = {}
+        temps = 0
+        pc = start
+        count = 0
+        maxLength = 0
+        inlined = {start}
+
+        def addressOf(value):
+            if isinstance(value, int):
+                return str(value & ADDRESS_MASK)
+            if value.endswith(") & 65535"):
+                # masking with 32767 makes masking with 65535 needless
+                return value[:-5] + "32767"
+            return ("{} & 32767" if ATOM.fullmatch(value) else "({}) & 32767").format(value)
+
+        def materializeA(indent = ""):
+            if aValue != "A":
+                emit("{}A = {}".format(indent, aValue))
+
+        def emitExit(target, halt = False):
+            total = "n + {}".format(count)
+            emit("return A, D, {}, {}".format(target, "-(" + total + ")" if halt else total))
+
+        while True:
+            word = self.__instruction(pc)
+            count += 1
+            if not word & 0x8000:
+                aValue = word
+                addressVariable = None
+                pc += 1
+            else:
+                c = (word >> 6) & 0b111111
+                usesM = bool(word & 0x1000)
+                destA, destD, destM = bool(word & 0b100000), bool(word & 0b10000), bool(word & 0b1000)
+                jumpBits = word & 0b111
+                if addressVariable is not None:
+                    address = addressVariable
+                else:
+                    address = addressOf(aValue)
+                    if not isinstance(aValue, int) and (jumpBits or (usesM and destM)):
+                        # address is used more than once or after A changes
+                        emit("a = " + address)
+                        address = addressVariable = "a"
+                template = COMP_TEMPLATES.get(c, "COMP[{}]({{x}}, {{y}})".format(c))
+                if not usesM and isinstance(aValue, int) and "{x}" not in template:
+                    # comp depends only on known A, fold it to constant
+                    expression = str(COMP_FUNCTIONS[c](0, aValue))
+                else:
+                    if usesM:
+                        y = knownCells.get(address, "ram[{}]".format(address))
+                    else:
+                        y = str(aValue) if isinstance(aValue, int) or ATOM.fullmatch(aValue) else "(" + aValue + ")"
+                    expression = template.format(x = "D", y = y)
+
+                reused = (jumpBits and jumpBits != 7) or destM + destD + destA > 1
+                if ((reused and not ATOM.fullmatch(expression))
+                        or (destA and UNSTABLE.search(expression))):
+                    # value is used more than once, or A would depend on
+                    # D or RAM, which change later
+                    name = "t{}".format(temps)
+                    temps += 1
+                    emit("{} = {}".format(name, expression))
+                    expression = name
+                if destM:
+                    emit("ram[{}] = {}".format(address, expression))
+                    if not address.isdigit():
+                        knownCells.clear()
+                    elif ATOM.fullmatch(expression) and not UNSTABLE.search(expression):
+                        knownCells[address] = expression
+                    else:
+                        knownCells.pop(address, None)
+                if destD and expression != "D":
+                    emit("D = " + expression)
+                if destA:
+                    aValue = int(expression) if expression.isdigit() else expression
+                    addressVariable = None
+
+                if jumpBits == 7:
+                    maxLength = max(maxLength, count)
+                    if address == "a":
+                        materializeA()
+                        if isHaltLoop(self.rom, pc - 1):
+                            # computed jump may land on halt loop
+                            emit("if a == {}:".format(pc - 1))
+                            emit("    return A, D, a, -(n + {})".format(count))
+                        emitExit("a")
+                        break
+                    target = int(address)
+                    halt = target == pc - 1 and isHaltLoop(self.rom, target)
+                    if not halt and target not in inlined and count < self.MAX_BLOCK_LENGTH:
+                        # follow jump, compiling continues at target
+                        inlined.add(target)
+                        pc = target
+                        continue
+                    materializeA()
+                    if halt:
+                        emitExit(target, halt = True)
+                    elif target == start:
+                        # loop back to entry, next iteration has to fit in budget
+                        emit("n += {}".format(count))
+                        emit("if n + {} > budget:".format(self.MAX_BLOCK_LENGTH))
+                        emit("    return A, D, {}, n".format(start))
+                    else:
+                        emitExit(target)
+                    break
+                if jumpBits:
+                    maxLength = max(maxLength, count)
+                    emit("if {}:".format(JUMP_CONDITIONS[jumpBits].format(out = expression)))
+                    materializeA("    ")
+                    emit("    return A, D, {}, n + {}".format(address, count))
+                pc += 1
+            if pc >= ROM_SIZE or count >= self.MAX_BLOCK_LENGTH:
+                maxLength = max(maxLength, count)
+                materializeA()
+                emitExit(pc % ROM_SIZE)
+                break
+        return "\n".join(lines) + "\n", maxLength
+
+    def compileBlock(self, start):
+        source, maxLength = self.generateSource(start)
+        code = compile(source, "<hack block {}>".format(start), "exec")
+        exec(code, self.namespace)
+        block = (self.namespace.pop("block"), maxLength)
+        self.blocks[start] = block
+        return block
+
+# End of class BlockCompiler
+
+
+def parseAddress(text):
+    """
+    Parses predefined symbol ("R0", "SCREEN") or number to address
+    """
+    predefinedSymbols = assembler.Preprocessor([]).symbolsDict
+    return predefinedSymbols[text] if text in predefinedSymbols else int(text)
+
+
+def parseAssignment(text):
+    """
+    Parses "R0=3" or "100=-1" to (address, value)
+    """
+    target, _, value = text.partition("=")
+    return parseAddress(target), int(value) & WORD_MASK
+
+
+def main():
+    argumentParser = argparse.ArgumentParser(description = "Emulator for hack computer.")
+    argumentParser.add_argument("inputFiles", metavar = "inFile", type = str, nargs = "*",
+                                help = "programs to run (.hack, .bin or .asm), default are sample programs")
+    argumentParser.add_argument("--cycles", type = int, default = 10_000_000,
+                                help = "maximum number of instructions to execute")
+    argumentParser.add_argument("--set", type = str, action = "append", default = [], metavar = "ADDRESS=VALUE",
+                                help = "set RAM before run, e.g. --set R0=3")
+    argumentParser.add_argument("--dump", type = str, default = "0-15", metavar = "FROM-TO",
+                                help = "range of RAM addresses printed after run")
+    argumentParser.add_argument("--jit", action = "store_const", const = True,
+                                help = "compile basic blocks to python functions before running them")
+    argumentParser.add_argument("--profile", action = "store_const", const = True,
+                                help = "count executed instructions per address and print hot spots")
+    argumentParser.add_argument("--sample", type = int, default = None, metavar = "INTERVAL",
+                                help = "like --profile, but only sample program counter every INTERVAL "
+                                       "instructions, e.g. --sample {}".format(DEFAULT_SAMPLE_INTERVAL))
+    argumentParser.add_argument("--labels", type = str, default = None,
+                                help = "assembly source with labels for profile, default is .asm input")
+    argumentParser.add_argument("--restore", type = str, default = None, metavar = "SNAPSHOT",
+                                help = "resume from snapshot or checkpoint file instead of reset")
+    argumentParser.add_argument("--save", type = str, default = None, metavar = "SNAPSHOT",
+                                help = "save snapshot of state after run")
+    argumentParser.add_argument("--checkpoint-dir", type = str, default = None,
+                                help = "save checkpoints to this directory while running")
+    argumentParser.add_argument("--checkpoint-interval", type = int, default = 1_000_000,
+                                help = "number of instructions between checkpoints")
+    argumentParser.add_argument("--keep-checkpoints", type = int, default = None,
+                                help = "number of newest checkpoints kept, default is all")
+    argumentParser.add_argument("--frames", type = str, default = None, metavar = "DIR",
+                                help = "record screen frames to this directory while running")
+    argumentParser.add_argument("--frame-interval", type = int, default = 100_000,
+                                help = "number of instructions between recorded frames")
+    argumentParser.add_argument("--frame-format", type = str, choices = ["pbm", "png"], default = "pbm",
+                                help = "format of recorded frames")
+    argumentParser.add_argument("--frame-skip", type = int, default = 0,
+                                help = "render only every (N + 1)-th frame")
+    argumentParser.add_argument("--screenshot", type = str, default = None, metavar = "FILE",
+                                help = "save screen after run as .pbm or .png")
+    argumentParser.add_argument("--keys", type = str, default = None, metavar = "FILE",
+                                help = "keyboard script, one \"cycle key\" event per line")
+    argumentParser.add_argument("--key", type = str, action = "append", default = [], metavar = "CYCLE=KEY",
+                                help = "press key at cycle, e.g. --key 0=LEFT --key 500000=0")
+
+    args = vars(argumentParser.parse_args())
+    scripted = args["keys"] or args["key"]
+    if scripted and (args["profile"] or args["sample"] or args["checkpoint_dir"]):
+        argumentParser.error("keyboard script can not be combined with --profile, --sample or --checkpoint-dir")
+    if args["keep_checkpoints"] is not None and args["keep_checkpoints"] < 1:
+        argumentParser.error("--keep-checkpoints has to be at least 1")
+    if args["profile"] and args["jit"]:
+        argumentParser.error("--profile counts every instruction and can not be combined with --jit, "
+                             "use --sample with --jit")
+    inputFiles = args["inputFiles"]
+    if not inputFiles:
+        root = Path(__file__).resolve().parent.parent
+        inputFiles = [root.joinpath("05", "Add.hack"), root.joinpath("05", "Max.hack"),
+                      root.joinpath("05", "Rect.hack"), root.joinpath("06", "pong", "Pong.asm")]
+    dumpFrom, _, dumpTo = args["dump"].partition("-")
+
+    for inputFile in inputFiles:
+        emulator = Emulator(loadProgram(inputFile))
+        for assignment in args["set"]:
+            address, value = parseAssignment(assignment)
+            emulator[address] = value
+        if args["restore"]:
+            loadSnapshot(emulator, args["restore"])
+        profiler = ExecutionProfiler(emulator) if args["profile"] or args["sample"] else None
+        keyboard = None
+        if scripted:
+            keyboard = KeyboardScript.fromFile(args["keys"]) if args["keys"] else KeyboardScript()
+            keyboard = KeyboardScript(keyboard.events + [parseEvent(event) for event in args["key"]])
+        tick = time.perf_counter()
+        if args["frames"]:
+            # screen rendering needs NumPy, so it is imported only when used
+            from emulatorScreen import recordFrames
+            executed, frames = recordFrames(emulator, args["cycles"], args["frame_interval"], args["frames"],
+                                            args["frame_format"], compiled = bool(args["jit"]),
+                                            keyboard = keyboard, frameSkip = args["frame_skip"])
+            print("{} frames written to {}".format(frames, args["frames"]))
+        elif args["checkpoint_dir"]:
+            checkpointer = Checkpointer(emulator, args["checkpoint_dir"], args["checkpoint_interval"],
+                                        args["keep_checkpoints"])
+            executed = checkpointer.run(args["cycles"], compiled = bool(args["jit"]))
+        elif args["sample"]:
+            executed = profiler.sample(args["cycles"], args["sample"], compiled = bool(args["jit"]))
+        elif profiler is not None:
+            executed = profiler.run(args["cycles"])
+        elif keyboard is not None:
+            executed = keyboard.run(emulator, args["cycles"], compiled = bool(args["jit"]))
+        elif args["jit"]:
+            executed = emulator.runCompiled(args["cycles"])
+        else:
+            executed = emulator.run(args["cycles"])
+        timeDelta = time.perf_counter() - tick
+        print("{}: {} instructions in {:.3f} s, {:,.0f} instructions/s{}".format(
+            inputFile, executed, timeDelta, executed / timeDelta if timeDelta else 0.0,
+            " (halted)" if emulator.halted else ""))
+        print("    A={} D={} PC={} RAM[{}..{}]={}".format(
+            emulator.A, emulator.D, emulator.PC, dumpFrom, dumpTo,
+            list(emulator.ram[int(dumpFrom):int(dumpTo or dumpFrom) + 1])))
+        if args["save"]:
+            saveSnapshot(emulator, args["save"])
+        if args["screenshot"]:
+            from emulatorScreen import ScreenRenderer
+            renderer = ScreenRenderer(emulator)
+            renderer.update()
+            renderer.saveFrame(args["screenshot"])
+        if profiler is not None:
+            labelsFile = args["labels"] or (inputFile if Path(inputFile).suffix == ".asm" else None)
+            print(profiler.toText(loadLabels(labelsFile) if labelsFile else None))
+    return None
+
+
+if __name__ == "__main__":
+    main()
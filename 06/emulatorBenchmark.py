@@ -0,0 +1,70 @@
+"""
+Benchmark for hack emulator, compares interpreter (Emulator.run) with
+compiled basic blocks (Emulator.runCompiled). Compiled mode is measured
+cold, with time spent compiling blocks, and warm, on blocks compiled by
+previous run
+"""
+import argparse
+from pathlib import Path
+import time
+
+from emulator import Emulator, loadProgram
+
+
+def measure(words, mode, cycles, repeat, warmUp = 0):
+    """
+    Returns best time of given number of runs and final (A, D, PC, RAM) of
+    last run. Every run starts from fresh emulator, which first executes
+    warmUp instructions outside of measured time
+    """
+    bestTime = None
+    state = None
+    for _ in range(repeat):
+        hack = Emulator(words)
+        run = getattr(hack, mode)
+        run(warmUp)
+        tick = time.perf_counter()
+        executed = run(cycles)
+        timeDelta = time.perf_counter() - tick
+        if executed != cycles:
+            raise ValueError("program halted after {} instructions".format(warmUp + executed))
+        if bestTime is None or timeDelta < bestTime:
+            bestTime = timeDelta
+        state = (hack.A, hack.D, hack.PC, hack.ram)
+    return bestTime, state
+
+
+def main():
+    argumentParser = argparse.ArgumentParser(description = "Benchmark for hack emulator.")
+    argumentParser.add_argument("inputFile", metavar = "inFile", type = str, nargs = "?",
+                                default = str(Path(__file__).parent.joinpath("pong", "Pong.asm")),
+                                help = "location of input file (.asm, .hack or .bin).")
+    argumentParser.add_argument("--cycles", type = int, default = 3_000_000,
+                                help = "number of measured instructions")
+    argumentParser.add_argument("--repeat", type = int, default = 3,
+                                help = "number of runs, best one is reported")
+
+    args = vars(argumentParser.parse_args())
+    inFilePath = Path(args["inputFile"])
+    words = loadProgram(inFilePath)
+    cycles = args["cycles"]
+
+    interpretedTime, interpretedState = measure(words, "run", cycles, args["repeat"])
+    coldTime, coldState = measure(words, "runCompiled", cycles, args["repeat"])
+    # blocks compiled by warm up run stay cached in emulator
+    warmTime, warmState = measure(words, "runCompiled", cycles, args["repeat"], warmUp = cycles)
+    referenceTime, referenceState = measure(words, "run", cycles, 1, warmUp = cycles)
+
+    if coldState != interpretedState or warmState != referenceState:
+        raise ValueError("Compiled blocks end in different state than interpreter")
+
+    print("File: {} ({} instructions)".format(inFilePath, len(words)))
+    print("Emulator.run:                {:>12,.0f} instructions/s".format(cycles / interpretedTime))
+    print("Emulator.runCompiled, cold:  {:>12,.0f} instructions/s".format(cycles / coldTime))
+    print("Emulator.runCompiled, warm:  {:>12,.0f} instructions/s".format(cycles / warmTime))
+    print("Speedup: {:.1f}x cold, {:.1f}x warm".format(interpretedTime / coldTime, interpretedTime / warmTime))
+    return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Scripted keyboard for hack emulator. Timeline of (cycle, key code) events
+is replayed by running emulator in slices between events and storing key
+code to KBD (24576), so interactive programs run headless at full speed.
+"""
+# address of KBD predefined symbol
+KBD_ADDRESS = 24576
+
+# key codes of hack keyboard for keys without printable character
+KEY_CODES = {
+    "NONE": 0,
+    "SPACE": 32,
+    "NEWLINE": 128,
+    "ENTER": 128,
+    "BACKSPACE": 129,
+    "LEFT": 130,
+    "UP": 131,
+    "RIGHT": 132,
+    "DOWN": 133,
+    "HOME": 134,
+    "END": 135,
+    "PAGEUP": 136,
+    "PAGEDOWN": 137,
+    "INSERT": 138,
+    "DELETE": 139,
+    "ESC": 140
+}
+KEY_CODES.update({"F{}".format(number): 140 + number for number in range(1, 13)})
+
+
+def parseKey(text):
+    """
+    Parses key name ("LEFT", "F1"), single character or number to key code
+    """
+    if text.upper() in KEY_CODES:
+        return KEY_CODES[text.upper()]
+    if len(text) == 1 and not text.isdigit():
+        return ord(text)
+    return int(text)
+
+
+def parseEvent(text):
+    """
+    Parses "CYCLE=KEY" or "CYCLE KEY" to (cycle, key code)
+    """
+    cycle, _, key = text.replace("=", " ", 1).partition(" ")
+    return int(cycle), parseKey(key.strip())
+
+
+class KeyboardScript:
+    """
+    Key pressed at event's cycle stays pressed until next event, key code
+    0 releases it. Cycles are counted by emulator.cycles, so script can be
+    replayed in several runs (e.g. one per recorded frame).
+    """
+    def __init__(self, events = ()):
+        # stable sort by cycle keeps given order of events on same cycle
+        self.events = sorted(events, key = lambda event: event[0])
+        self.nextEvent = 0
+
+    @classmethod
+    def fromFile(cls, inFilePath):
+        """
+        Reads script with one "cycle key" event per line, "//" starts comment
+        """
+        events = []
+        with open(inFilePath) as inFile:
+            for line in inFile:
+                line = line.partition("//")[0].strip()
+                if line:
+                    events.append(parseEvent(line))
+        return cls(events)
+
+    def run(self, emulator, cycles, stopOnHalt = True, compiled = False):
+        """
+        Runs emulator for at most given number of instructions, pressing
+        keys of events which fall into that time. Returns executed count.
+        """
+        run = emulator.runCompiled if compiled else emulator.run
+        events = self.events
+        executed = 0
+        while True:
+            # apply events which are due, in case of several on same cycle
+            # the last one wins
+            while self.nextEvent < len(events) and events[self.nextEvent][0] <= emulator.cycles:
+                emulator[KBD_ADDRESS] = events[self.nextEvent][1]
+                self.nextEvent += 1
+            remaining = cycles - executed
+            if self.nextEvent < len(events):
+                remaining = min(remaining, events[self.nextEvent][0] - emulator.cycles)
+            if remaining <= 0:
+                break
+            executed += run(remaining, stopOnHalt)
+            if emulator.halted:
+                break
+        return executed
+
+# End of class KeyboardScript
@@ -0,0 +1,129 @@
+"""
+Execution profiler for hack programs, counts executed instructions per ROM
+address and reports hot spots grouped by labels of assembly source
+"""
+from array import array
+import bisect
+import json
+
+from assembler import Preprocessor
+
+DEFAULT_SAMPLE_INTERVAL = 997
+
+
+def loadLabels(inFilePath):
+    """
+    Returns labels dict (label -> ROM address) of assembly source
+    """
+    with open(inFilePath) as inFile:
+        preprocessor = Preprocessor(inFile, keepLines = False)
+        preprocessor.process()
+    return preprocessor.labelsDict
+
+
+class ExecutionProfiler:
+    """
+    Hit counters of emulator's ROM addresses. Exact mode counts every
+    executed instruction. Sampling mode runs emulator in slices of interval
+    instructions and charges whole slice to address where it stopped, so
+    its cost does not depend on program length. Interval is prime by
+    default, so samples do not keep hitting the same spot of a loop.
+    """
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.hits = array("Q", bytes(8 * len(emulator.program)))
+        self.sampled = False
+
+    def run(self, cycles, stopOnHalt = True):
+        return self.emulator.runCounting(cycles, self.hits, stopOnHalt)
+
+    def sample(self, cycles, interval = DEFAULT_SAMPLE_INTERVAL, stopOnHalt = True, compiled = False):
+        # compiled blocks run only when they fit in the slice, so compiled
+        # sampling needs interval much longer than blocks
+        emulator = self.emulator
+        run = emulator.runCompiled if compiled else emulator.run
+        hits = self.hits
+        self.sampled = True
+        executed = 0
+        while executed < cycles:
+            count = run(min(interval, cycles - executed), stopOnHalt)
+            hits[emulator.PC] += count
+            executed += count
+            if emulator.halted:
+                break
+        return executed
+
+    def total(self):
+        return sum(self.hits)
+
+    def hotSpots(self, count = 10):
+        """
+        Returns list of (address, hits) of most executed addresses
+        """
+        used = [(address, hits) for address, hits in enumerate(self.hits) if hits]
+        return sorted(used, key = lambda item: item[1], reverse = True)[:count]
+
+    def __sortedLabels(self, labelsDict):
+        """
+        Returns (starts, labels) sorted by address, code before first label
+        belongs to "(start)"
+        """
+        labels = sorted((address, label) for label, address in labelsDict.items())
+        if not labels or labels[0][0] > 0:
+            labels.insert(0, (0, "(start)"))
+        return [address for address, _ in labels], [label for _, label in labels]
+
+    def byLabel(self, labelsDict):
+        """
+        Returns list of (label, address, hits) sorted by hits, every address
+        is charged to nearest preceding label
+        """
+        starts, labels = self.__sortedLabels(labelsDict)
+        totals = [0] * len(labels)
+        for address, hits in enumerate(self.hits):
+            if hits:
+                totals[bisect.bisect_right(starts, address) - 1] += hits
+        report = [(label, starts[index], totals[index]) for index, label in enumerate(labels)
+                  if totals[index]]
+        return sorted(report, key = lambda item: item[2], reverse = True)
+
+    def labelOf(self, address, labelsDict):
+        """
+        Returns address as "LABEL+offset" of nearest preceding label
+        """
+        starts, labels = self.__sortedLabels(labelsDict)
+        index = bisect.bisect_right(starts, address) - 1
+        offset = address - starts[index]
+        return labels[index] + ("+{}".format(offset) if offset else "")
+
+    def toDict(self, labelsDict = None, count = 10):
+        result = {
+            "mode": "sampled" if self.sampled else "exact",
+            "total": self.total(),
+            "hotSpots": [{"address": address, "hits": hits} for address, hits in self.hotSpots(count)]
+        }
+        if labelsDict is not None:
+            result["labels"] = [{"label": label, "address": address, "hits": hits}
+                                for label, address, hits in self.byLabel(labelsDict)[:count]]
+        return result
+
+    def toJson(self, labelsDict = None, count = 10):
+        return json.dumps(self.toDict(labelsDict, count), indent = 2)
+
+    def toText(self, labelsDict = None, count = 10):
+        total = self.total() or 1
+        lines = []
+        if labelsDict is not None:
+            lines.append("{:<40} {:>8} {:>14} {:>7}".format("label", "address", "cycles", "%"))
+            for label, address, hits in self.byLabel(labelsDict)[:count]:
+                lines.append("{:<40} {:>8} {:>14} {:>6.1f}%".format(label, address, hits, 100 * hits / total))
+            lines.append("")
+        lines.append("{:<40} {:>8} {:>14} {:>7}".format("hot spot", "address", "cycles", "%"))
+        for address, hits in self.hotSpots(count):
+            name = self.labelOf(address, labelsDict) if labelsDict is not None else ""
+            lines.append("{:<40} {:>8} {:>14} {:>6.1f}%".format(name, address, hits, 100 * hits / total))
+        lines.append("{:<40} {:>8} {:>14}".format("total" + (" (sampled)" if self.sampled else ""),
+                                                   "", self.total()))
+        return "\n".join(lines)
+
+# End of class ExecutionProfiler
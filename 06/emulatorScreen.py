@@ -0,0 +1,118 @@
+"""
+Screen of hack emulator rendered to PBM or PNG frames. Screen memory is
+8K words at SCREEN (16384), 256 rows of 32 words, lowest bit of word is
+leftmost pixel and 1 is black. Pixels are unpacked with NumPy, and only
+rows which changed since previous frame are rendered again.
+"""
+from pathlib import Path
+import struct
+import zlib
+
+import numpy as np
+
+from emulator import SCREEN_ADDRESS
+
+SCREEN_ROWS = 256
+SCREEN_COLUMNS = 512
+ROW_WORDS = SCREEN_COLUMNS // 16
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def pngChunk(chunkType, data):
+    return (struct.pack(">I", len(data)) + chunkType + data
+            + struct.pack(">I", zlib.crc32(chunkType + data)))
+
+
+class ScreenRenderer:
+    """
+    Keeps rendered frame of emulator's screen as packed 1 bit rows (PBM
+    layout, 64 bytes per row, most significant bit is leftmost pixel).
+    Screen is zero copy view of emulator's RAM, update compares it with
+    copy taken at previous update and re-renders only dirty rows.
+    """
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.screen = np.frombuffer(emulator.ram, dtype = np.uint16)[
+            SCREEN_ADDRESS:SCREEN_ADDRESS + SCREEN_ROWS * ROW_WORDS].reshape(SCREEN_ROWS, ROW_WORDS)
+        self.previous = np.zeros((SCREEN_ROWS, ROW_WORDS), dtype = np.uint16)
+        self.packed = np.zeros((SCREEN_ROWS, SCREEN_COLUMNS // 8), dtype = np.uint8)
+        self.renderedRows = 0
+
+    def update(self):
+        """
+        Renders rows changed since last update, returns their indices
+        """
+        dirtyRows = np.flatnonzero((self.screen != self.previous).any(axis = 1))
+        if len(dirtyRows):
+            rows = self.screen[dirtyRows]
+            self.previous[dirtyRows] = rows
+            # little-endian bytes of words, unpacked from lowest bit, give
+            # pixels from left to right
+            pixels = np.unpackbits(rows.astype("<u2").view(np.uint8), axis = 1, bitorder = "little")
+            self.packed[dirtyRows] = np.packbits(pixels, axis = 1)
+            self.renderedRows += len(dirtyRows)
+        return dirtyRows
+
+    def pixels(self):
+        """
+        Returns frame as (256, 512) array of 0 (white) and 1 (black)
+        """
+        return np.unpackbits(self.packed, axis = 1)
+
+    def toPbm(self):
+        return b"P4\n%d %d\n" % (SCREEN_COLUMNS, SCREEN_ROWS) + self.packed.tobytes()
+
+    def toPng(self):
+        # 1 bit grayscale PNG, where 0 is black, every row starts with
+        # filter type byte 0
+        rows = np.empty((SCREEN_ROWS, 1 + SCREEN_COLUMNS // 8), dtype = np.uint8)
+        rows[:, 0] = 0
+        rows[:, 1:] = ~self.packed
+        header = struct.pack(">IIBBBBB", SCREEN_COLUMNS, SCREEN_ROWS, 1, 0, 0, 0, 0)
+        return (PNG_SIGNATURE + pngChunk(b"IHDR", header)
+                + pngChunk(b"IDAT", zlib.compress(rows.tobytes(), 1)) + pngChunk(b"IEND", b""))
+
+    def saveFrame(self, outFile):
+        """
+        Writes current frame, format is chosen by suffix (.pbm or .png)
+        """
+        outFile = Path(outFile)
+        if outFile.suffix == ".png":
+            outFile.write_bytes(self.toPng())
+        elif outFile.suffix == ".pbm":
+            outFile.write_bytes(self.toPbm())
+        else:
+            raise ValueError("unknown frame format {}, use .pbm or .png".format(outFile.suffix))
+        return None
+
+# End of class ScreenRenderer
+
+
+def recordFrames(emulator, cycles, frameInterval, directory, frameFormat = "pbm", compiled = False,
+                 keyboard = None, frameSkip = 0):
+    """
+    Runs emulator and writes frame every frameInterval instructions to
+    directory, as frame-000000.<frameFormat>. With frameSkip, only every
+    (frameSkip + 1)-th frame is rendered and written. Keys are pressed by
+    keyboard (KeyboardScript) when given. Returns (executed, frames written).
+    """
+    directory = Path(directory)
+    directory.mkdir(parents = True, exist_ok = True)
+    renderer = ScreenRenderer(emulator)
+    if keyboard is not None:
+        run = lambda count: keyboard.run(emulator, count, compiled = compiled)
+    else:
+        run = emulator.runCompiled if compiled else emulator.run
+    executed = 0
+    frames = 0
+    written = 0
+    while executed < cycles:
+        executed += run(min(frameInterval, cycles - executed))
+        if frames % (frameSkip + 1) == 0 or emulator.halted:
+            renderer.update()
+            renderer.saveFrame(directory.joinpath("frame-{:06d}.{}".format(written, frameFormat)))
+            written += 1
+        frames += 1
+        if emulator.halted:
+            break
+    return executed, written
@@ -0,0 +1,157 @@
+"""
+Snapshots of hack emulator state. Snapshot is raw buffer of little-endian
+16 bit words, header with registers followed by whole RAM, written and
+read through memory mapped file, so saving and restoring is single copy
+of RAM.
+"""
+from array import array
+import mmap
+import os
+from pathlib import Path
+import sys
+import tempfile
+import zlib
+
+# header words:
+# 0-1 magic, 2 format version, 3 A, 4 D, 5 PC, 6 halted,
+# 8-11 cycles (64 bit), 12-13 CRC32 of ROM, rest is reserved
+SNAPSHOT_MAGIC = (0x4B48, 0x4E53)
+SNAPSHOT_VERSION = 1
+HEADER_WORDS = 16
+CHECKPOINT_PATTERN = "checkpoint-{:012d}.snap"
+
+
+def romChecksum(rom):
+    words = array("H", rom)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return zlib.crc32(memoryview(words))
+
+
+def splitWords(value, count):
+    return [(value >> (16 * index)) & 0xFFFF for index in range(count)]
+
+
+def joinWords(words):
+    return sum(word << (16 * index) for index, word in enumerate(words))
+
+
+def saveSnapshot(emulator, outFile):
+    """
+    Writes emulator state to outFile, file is replaced atomically
+    """
+    ram = emulator.ram
+    header = array("H", bytes(2 * HEADER_WORDS))
+    header[0:6] = array("H", [*SNAPSHOT_MAGIC, SNAPSHOT_VERSION, emulator.A, emulator.D, emulator.PC])
+    header[6] = int(emulator.halted)
+    header[8:12] = array("H", splitWords(emulator.cycles, 4))
+    header[12:14] = array("H", splitWords(romChecksum(emulator.rom), 2))
+    if sys.byteorder == "big":
+        header.byteswap()
+        ram = array("H", ram)
+        ram.byteswap()
+    outFile = Path(outFile)
+    headerSize = 2 * HEADER_WORDS
+    size = headerSize + 2 * len(ram)
+    fd, tempPath = tempfile.mkstemp(dir = outFile.parent, suffix = ".tmp")
+    try:
+        with os.fdopen(fd, mode = "r+b") as f:
+            f.truncate(size)
+            with mmap.mmap(f.fileno(), size) as buffer:
+                buffer[:headerSize] = memoryview(header).cast("B")
+                buffer[headerSize:] = memoryview(ram).cast("B")
+        os.replace(tempPath, outFile)
+    except BaseException:
+        os.unlink(tempPath)
+        raise
+    return None
+
+
+def loadSnapshot(emulator, inFile, checkRom = True):
+    """
+    Restores emulator state from inFile. RAM is copied in place, so
+    references to emulator.ram stay valid.
+    """
+    headerSize = 2 * HEADER_WORDS
+    with open(inFile, mode = "rb") as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as buffer:
+        if len(buffer) != headerSize + 2 * len(emulator.ram):
+            raise ValueError("{} is not a valid snapshot, size is {} bytes".format(inFile, len(buffer)))
+        header = array("H", buffer[:headerSize])
+        if sys.byteorder == "big":
+            header.byteswap()
+        if tuple(header[0:2]) != SNAPSHOT_MAGIC or header[2] != SNAPSHOT_VERSION:
+            raise ValueError("{} is not a valid snapshot".format(inFile))
+        if checkRom and joinWords(header[12:14]) != romChecksum(emulator.rom):
+            raise ValueError("{} was saved with different ROM".format(inFile))
+        memoryview(emulator.ram).cast("B")[:] = buffer[headerSize:]
+    if sys.byteorder == "big":
+        emulator.ram.byteswap()
+    emulator.A, emulator.D, emulator.PC = header[3], header[4], header[5]
+    emulator.halted = bool(header[6])
+    emulator.cycles = joinWords(header[8:12])
+    return None
+
+
+class Checkpointer:
+    """
+    Runs emulator and saves checkpoint every interval instructions to
+    directory, as checkpoint-<cycles>.snap. When keep is given, only that
+    many newest checkpoints are kept, it has to be at least 1.
+    """
+    def __init__(self, emulator, directory, interval, keep = None):
+        if keep is not None and keep < 1:
+            raise ValueError("keep has to be at least 1, got {}".format(keep))
+        self.emulator = emulator
+        self.directory = Path(directory)
+        self.directory.mkdir(parents = True, exist_ok = True)
+        self.interval = interval
+        self.keep = keep
+
+    def checkpoints(self):
+        """
+        Returns list of (cycles, path) sorted by cycles
+        """
+        checkpoints = []
+        for path in self.directory.glob("checkpoint-*.snap"):
+            try:
+                checkpoints.append((int(path.stem.partition("-")[2]), path))
+            except ValueError:
+                continue
+        return sorted(checkpoints)
+
+    def save(self):
+        path = self.directory.joinpath(CHECKPOINT_PATTERN.format(self.emulator.cycles))
+        saveSnapshot(self.emulator, path)
+        if self.keep is not None:
+            for _, oldPath in self.checkpoints()[:-self.keep]:
+                oldPath.unlink()
+        return path
+
+    def run(self, cycles, stopOnHalt = True, compiled = False):
+        emulator = self.emulator
+        run = emulator.runCompiled if compiled else emulator.run
+        executed = 0
+        while executed < cycles:
+            # checkpoints are taken at multiples of interval
+            sliceCycles = min(self.interval - emulator.cycles % self.interval, cycles - executed)
+            executed += run(sliceCycles, stopOnHalt)
+            if emulator.halted:
+                break
+            if emulator.cycles % self.interval == 0:
+                self.save()
+        return executed
+
+    def restore(self, cycles = None):
+        """
+        Restores newest checkpoint taken at or before cycles (newest of all
+        when cycles is None), returns its cycles
+        """
+        candidates = [(checkpointCycles, path) for checkpointCycles, path in self.checkpoints()
+                      if cycles is None or checkpointCycles <= cycles]
+        if not candidates:
+            raise ValueError("no checkpoint in {}".format(self.directory))
+        checkpointCycles, path = candidates[-1]
+        loadSnapshot(self.emulator, path)
+        return checkpointCycles
+
+# End of class Checkpointer
@@ -0,0 +1,385 @@
+from pathlib import Path
+import random
+import tempfile
+import unittest
+import zlib
+
+from assembler import assemble
+from emulator import BlockCompiler, Emulator, COMP_FUNCTIONS, aluFunction, toSigned
+from emulatorKeyboard import KeyboardScript, parseEvent
+from emulatorProfile import ExecutionProfiler, loadLabels
+from emulatorSnapshot import Checkpointer, loadSnapshot, saveSnapshot
+from hdlSimulator import HdlSimulator, loadNetlist, netlistKey
+from testScriptRunner import OutputColumn, runScript
+try:
+    import lockstepEmulator
+    import emulatorScreen
+except ImportError:
+    # lockstep emulator and screen rendering need NumPy
+    lockstepEmulator = emulatorScreen = None
+
+# fixtures are found relative to this file, so tests run from any directory
+DIRECTORY = Path(__file__).resolve().parent
+
+
+def readSource(relativePath):
+    with open(DIRECTORY.joinpath(relativePath)) as inFile:
+        return inFile.read()
+
+
+def compiledEmulator(words, compileThreshold = 1):
+    # by default every block is compiled on its first entry
+    hack = Emulator(words)
+    hack.blockCompiler = BlockCompiler(hack.rom, compileThreshold)
+    return hack
+
+
+class EmulatorTest(unittest.TestCase):
+
+    def test_compFunctionsMatchAlu(self):
+        values = [0, 1, 2, 0x7FFF, 0x8000, 0xFFFF] + [random.randrange(1 << 16) for _ in range(20)]
+        for c in range(64):
+            alu = aluFunction(*[(c >> bit) & 1 for bit in range(5, -1, -1)])
+            for x in values:
+                for y in values:
+                    self.assertEqual(COMP_FUNCTIONS[c](x, y), alu(x, y), msg = "comp {:06b}".format(c))
+
+    def test_max(self):
+        words, _ = assemble(readSource("max/Max.asm"))
+        for first, second in [(3, 5), (23456, 12345), (-3, -7)]:
+            hack = Emulator(words)
+            hack[0] = first
+            hack[1] = second
+            hack.run(1000)
+            self.assertTrue(hack.halted)
+            self.assertEqual(toSigned(hack[2]), max(first, second))
+
+    def test_rect(self):
+        words, _ = assemble(readSource("rect/Rect.asm"))
+        hack = Emulator(words)
+        hack[0] = 4
+        hack.run(1000)
+        self.assertEqual([hack[16384 + 32 * row] for row in range(5)], [0xFFFF] * 4 + [0])
+
+    def test_jumpUsesOldA(self):
+        words, _ = assemble("@4\nA=0;JMP\n@5\n0;JMP\n@4\n0;JMP\n")
+        hack = Emulator(words)
+        hack.run(2)
+        self.assertEqual(hack.PC, 4)
+        self.assertEqual(hack.A, 0)
+
+    def test_programCounterWraps(self):
+        hack = Emulator([])
+        self.assertEqual(hack.run(40000), 40000)
+        self.assertEqual(hack.PC, 40000 - (1 << 15))
+
+    def test_programCounterAtEndOfRom(self):
+        hack = Emulator([1, 2, 3])
+        self.assertEqual(hack.run(1 << 15), 1 << 15)
+        self.assertEqual(hack.PC, 0)
+        self.assertEqual(hack.runCompiled(10), 10)
+        self.assertEqual(hack.PC, 10)
+
+    def test_haltNeedsALoad(self):
+        # A holds address of previous instruction, but it is not "@1"
+        words, _ = assemble("A=1\nA=1\n0;JMP\n")
+        hack = Emulator(words)
+        self.assertEqual(hack.run(10), 10)
+        self.assertFalse(hack.halted)
+
+    def test_compiledMatchesInterpreter(self):
+        words, _ = assemble(readSource("pong/Pong.asm"))
+        for compileThreshold in [1, BlockCompiler.COMPILE_THRESHOLD]:
+            interpreted = Emulator(words)
+            compiled = compiledEmulator(words, compileThreshold)
+            for cycles in [1, 1000, 200000]:
+                self.assertEqual(interpreted.run(cycles), compiled.runCompiled(cycles))
+                self.assertEqual((interpreted.A, interpreted.D, interpreted.PC, interpreted.cycles),
+                                 (compiled.A, compiled.D, compiled.PC, compiled.cycles))
+                self.assertEqual(interpreted.ram, compiled.ram)
+
+    def test_compiledHalts(self):
+        words, _ = assemble(readSource("max/Max.asm"))
+        interpreted = Emulator(words)
+        compiled = compiledEmulator(words)
+        for hack in (interpreted, compiled):
+            hack[0] = 3
+            hack[1] = 5
+        executed = interpreted.run(1000)
+        self.assertEqual(compiled.runCompiled(1000), executed)
+        self.assertTrue(compiled.halted)
+        self.assertEqual((compiled.PC, compiled[2]), (interpreted.PC, 5))
+
+    def test_compiledHaltsOnComputedJump(self):
+        # "A=D;JMP" jumps to 5 with A = 4, which is "@4", "0;JMP" halt loop
+        words, _ = assemble("@4\nD=A\n@5\nA=D;JMP\n@4\n0;JMP\n")
+        interpreted = Emulator(words)
+        compiled = compiledEmulator(words)
+        self.assertEqual(interpreted.run(100), 5)
+        self.assertEqual(compiled.runCompiled(100), 5)
+        self.assertTrue(compiled.halted)
+
+    def test_compiledMatchesInterpreterOnRandomPrograms(self):
+        for seed in range(300):
+            generator = random.Random(seed)
+            words = []
+            for address in range(32):
+                kind = generator.random()
+                if kind < 0.2:
+                    # halt loop candidate
+                    words.append(address)
+                elif kind < 0.45:
+                    words.append(generator.randrange(32))
+                elif kind < 0.6:
+                    # unconditional jump with random comp and dest
+                    words.append(0xE007 | generator.randrange(1 << 10) << 3)
+                else:
+                    words.append(0xE000 | generator.randrange(1 << 13))
+            for compileThreshold in [1, BlockCompiler.COMPILE_THRESHOLD]:
+                interpreted = Emulator(words)
+                compiled = compiledEmulator(words, compileThreshold)
+                message = "seed {}, threshold {}".format(seed, compileThreshold)
+                self.assertEqual(interpreted.run(2000), compiled.runCompiled(2000), msg = message)
+                self.assertEqual((interpreted.A, interpreted.D, interpreted.PC, interpreted.halted,
+                                  interpreted.cycles),
+                                 (compiled.A, compiled.D, compiled.PC, compiled.halted, compiled.cycles),
+                                 msg = message)
+                self.assertEqual(interpreted.ram, compiled.ram, msg = message)
+
+    def test_profileByLabel(self):
+        words, _ = assemble(readSource("max/Max.asm"))
+        hack = Emulator(words)
+        hack[0] = 3
+        hack[1] = 5
+        profiler = ExecutionProfiler(hack)
+        executed = profiler.run(1000)
+        self.assertEqual(profiler.total(), executed)
+        self.assertEqual(profiler.hits[0], 1)
+        self.assertEqual(profiler.hits[10], 0)
+        byLabel = {label: hits for label, _, hits in profiler.byLabel(loadLabels(DIRECTORY.joinpath("max/Max.asm")))}
+        self.assertEqual(byLabel, {"(start)": 10, "OUTPUT_D": 2, "INFINITE_LOOP": 2})
+        self.assertEqual(profiler.labelOf(13, loadLabels(DIRECTORY.joinpath("max/Max.asm"))), "OUTPUT_D+1")
+
+    def test_profileMatchesRun(self):
+        words, _ = assemble(readSource("pong/Pong.asm"))
+        reference = Emulator(words)
+        reference.run(100000)
+        hack = Emulator(words)
+        profiler = ExecutionProfiler(hack)
+        self.assertEqual(profiler.run(100000), 100000)
+        self.assertEqual(profiler.total(), 100000)
+        self.assertEqual((hack.A, hack.D, hack.PC), (reference.A, reference.D, reference.PC))
+        self.assertEqual(hack.ram, reference.ram)
+
+    def test_profileSampling(self):
+        words, _ = assemble(readSource("pong/Pong.asm"))
+        profiler = ExecutionProfiler(Emulator(words))
+        self.assertEqual(profiler.sample(100000, interval = 997), 100000)
+        self.assertEqual(profiler.total(), 100000)
+        self.assertTrue(profiler.sampled)
+
+    def test_snapshotRoundTrip(self):
+        words, _ = assemble(readSource("pong/Pong.asm"))
+        hack = Emulator(words)
+        hack.run(50000)
+        restored = Emulator(words)
+        with tempfile.TemporaryDirectory() as directory:
+            saveSnapshot(hack, directory + "/pong.snap")
+            loadSnapshot(restored, directory + "/pong.snap")
+            with self.assertRaises(ValueError):
+                loadSnapshot(Emulator(words[:-1]), directory + "/pong.snap")
+        self.assertEqual((restored.A, restored.D, restored.PC, restored.cycles),
+                         (hack.A, hack.D, hack.PC, 50000))
+        self.assertEqual(restored.ram, hack.ram)
+
+    def test_resumeFromCheckpoint(self):
+        words, _ = assemble(readSource("pong/Pong.asm"))
+        reference = Emulator(words)
+        reference.run(100000)
+        with tempfile.TemporaryDirectory() as directory:
+            checkpointer = Checkpointer(Emulator(words), directory, 30000, keep = 2)
+            self.assertEqual(checkpointer.run(100000), 100000)
+            self.assertEqual([cycles for cycles, _ in checkpointer.checkpoints()], [60000, 90000])
+            resumed = Emulator(words)
+            self.assertEqual(Checkpointer(resumed, directory, 30000).restore(70000), 60000)
+        resumed.run(40000)
+        self.assertEqual((resumed.A, resumed.D, resumed.PC, resumed.cycles),
+                         (reference.A, reference.D, reference.PC, reference.cycles))
+        self.assertEqual(resumed.ram, reference.ram)
+
+    def test_checkpointKeepAtLeastOne(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ValueError):
+                Checkpointer(Emulator([]), directory, 100, keep = 0)
+            checkpointer = Checkpointer(Emulator([]), directory, 100, keep = 1)
+            checkpointer.run(250)
+            self.assertEqual([cycles for cycles, _ in checkpointer.checkpoints()], [200])
+
+    def test_parseKeyEvent(self):
+        self.assertEqual(parseEvent("100=LEFT"), (100, 130))
+        self.assertEqual(parseEvent("7 a"), (7, 97))
+        self.assertEqual(parseEvent("0=0"), (0, 0))
+        self.assertEqual(parseEvent("5=F12"), (5, 152))
+
+    def test_keyboardScript(self):
+        words, _ = assemble("(LOOP)\n@KBD\nD=M\n@R0\nM=D\n@LOOP\n0;JMP\n")
+        hack = Emulator(words)
+        keyboard = KeyboardScript([(600, 0), (100, 65)])
+        self.assertEqual(keyboard.run(hack, 300), 300)
+        self.assertEqual(hack[0], 65)
+        self.assertEqual(keyboard.run(hack, 400), 400)
+        self.assertEqual((hack[0], hack.cycles), (0, 700))
+
+    def test_keyboardSameCycleLastWins(self):
+        words, _ = assemble("(LOOP)\n@KBD\nD=M\n@R0\nM=D\n@LOOP\n0;JMP\n")
+        hack = Emulator(words)
+        # release given after key press on same cycle, e.g. --key 100=0
+        keyboard = KeyboardScript([(100, 65), (100, 0)])
+        keyboard.run(hack, 200)
+        self.assertEqual(hack[0], 0)
+
+    def test_keyboardFill(self):
+        words, _ = assemble(readSource("../04/fill/Fill.asm"))
+        hack = Emulator(words)
+        keyboard = KeyboardScript([(0, 65), (400000, 0)])
+        keyboard.run(hack, 300000, compiled = True)
+        # Fill never writes first screen word
+        self.assertEqual(set(hack.ram[16385:24576]), {0xFFFF})
+        keyboard.run(hack, 300000, compiled = True)
+        self.assertEqual(set(hack.ram[16384:24576]), {0})
+
+    @unittest.skipIf(emulatorScreen is None, "NumPy is not installed")
+    def test_screenDirtyRows(self):
+        words, _ = assemble(readSource("rect/Rect.asm"))
+        hack = Emulator(words)
+        renderer = emulatorScreen.ScreenRenderer(hack)
+        self.assertEqual(list(renderer.update()), [])
+        hack[0] = 3
+        hack.run(1000)
+        hack[16384 + 32 * 100 + 31] = 0x8001
+        self.assertEqual(list(renderer.update()), [0, 1, 2, 100])
+        self.assertEqual(list(renderer.update()), [])
+        pixels = renderer.pixels()
+        self.assertEqual(pixels[:3, :16].sum(), 48)
+        self.assertEqual(pixels[:3, 16:].sum(), 0)
+        self.assertEqual(list(pixels[100].nonzero()[0]), [496, 511])
+        self.assertEqual(renderer.toPbm()[:14], b"P4\n512 256\n\xff\xff\x00")
+
+    @unittest.skipIf(emulatorScreen is None, "NumPy is not installed")
+    def test_screenPng(self):
+        hack = Emulator([])
+        hack[16384] = 1
+        renderer = emulatorScreen.ScreenRenderer(hack)
+        renderer.update()
+        png = renderer.toPng()
+        self.assertEqual(png[:8], b"\x89PNG\r\n\x1a\n")
+        idatLength = int.from_bytes(png[33:37], "big")
+        rows = zlib.decompress(png[41:41 + idatLength])
+        self.assertEqual(len(rows), 256 * 65)
+        # filter byte, then leftmost pixel black (0) and rest white
+        self.assertEqual(rows[:3], b"\x00\x7f\xff")
+
+    @unittest.skipIf(lockstepEmulator is None, "NumPy is not installed")
+    def test_lockstepMatchesSeparateRuns(self):
+        words, _ = assemble(readSource("../trening/division.asm"))
+        pairs = [(dividend, divisor) for dividend in range(0, 40, 3) for divisor in range(0, 12)]
+        inputs = {0: [pair[0] for pair in pairs], 1: [pair[1] for pair in pairs]}
+        # division by zero never halts, so lanes also run out of cycles
+        results, halted, executed = lockstepEmulator.runBatch(words, inputs, [2, 3], 3000, lanes = 50)
+        expected = lockstepEmulator.runSeparately(words, inputs, [2, 3], 3000)
+        self.assertEqual(list(results[2]), list(expected[0][2]))
+        self.assertEqual(list(results[3]), list(expected[0][3]))
+        self.assertEqual(list(halted), list(expected[1]))
+        self.assertEqual(list(executed), list(expected[2]))
+        self.assertFalse(halted.all())
+
+    @unittest.skipIf(lockstepEmulator is None, "NumPy is not installed")
+    def test_lockstepMult(self):
+        words, _ = assemble(readSource("../04/mult/mult.asm"))
+        hack = lockstepEmulator.LockstepEmulator(words, 4)
+        hack[0] = [3, 0, 7, 100]
+        hack[1] = [5, 9, 0, 100]
+        hack.run(10000)
+        self.assertTrue(hack.halted.all())
+        self.assertEqual(list(hack[2]), [15, 0, 0, 10000])
+
+    @unittest.skipIf(lockstepEmulator is None, "NumPy is not installed")
+    def test_lockstepHaltNeedsALoad(self):
+        words, _ = assemble("A=1\nA=1\n0;JMP\n@3\n0;JMP\n")
+        hack = lockstepEmulator.LockstepEmulator(words, 2)
+        hack.run(10)
+        self.assertFalse(hack.halted.any())
+        self.assertEqual(list(hack.cycles), [10, 10])
+
+class TestScriptRunnerTest(unittest.TestCase):
+
+    def test_outputColumn(self):
+        column = OutputColumn("RAM[0]%D2.6.2")
+        self.assertEqual(column.header(), "  RAM[0]  ")
+        self.assertEqual(column.cell(0xFFFF), "      -1  ")
+        self.assertEqual(OutputColumn("DRegister[]%D1.6.1").header(), "DRegiste")
+        self.assertEqual(OutputColumn("address%B1.15.1").cell(0x2000), " 010000000000000 ")
+        self.assertEqual(OutputColumn("time%S1.4.1").cell("3+"), " 3+   ")
+
+    def test_courseScripts(self):
+        for script in ["../04/mult/Mult.tst", "../05/CPU.tst", "../05/ComputerMax.tst", "../03/a/PC.tst",
+                       "../demo/Xor.tst"]:
+            result = runScript((DIRECTORY.joinpath(script), False, None))
+            self.assertEqual(result["status"], "passed", msg = result["message"])
+
+    def test_scriptComparison(self):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            directory.joinpath("Double.asm").write_text("@R0\nD=M\nD=D+M\n@R1\nM=D\n")
+            directory.joinpath("Double.tst").write_text(
+                "load Double.asm, compare-to Double.cmp, output-list RAM[1]%D1.6.1 PC%D1.2.1;\n"
+                "set RAM[0] 21, repeat 5 { ticktock; } output;\n")
+            directory.joinpath("Double.cmp").write_text("| RAM[1] | PC |\n|     42 | ** |\n")
+            self.assertEqual(runScript((directory.joinpath("Double.tst"), False, None))["status"], "passed")
+            directory.joinpath("Double.cmp").write_text("| RAM[1] | PC |\n|     43 |  5 |\n")
+            result = runScript((directory.joinpath("Double.tst"), False, None))
+            self.assertEqual(result["status"], "failed")
+            self.assertIn("line 2", result["message"])
+
+class HdlSimulatorTest(unittest.TestCase):
+
+    def test_hdlXor(self):
+        hack = HdlSimulator(loadNetlist(DIRECTORY.joinpath("../demo/Xor.hdl")))
+        for a in (0, 1):
+            for b in (0, 1):
+                hack.set("a", a)
+                hack.set("b", b)
+                hack.evaluate()
+                self.assertEqual(hack.get("out"), a ^ b)
+
+    def test_hdlRegisterClock(self):
+        hack = HdlSimulator(loadNetlist(DIRECTORY.joinpath("../03/a/Register.hdl")))
+        hack.set("in", 1234)
+        hack.set("load", 1)
+        hack.tick()
+        self.assertEqual(hack.get("out"), 0)
+        hack.tock()
+        self.assertEqual(hack.get("out"), 1234)
+        hack.set("in", 99)
+        hack.set("load", 0)
+        hack.tick()
+        hack.tock()
+        self.assertEqual(hack.get("out"), 1234)
+
+    def test_hdlNetlistCache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            chip = directory.joinpath("Xor.hdl")
+            chip.write_text(DIRECTORY.joinpath("../demo/Xor.hdl").read_text())
+            netlist = loadNetlist(chip, directory.joinpath("cache"))
+            key = netlistKey(chip)
+            self.assertTrue(directory.joinpath("cache", key + ".json").exists())
+            self.assertEqual(loadNetlist(chip, directory.joinpath("cache")), netlist)
+            # part with HDL file next to chip replaces built-in one
+            directory.joinpath("Not.hdl").write_text(
+                "CHIP Not { IN in; OUT out; PARTS: Nand(a = in, b = in, out = out); }")
+            self.assertNotEqual(netlistKey(chip), key)
+            self.assertIn("Nand", [node[0] for node in loadNetlist(chip, directory.joinpath("cache"))["nodes"]])
+
+if __name__ == "__main__":
+    unittest.main()
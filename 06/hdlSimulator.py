@@ -0,0 +1,764 @@
+"""
+HDL simulator for hack chips. Chip hierarchy is flattened once into
+levelized netlist of built-in parts, so every evaluation is single flat
+loop over nodes in topological order. Parts without HDL file in chip's
+directory are built-in chips, like in the course's hardware simulator.
+Netlists can be cached on disk, keyed by hashes of HDL files.
+"""
+from array import array
+import argparse
+from functools import partial
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+import time
+
+from emulator import COMP_FUNCTIONS, WORD_MASK
+
+# bump when netlist format or flattening changes, invalidates cached netlists
+NETLIST_VERSION = "1"
+HDL_TOKEN = re.compile(r"//[^\n]*|/\*.*?\*/|\.\.|\w+|\S", re.DOTALL)
+PIN = re.compile(r"(\w+)(?:\[(\d+)\])?")
+VARIABLE = re.compile(r"(\w+)(?:\[(\d*)\])?")
+
+
+def parsePins(text):
+    """
+    Parses "a[16] b sel[2]" to [("a", 16), ("b", 1), ("sel", 2)]
+    """
+    pins = []
+    for pin in text.split():
+        name, width = PIN.fullmatch(pin).groups()
+        pins.append((name, int(width) if width else 1))
+    return pins
+
+
+class BuiltinChip:
+    """
+    Chip implemented in Python. Combinational chip has function of input
+    values returning tuple of output values, chip with state has model
+    (RegisterModel, ProgramCounterModel, MemoryModel, KeyboardModel).
+    """
+    def __init__(self, name, inputs, outputs, function = None, model = None):
+        self.name = name
+        self.inputs = parsePins(inputs)
+        self.outputs = parsePins(outputs)
+        self.function = function
+        self.model = model
+
+# End of class BuiltinChip
+
+
+class RegisterModel:
+    """
+    DFF, Bit and 16 bit registers. Value is stored on tick and appears on
+    out after tock, reading chip (e.g. "DRegister[]") gives stored value.
+    """
+    readPins = ()
+
+    def __init__(self, clockPins):
+        self.clockPins = clockPins
+
+    def newState(self):
+        # [stored, out]
+        return [0, 0]
+
+    def read(self, state):
+        return (state[1],)
+
+    def tick(self, state, value, load = 1):
+        if load:
+            state[0] = value
+        return None
+
+    def tock(self, state):
+        state[1] = state[0]
+        return None
+
+    def get(self, state, index):
+        return state[0]
+
+    def set(self, state, index, value):
+        state[0] = state[1] = value
+        return None
+
+# End of class RegisterModel
+
+
+class ProgramCounterModel(RegisterModel):
+    def __init__(self):
+        super().__init__(("in", "load", "inc", "reset"))
+
+    def tick(self, state, value, load, inc, reset):
+        if reset:
+            state[0] = 0
+        elif load:
+            state[0] = value
+        elif inc:
+            state[0] = (state[1] + 1) & WORD_MASK
+        else:
+            state[0] = state[1]
+        return None
+
+# End of class ProgramCounterModel
+
+
+class MemoryModel:
+    """
+    RAM chips, Screen and ROM32K (which has no clock pins). Out is read
+    combinationally at address, write of tick is applied on tock.
+    """
+    readPins = ("address",)
+
+    def __init__(self, size, clockPins = ("in", "load", "address")):
+        self.size = size
+        self.clockPins = clockPins
+
+    def newState(self):
+        # [words, pending write (address, value) or None]
+        return [array("H", bytes(2 * self.size)), None]
+
+    def read(self, state, address):
+        return (state[0][address],)
+
+    def tick(self, state, value, load, address):
+        state[1] = (address, value) if load else None
+        return None
+
+    def tock(self, state):
+        if state[1] is not None:
+            address, value = state[1]
+            state[0][address] = value
+            state[1] = None
+        return None
+
+    def get(self, state, index):
+        return state[0][index]
+
+    def set(self, state, index, value):
+        state[0][index] = value
+        return None
+
+    def load(self, state, words):
+        if len(words) > self.size:
+            raise ValueError("{} words do not fit in memory of {} words".format(len(words), self.size))
+        state[0][:] = array("H", bytes(2 * self.size))
+        state[0][:len(words)] = array("H", words)
+        return None
+
+# End of class MemoryModel
+
+
+class KeyboardModel:
+    """
+    Keyboard holds code of pressed key, which is set by script
+    """
+    readPins = ()
+    clockPins = ()
+
+    def newState(self):
+        return [0]
+
+    def read(self, state):
+        return (state[0],)
+
+    def tock(self, state):
+        return None
+
+    def get(self, state, index):
+        return state[0]
+
+    def set(self, state, index, value):
+        state[0] = value
+        return None
+
+# End of class KeyboardModel
+
+
+def aluOutputs(x, y, zx, nx, zy, ny, f, no):
+    out = COMP_FUNCTIONS[(zx << 5) | (nx << 4) | (zy << 3) | (ny << 2) | (f << 1) | no](x, y)
+    return out, int(out == 0), out >> 15
+
+
+BUILTIN_CHIPS = {chip.name: chip for chip in [
+    BuiltinChip("Nand", "a b", "out", lambda a, b: (1 - (a & b),)),
+    BuiltinChip("Not", "in", "out", lambda x: (1 - x,)),
+    BuiltinChip("And", "a b", "out", lambda a, b: (a & b,)),
+    BuiltinChip("Or", "a b", "out", lambda a, b: (a | b,)),
+    BuiltinChip("Xor", "a b", "out", lambda a, b: (a ^ b,)),
+    BuiltinChip("Mux", "a b sel", "out", lambda a, b, sel: (b if sel else a,)),
+    BuiltinChip("DMux", "in sel", "a b", lambda x, sel: (0, x) if sel else (x, 0)),
+    BuiltinChip("Not16", "in[16]", "out[16]", lambda x: (x ^ WORD_MASK,)),
+    BuiltinChip("And16", "a[16] b[16]", "out[16]", lambda a, b: (a & b,)),
+    BuiltinChip("Or16", "a[16] b[16]", "out[16]", lambda a, b: (a | b,)),
+    BuiltinChip("Mux16", "a[16] b[16] sel", "out[16]", lambda a, b, sel: (b if sel else a,)),
+    BuiltinChip("Or8Way", "in[8]", "out", lambda x: (int(x != 0),)),
+    BuiltinChip("Mux4Way16", "a[16] b[16] c[16] d[16] sel[2]", "out[16]",
+                lambda *inputs: (inputs[inputs[4]],)),
+    BuiltinChip("Mux8Way16", "a[16] b[16] c[16] d[16] e[16] f[16] g[16] h[16] sel[3]", "out[16]",
+                lambda *inputs: (inputs[inputs[8]],)),
+    BuiltinChip("DMux4Way", "in sel[2]", "a b c d",
+                lambda x, sel: tuple(x if index == sel else 0 for index in range(4))),
+    BuiltinChip("DMux8Way", "in sel[3]", "a b c d e f g h",
+                lambda x, sel: tuple(x if index == sel else 0 for index in range(8))),
+    BuiltinChip("HalfAdder", "a b", "sum carry", lambda a, b: (a ^ b, a & b)),
+    BuiltinChip("FullAdder", "a b c", "sum carry", lambda a, b, c: ((a + b + c) & 1, (a + b + c) >> 1)),
+    BuiltinChip("Add16", "a[16] b[16]", "out[16]", lambda a, b: ((a + b) & WORD_MASK,)),
+    BuiltinChip("Inc16", "in[16]", "out[16]", lambda x: ((x + 1) & WORD_MASK,)),
+    BuiltinChip("ALU", "x[16] y[16] zx nx zy ny f no", "out[16] zr ng", aluOutputs),
+    BuiltinChip("DFF", "in", "out", model = RegisterModel(("in",))),
+    BuiltinChip("Bit", "in load", "out", model = RegisterModel(("in", "load"))),
+    BuiltinChip("Register", "in[16] load", "out[16]", model = RegisterModel(("in", "load"))),
+    BuiltinChip("ARegister", "in[16] load", "out[16]", model = RegisterModel(("in", "load"))),
+    BuiltinChip("DRegister", "in[16] load", "out[16]", model = RegisterModel(("in", "load"))),
+    BuiltinChip("PC", "in[16] load inc reset", "out[16]", model = ProgramCounterModel()),
+    BuiltinChip("RAM8", "in[16] load address[3]", "out[16]", model = MemoryModel(8)),
+    BuiltinChip("RAM64", "in[16] load address[6]", "out[16]", model = MemoryModel(64)),
+    BuiltinChip("RAM512", "in[16] load address[9]", "out[16]", model = MemoryModel(512)),
+    BuiltinChip("RAM4K", "in[16] load address[12]", "out[16]", model = MemoryModel(4096)),
+    BuiltinChip("RAM16K", "in[16] load address[14]", "out[16]", model = MemoryModel(16384)),
+    BuiltinChip("Screen", "in[16] load address[13]", "out[16]", model = MemoryModel(8192)),
+    BuiltinChip("ROM32K", "address[15]", "out[16]", model = MemoryModel(32768, clockPins = ())),
+    BuiltinChip("Keyboard", "", "out[16]", model = KeyboardModel())
+]}
+
+
+class ChipDefinition:
+    """
+    Chip parsed from HDL file. Every part is (chip name, connections),
+    connection is (pin, pin range, signal, signal range), range is
+    (low, high) or None for whole pin.
+    """
+    def __init__(self, name, inputs, outputs, parts):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.parts = parts
+
+# End of class ChipDefinition
+
+
+class HdlParser:
+    """
+    Parses CHIP definition, "BUILTIN name;" returns built-in chip
+    """
+    def __init__(self, text):
+        self.tokens = [token for token in HDL_TOKEN.findall(text) if not token.startswith(("//", "/*"))]
+        self.position = 0
+
+    def __peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def __next(self, expected = None):
+        token = self.__peek()
+        if token is None or (expected is not None and token != expected):
+            raise ValueError("expected {}, got {}".format(expected or "token", token))
+        self.position += 1
+        return token
+
+    def __range(self):
+        """
+        Parses optional "[i]" or "[i..j]"
+        """
+        if self.__peek() != "[":
+            return None
+        self.__next("[")
+        low = high = int(self.__next())
+        if self.__peek() == "..":
+            self.__next("..")
+            high = int(self.__next())
+        self.__next("]")
+        return low, high
+
+    def __pins(self):
+        pins = []
+        while True:
+            name = self.__next()
+            width = self.__range()
+            pins.append((name, width[0] if width else 1))
+            if self.__next() == ";":
+                return pins
+
+    def __part(self):
+        name = self.__next()
+        self.__next("(")
+        connections = []
+        while True:
+            pin = self.__next()
+            pinRange = self.__range()
+            self.__next("=")
+            signal = self.__next()
+            signalRange = self.__range()
+            connections.append((pin, pinRange, signal, signalRange))
+            if self.__next() == ")":
+                break
+        self.__next(";")
+        return name, connections
+
+    def parse(self):
+        self.__next("CHIP")
+        name = self.__next()
+        self.__next("{")
+        inputs = outputs = []
+        if self.__peek() == "IN":
+            self.__next()
+            inputs = self.__pins()
+        if self.__peek() == "OUT":
+            self.__next()
+            outputs = self.__pins()
+        if self.__peek() == "BUILTIN":
+            self.__next()
+            builtin = self.__next()
+            if builtin not in BUILTIN_CHIPS:
+                raise ValueError("no built-in chip {}".format(builtin))
+            return BUILTIN_CHIPS[builtin]
+        self.__next("PARTS")
+        self.__next(":")
+        parts = []
+        while self.__peek() != "}":
+            parts.append(self.__part())
+        return ChipDefinition(name, inputs, outputs, parts)
+
+# End of class HdlParser
+
+
+class ChipLibrary:
+    """
+    Chips of one directory, chip without HDL file there is built-in one
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.chips = {}
+
+    def get(self, name):
+        if name not in self.chips:
+            hdlFile = self.directory.joinpath(name + ".hdl")
+            if hdlFile.exists():
+                self.chips[name] = HdlParser(hdlFile.read_text()).parse()
+            elif name in BUILTIN_CHIPS:
+                self.chips[name] = BUILTIN_CHIPS[name]
+            else:
+                raise ValueError("chip {} not found in {}".format(name, self.directory))
+        return self.chips[name]
+
+# End of class ChipLibrary
+
+
+def rangeWidth(pinRange, width):
+    return width if pinRange is None else pinRange[1] - pinRange[0] + 1
+
+
+class NetlistBuilder:
+    """
+    Flattens chip hierarchy into nets (integer values of given width) and
+    nodes (kind, input nets, output nets, parameter). Node kind is name of
+    built-in combinational chip, "gather" which composes net from bits of
+    other nets and constant, or "read" which reads state of part.
+    """
+    def __init__(self, library):
+        self.library = library
+        self.widths = []
+        self.nodes = []
+        self.parts = []
+        self.stateNames = {}
+
+    def newNet(self, width):
+        self.widths.append(width)
+        return len(self.widths) - 1
+
+    def build(self, name):
+        chip = self.library.get(name)
+        pins = {}
+        for pinName, width in chip.inputs:
+            pins[pinName] = [self.newNet(width), width, "in"]
+        for pinName, width in chip.outputs:
+            pins[pinName] = [self.newNet(width), width, "out"]
+        self.flatten(chip, {pinName: pin[0] for pinName, pin in pins.items()}, [])
+        self.removeCopies(pins)
+        nodes, levels = self.levelize()
+        return {
+            "version": NETLIST_VERSION,
+            "chip": chip.name,
+            "widths": self.widths,
+            "pins": pins,
+            "nodes": nodes,
+            "levels": levels,
+            "parts": self.parts,
+            "stateNames": self.stateNames
+        }
+
+    def flatten(self, chip, pinNets, stack):
+        """
+        Adds nodes of chip, pinNets maps every pin of chip to net
+        """
+        if isinstance(chip, BuiltinChip):
+            self.addBuiltin(chip, pinNets)
+            return None
+        if chip.name in stack:
+            raise ValueError("chip {} contains itself".format(chip.name))
+        signals = {name: (pinNets[name], width) for name, width in chip.inputs + chip.outputs}
+        partChips = [self.library.get(partName) for partName, _ in chip.parts]
+        # internal pins get width of part output which drives them
+        for partChip, (_, connections) in zip(partChips, chip.parts):
+            outputWidths = dict(partChip.outputs)
+            for pin, pinRange, signal, _ in connections:
+                if pin in outputWidths and signal not in signals:
+                    signals[signal] = (self.newNet(rangeWidth(pinRange, outputWidths[pin])), None)
+        signals = {name: (net, width if width is not None else self.widths[net])
+                   for name, (net, width) in signals.items()}
+        pieces = {}
+        for partChip, (partName, connections) in zip(partChips, chip.parts):
+            childNets = {}
+            for pin, width in partChip.inputs:
+                childNets[pin] = self.connectInput(chip, signals, width,
+                                                   [c for c in connections if c[0] == pin])
+            for pin, width in partChip.outputs:
+                childNets[pin] = self.connectOutput(signals, width, pieces,
+                                                    [c for c in connections if c[0] == pin])
+            pinNames = {pin for pin, _ in partChip.inputs + partChip.outputs}
+            for pin, _, _, _ in connections:
+                if pin not in pinNames:
+                    raise ValueError("chip {} has no pin {}".format(partName, pin))
+            self.flatten(partChip, childNets, stack + [chip.name])
+        for net, netPieces in pieces.items():
+            self.addGather(net, netPieces)
+        return None
+
+    def connectInput(self, chip, signals, width, connections):
+        """
+        Returns net of part's input pin, whole signal of the same width is
+        used directly, otherwise net is gathered from pieces
+        """
+        if len(connections) == 1:
+            _, pinRange, signal, signalRange = connections[0]
+            if (pinRange is None and signalRange is None and signal in signals
+                    and signals[signal][1] == width):
+                return signals[signal][0]
+        net = self.newNet(width)
+        netPieces = []
+        for _, pinRange, signal, signalRange in connections:
+            low = pinRange[0] if pinRange else 0
+            pieceWidth = rangeWidth(pinRange, width)
+            if signal in ("true", "false"):
+                netPieces.append((None, 0, pieceWidth, low, signal == "true"))
+            elif signal in signals:
+                sourceLow = signalRange[0] if signalRange else 0
+                netPieces.append((signals[signal][0], sourceLow, pieceWidth, low, False))
+            else:
+                raise ValueError("pin {} is not driven in chip {}".format(signal, chip.name))
+        self.addGather(net, netPieces)
+        return net
+
+    def connectOutput(self, signals, width, pieces, connections):
+        """
+        Returns net of part's output pin. First connection to whole signal
+        of the same width uses its net, other connected signals get pieces.
+        """
+        net = None
+        for connection in connections:
+            _, pinRange, signal, signalRange = connection
+            if (net is None and pinRange is None and signalRange is None
+                    and signals[signal][1] == width and signals[signal][0] not in pieces):
+                net = signals[signal][0]
+                connections = [c for c in connections if c is not connection]
+                break
+        if net is None:
+            net = self.newNet(width)
+        for _, pinRange, signal, signalRange in connections:
+            low = pinRange[0] if pinRange else 0
+            pieceWidth = rangeWidth(signalRange, rangeWidth(pinRange, width))
+            destination = signalRange[0] if signalRange else 0
+            pieces.setdefault(signals[signal][0], []).append((net, low, pieceWidth, destination, False))
+        return net
+
+    def addGather(self, net, netPieces):
+        constant = 0
+        inputs = []
+        parameter = []
+        for source, low, width, destination, value in netPieces:
+            if source is None:
+                if value:
+                    constant |= ((1 << width) - 1) << destination
+            else:
+                inputs.append(source)
+                parameter.append([low, (1 << width) - 1, destination])
+        self.nodes.append(("gather", inputs, [net], [constant, parameter]))
+        return None
+
+    def addBuiltin(self, chip, pinNets):
+        inputs = [pinNets[pin] for pin, _ in chip.inputs]
+        outputs = [pinNets[pin] for pin, _ in chip.outputs]
+        if chip.model is None:
+            self.nodes.append((chip.name, inputs, outputs, None))
+            return None
+        # state outputs depend only on read pins, clock pins are latched
+        # on tick, so registers break combinational loops
+        partIndex = len(self.parts)
+        self.parts.append((chip.name, [pinNets[pin] for pin in chip.model.clockPins]))
+        self.stateNames.setdefault(chip.name, partIndex)
+        self.nodes.append(("read", [pinNets[pin] for pin in chip.model.readPins], outputs, partIndex))
+        return None
+
+    def removeCopies(self, pins):
+        """
+        Removes gather nodes which only copy whole net, readers of copy
+        read the original net. Pins of chip keep their nets.
+        """
+        widths = self.widths
+        pinNets = {pin[0] for pin in pins.values()}
+        replacements = {}
+        nodes = []
+        for node in self.nodes:
+            kind, inputs, outputs, parameter = node
+            if (kind == "gather" and len(inputs) == 1 and parameter[0] == 0 and outputs[0] not in pinNets
+                    and parameter[1][0] == [0, (1 << widths[outputs[0]]) - 1, 0]
+                    and widths[inputs[0]] == widths[outputs[0]]):
+                replacements[outputs[0]] = inputs[0]
+            else:
+                nodes.append(node)
+        def resolve(net):
+            while net in replacements:
+                net = replacements[net]
+            return net
+        self.nodes = [[kind, [resolve(net) for net in inputs], [resolve(net) for net in outputs], parameter]
+                      for kind, inputs, outputs, parameter in nodes]
+        self.parts = [[name, [resolve(net) for net in clockInputs]] for name, clockInputs in self.parts]
+        return None
+
+    def levelize(self):
+        """
+        Sorts nodes topologically, returns (nodes, number of levels). Level
+        of node is one more than highest level of nodes driving its inputs.
+        """
+        drivers = {}
+        for index, (_, _, outputs, _) in enumerate(self.nodes):
+            for net in outputs:
+                drivers[net] = index
+        dependants = [[] for _ in self.nodes]
+        pending = [0] * len(self.nodes)
+        for index, (_, inputs, _, _) in enumerate(self.nodes):
+            for driver in {drivers[net] for net in inputs if net in drivers}:
+                dependants[driver].append(index)
+                pending[index] += 1
+        levels = [0] * len(self.nodes)
+        ready = [index for index, count in enumerate(pending) if count == 0]
+        order = []
+        while ready:
+            index = ready.pop()
+            order.append(index)
+            for dependant in dependants[index]:
+                levels[dependant] = max(levels[dependant], levels[index] + 1)
+                pending[dependant] -= 1
+                if pending[dependant] == 0:
+                    ready.append(dependant)
+        if len(order) != len(self.nodes):
+            raise ValueError("combinational loop in chip")
+        order.sort(key = lambda index: levels[index])
+        return [self.nodes[index] for index in order], max(levels, default = -1) + 1
+
+# End of class NetlistBuilder
+
+
+def netlistKey(inFilePath):
+    """
+    Hashes netlist version, chip name and every HDL file of chip's directory
+    """
+    inFilePath = Path(inFilePath)
+    digest = hashlib.sha256()
+    digest.update(NETLIST_VERSION.encode() + b"\0" + inFilePath.stem.encode())
+    for hdlFile in sorted(inFilePath.parent.glob("*.hdl")):
+        digest.update(b"\0" + hdlFile.name.encode() + b"\0")
+        digest.update(hashlib.sha256(hdlFile.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def loadNetlist(inFilePath, cacheDirectory = None):
+    """
+    Returns netlist of chip, built from HDL or read from cache directory
+    """
+    inFilePath = Path(inFilePath)
+    cachedFile = None
+    if cacheDirectory is not None:
+        cachedFile = Path(cacheDirectory).joinpath(netlistKey(inFilePath) + ".json")
+        try:
+            return json.loads(cachedFile.read_text())
+        except (FileNotFoundError, ValueError):
+            pass
+    netlist = NetlistBuilder(ChipLibrary(inFilePath.parent)).build(inFilePath.stem)
+    if cachedFile is not None:
+        # other processes may read the cache, so entry is moved in place
+        cachedFile.parent.mkdir(parents = True, exist_ok = True)
+        fd, tempPath = tempfile.mkstemp(dir = cachedFile.parent, suffix = ".tmp")
+        with os.fdopen(fd, mode = "w") as f:
+            json.dump(netlist, f)
+        os.replace(tempPath, cachedFile)
+    return netlist
+
+
+def gatherFunction(constant, pieces):
+    if len(pieces) == 1 and not constant:
+        # most gathers take one bit or sub-bus of single net
+        (low, mask, destination), = pieces
+        return lambda source: (((source >> low) & mask) << destination,)
+    def gather(*sources):
+        value = constant
+        for source, (low, mask, destination) in zip(sources, pieces):
+            value |= ((source >> low) & mask) << destination
+        return (value,)
+    return gather
+
+
+class HdlSimulator:
+    """
+    Simulates netlist, values holds value of every net. Evaluation runs
+    nodes in level order, tick latches clock pins of parts with state
+    and tock makes stored values visible.
+    """
+    def __init__(self, netlist):
+        self.netlist = netlist
+        self.values = [0] * len(netlist["widths"])
+        self.states = []
+        self.parts = []
+        for chipName, clockInputs in netlist["parts"]:
+            model = BUILTIN_CHIPS[chipName].model
+            state = model.newState()
+            self.states.append(state)
+            self.parts.append((model, state, clockInputs))
+        self.program = []
+        for kind, inputs, outputs, parameter in netlist["nodes"]:
+            if kind == "gather":
+                function = gatherFunction(*parameter)
+            elif kind == "read":
+                model, state, _ = self.parts[parameter]
+                function = partial(model.read, state)
+            else:
+                function = BUILTIN_CHIPS[kind].function
+            # single output is stored as int, so evaluation does not loop
+            self.program.append((function, tuple(inputs), outputs[0] if len(outputs) == 1 else tuple(outputs)))
+        self.dirty = False
+        self.evaluate()
+
+    def evaluate(self):
+        values = self.values
+        get = values.__getitem__
+        for function, inputs, outputs in self.program:
+            results = function(*map(get, inputs))
+            if outputs.__class__ is int:
+                values[outputs] = results[0]
+            else:
+                for net, value in zip(outputs, results):
+                    values[net] = value
+        self.dirty = False
+        return None
+
+    def tick(self):
+        # outputs of parts change only on tock, so evaluation is needed
+        # only for inputs set since last one
+        if self.dirty:
+            self.evaluate()
+        values = self.values
+        for model, state, clockInputs in self.parts:
+            if clockInputs:
+                model.tick(state, *[values[net] for net in clockInputs])
+        return None
+
+    def tock(self):
+        for model, state, _ in self.parts:
+            model.tock(state)
+        self.evaluate()
+        return None
+
+    def __part(self, name):
+        """
+        Returns (model, state) of first part with state named name
+        """
+        stateNames = self.netlist["stateNames"]
+        if name not in stateNames:
+            raise ValueError("unknown pin or part {}".format(name))
+        model, state, _ = self.parts[stateNames[name]]
+        return model, state
+
+    def get(self, name):
+        """
+        Returns value of pin ("out", "out[3]") or state of part ("RAM16K[5]",
+        "DRegister[]")
+        """
+        variable, index = VARIABLE.fullmatch(name).groups()
+        pins = self.netlist["pins"]
+        if variable in pins:
+            value = self.values[pins[variable][0]]
+            return (value >> int(index)) & 1 if index else value
+        model, state = self.__part(variable)
+        return model.get(state, int(index) if index else 0)
+
+    def set(self, name, value):
+        variable, index = VARIABLE.fullmatch(name).groups()
+        pins = self.netlist["pins"]
+        if variable in pins:
+            net, width, direction = pins[variable]
+            if direction != "in":
+                raise ValueError("{} is not input pin".format(variable))
+            self.dirty = True
+            if index:
+                bit = 1 << int(index)
+                self.values[net] = (self.values[net] & ~bit) | (bit if value & 1 else 0)
+            else:
+                self.values[net] = value & ((1 << width) - 1)
+            return None
+        model, state = self.__part(variable)
+        model.set(state, int(index) if index else 0, value)
+        self.dirty = True
+        return None
+
+    def loadMemory(self, name, words):
+        """
+        Loads words to memory part, e.g. program to ROM32K
+        """
+        model, state = self.__part(name)
+        model.load(state, words)
+        self.dirty = True
+        return None
+
+# End of class HdlSimulator
+
+
+def main():
+    argumentParser = argparse.ArgumentParser(description = "Simulator of hack chips described in HDL.")
+    argumentParser.add_argument("inputFile", metavar = "inFile", type = str,
+                                help = "chip to simulate (.hdl)")
+    argumentParser.add_argument("--cache", type = str, default = None, metavar = "DIR",
+                                help = "directory of cached netlists")
+    argumentParser.add_argument("--set", type = str, action = "append", default = [], metavar = "PIN=VALUE",
+                                help = "input pin value, e.g. --set a=1")
+    argumentParser.add_argument("--cycles", type = int, default = 0,
+                                help = "number of clock cycles (tick, tock) to run")
+
+    args = vars(argumentParser.parse_args())
+    tick = time.perf_counter()
+    netlist = loadNetlist(args["inputFile"], args["cache"])
+    loadTime = time.perf_counter() - tick
+    simulator = HdlSimulator(netlist)
+    for assignment in args["set"]:
+        pin, _, value = assignment.partition("=")
+        simulator.set(pin, int(value, 0))
+    tick = time.perf_counter()
+    simulator.evaluate()
+    for _ in range(args["cycles"]):
+        simulator.tick()
+        simulator.tock()
+    runTime = time.perf_counter() - tick
+    for name, (net, width, direction) in netlist["pins"].items():
+        print("{:<4} {:<16} {}".format(direction, name, simulator.values[net]))
+    print("{} nets, {} nodes in {} levels, {} parts with state, netlist loaded in {:.1f} ms".format(
+        len(netlist["widths"]), len(netlist["nodes"]), netlist["levels"], len(netlist["parts"]),
+        loadTime * 1000))
+    if args["cycles"]:
+        print("{} cycles in {:.1f} ms".format(args["cycles"], runTime * 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
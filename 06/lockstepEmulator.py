@@ -0,0 +1,256 @@
+"""
+Lockstep emulator for hack computer, runs many instances of the same
+program at once. Registers and RAM are NumPy arrays with one lane per
+instance. Every step executes single instruction for all lanes at the
+lowest program counter, lanes at other addresses are masked out until
+they meet again, so instances which do not branch differently run at
+cost of one.
+"""
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+from emulator import Emulator, ROM_SIZE, RAM_SIZE, WORD_MASK, ADDRESS_MASK, isHaltLoop, loadProgram, parseAddress
+
+DEFAULT_LANES = 1024
+
+
+def vectorAluFunction(zx, nx, zy, ny, f, no):
+    """
+    ALU working on uint16 arrays, wrapping to 16 bits is done by NumPy
+    """
+    def alu(x, y):
+        if zx: x = np.zeros_like(y)
+        if nx: x = ~x
+        if zy: y = np.zeros_like(x)
+        if ny: y = ~y
+        out = (x + y) if f else (x & y)
+        if no: out = ~out
+        return out
+    return alu
+
+
+VECTOR_COMP_FUNCTIONS = [vectorAluFunction(*[(c >> bit) & 1 for bit in range(5, -1, -1)]) for c in range(64)]
+
+
+def decodeVectorInstruction(word):
+    """
+    A instruction decodes to its value (int), C instruction to tuple
+    (comp, usesM, destA, destD, destM, jumpBits)
+    """
+    if not word & 0x8000:
+        return word
+    return (VECTOR_COMP_FUNCTIONS[(word >> 6) & 0b111111], bool(word & 0x1000),
+            bool(word & 0b100000), bool(word & 0b10000), bool(word & 0b1000), word & 0b111)
+
+
+class LockstepEmulator:
+    """
+    Given number of hack computers sharing one ROM. RAM is array of shape
+    (RAM_SIZE, lanes), so cell of all instances is one contiguous row.
+    A, D and RAM are uint16, PC, cycles and halted flags are kept per lane.
+    """
+    def __init__(self, rom, lanes = DEFAULT_LANES):
+        if len(rom) > ROM_SIZE:
+            raise ValueError("program has {} words, ROM holds only {}".format(len(rom), ROM_SIZE))
+        self.lanes = lanes
+        self.program = [decodeVectorInstruction(word) for word in rom] + [0] * (ROM_SIZE - len(rom))
+        # addresses of jumps which close "@n", "0;JMP" halt loop
+        self.haltJumps = {address + 1 for address in range(len(rom)) if isHaltLoop(rom, address)}
+        self.ram = np.zeros((RAM_SIZE, lanes), dtype = np.uint16)
+        self.A = np.zeros(lanes, dtype = np.uint16)
+        self.D = np.zeros(lanes, dtype = np.uint16)
+        self.PC = np.zeros(lanes, dtype = np.int64)
+        self.cycles = np.zeros(lanes, dtype = np.int64)
+        self.halted = np.zeros(lanes, dtype = bool)
+        self.steps = 0
+
+    def __getitem__(self, address):
+        return self.ram[address]
+
+    def __setitem__(self, address, values):
+        # values may be negative, they are stored in two's complement
+        self.ram[address] = np.asarray(values, dtype = np.int64) & WORD_MASK
+
+    def run(self, cycles, stopOnHalt = True):
+        """
+        Executes at most given number of instructions in every lane, same
+        as Emulator.run does for single instance. Returns array of numbers
+        of executed instructions.
+        """
+        program = self.program
+        haltJumps = self.haltJumps
+        ram, A, D, PC = self.ram, self.A, self.D, self.PC
+        allLanes = np.arange(self.lanes)
+        executed = np.zeros(self.lanes, dtype = np.int64)
+        active = np.ones(self.lanes, dtype = bool)
+        allActive = True
+        halted = np.zeros(self.lanes, dtype = bool)
+        steps = 0
+        while True:
+            pcs = PC if allActive else np.where(active, PC, ROM_SIZE)
+            pc = int(pcs.min())
+            if pc == ROM_SIZE:
+                break
+            if allActive and PC.max() == pc:
+                # all lanes are at the same instruction, no masking needed
+                lanes = slice(None)
+                laneIndices = allLanes
+            else:
+                lanes = laneIndices = np.flatnonzero(pcs == pc)
+            nextPC = (pc + 1) & ADDRESS_MASK
+            entry = program[pc]
+            if entry.__class__ is int:
+                A[lanes] = entry
+                PC[lanes] = nextPC
+            else:
+                comp, usesM, destA, destD, destM, jumpBits = entry
+                address = A[lanes] & ADDRESS_MASK
+                out = comp(D[lanes], ram[address, laneIndices] if usesM else A[lanes])
+                if destM:
+                    ram[address, laneIndices] = out
+                if destA:
+                    A[lanes] = out
+                if destD:
+                    D[lanes] = out
+                if jumpBits == 7:
+                    PC[lanes] = address
+                    if stopOnHalt and pc in haltJumps:
+                        halting = address == pc - 1
+                        if halting.any():
+                            haltingLanes = laneIndices[halting]
+                            halted[haltingLanes] = True
+                            active[haltingLanes] = False
+                            allActive = False
+                elif jumpBits:
+                    signed = out.view(np.int16)
+                    taken = np.zeros(signed.shape, dtype = bool)
+                    if jumpBits & 4:
+                        taken |= signed < 0
+                    if jumpBits & 2:
+                        taken |= signed == 0
+                    if jumpBits & 1:
+                        taken |= signed > 0
+                    PC[lanes] = np.where(taken, address, nextPC)
+                else:
+                    PC[lanes] = nextPC
+            executed[lanes] += 1
+            steps += 1
+            if steps >= cycles:
+                # no lane can run out of cycles before that many steps
+                exhausted = laneIndices[executed[lanes] >= cycles]
+                if len(exhausted):
+                    active[exhausted] = False
+                    allActive = False
+        self.halted = halted
+        self.cycles += executed
+        self.steps += steps
+        return executed
+
+# End of class LockstepEmulator
+
+
+def runBatch(rom, inputs, outputs, cycles, lanes = DEFAULT_LANES):
+    """
+    Runs one instance of program for every column of inputs, given as dict
+    address -> sequence of values. Instances are run in groups of at most
+    lanes. Returns (dict address -> array of output values, halted flags,
+    executed instructions).
+    """
+    inputs = {address: np.asarray(values, dtype = np.int64) for address, values in inputs.items()}
+    instances = len(next(iter(inputs.values()))) if inputs else 1
+    results = {address: np.zeros(instances, dtype = np.uint16) for address in outputs}
+    halted = np.zeros(instances, dtype = bool)
+    executed = np.zeros(instances, dtype = np.int64)
+    for first in range(0, instances, lanes):
+        last = min(first + lanes, instances)
+        hack = LockstepEmulator(rom, last - first)
+        for address, values in inputs.items():
+            hack[address] = values[first:last]
+        executed[first:last] = hack.run(cycles)
+        halted[first:last] = hack.halted
+        for address in outputs:
+            results[address][first:last] = hack[address]
+    return results, halted, executed
+
+
+def runSeparately(rom, inputs, outputs, cycles):
+    """
+    Same as runBatch, but every instance runs in its own Emulator
+    """
+    inputs = {address: [int(value) for value in values] for address, values in inputs.items()}
+    instances = len(next(iter(inputs.values()))) if inputs else 1
+    results = {address: np.zeros(instances, dtype = np.uint16) for address in outputs}
+    halted = np.zeros(instances, dtype = bool)
+    executed = np.zeros(instances, dtype = np.int64)
+    for instance in range(instances):
+        hack = Emulator(rom)
+        for address, values in inputs.items():
+            hack[address] = values[instance]
+        executed[instance] = hack.run(cycles)
+        halted[instance] = hack.halted
+        for address in outputs:
+            results[address][instance] = hack[address]
+    return results, halted, executed
+
+
+def parseRange(text):
+    """
+    Parses "R0=0:100" (end excluded) or "R0=5" to (address, values)
+    """
+    target, _, values = text.partition("=")
+    start, separator, stop = values.partition(":")
+    return parseAddress(target), range(int(start), int(stop)) if separator else [int(start)]
+
+
+def main():
+    argumentParser = argparse.ArgumentParser(
+        description = "Runs hack program for every combination of inputs in lockstep.")
+    argumentParser.add_argument("inputFile", metavar = "inFile", type = str,
+                                help = "program to run (.hack, .bin or .asm)")
+    argumentParser.add_argument("--range", type = str, action = "append", default = [], metavar = "ADDRESS=FROM:TO",
+                                help = "input values, e.g. --range R0=0:100 --range R1=0:100")
+    argumentParser.add_argument("--output", type = str, action = "append", default = [], metavar = "ADDRESS",
+                                help = "RAM address printed for every instance, e.g. --output R2")
+    argumentParser.add_argument("--cycles", type = int, default = 1_000_000,
+                                help = "maximum number of instructions executed by every instance")
+    argumentParser.add_argument("--lanes", type = int, default = DEFAULT_LANES,
+                                help = "number of instances run at once")
+    argumentParser.add_argument("--verify", action = "store_const", const = True,
+                                help = "also run every instance in separate emulator and compare results")
+
+    args = vars(argumentParser.parse_args())
+    rom = loadProgram(args["inputFile"])
+    ranges = [parseRange(text) for text in args["range"]]
+    outputs = [parseAddress(address) for address in args["output"]]
+    inputNames = [text.partition("=")[0] for text in args["range"]]
+    combinations = list(itertools.product(*[values for _, values in ranges]))
+    inputs = {address: [combination[index] for combination in combinations]
+              for index, (address, _) in enumerate(ranges)}
+
+    tick = time.perf_counter()
+    results, halted, executed = runBatch(rom, inputs, outputs, args["cycles"], args["lanes"])
+    timeDelta = time.perf_counter() - tick
+    for index, combination in enumerate(combinations):
+        print(" ".join("{}={}".format(name, value) for name, value in zip(inputNames, combination)),
+              "->", " ".join("{}={}".format(name, results[address][index])
+                             for name, address in zip(args["output"], outputs)),
+              "" if halted[index] else "(not halted)")
+    print("{} instances, {} instructions in {:.3f} s".format(len(combinations), executed.sum(), timeDelta))
+
+    if args["verify"]:
+        tick = time.perf_counter()
+        expected = runSeparately(rom, inputs, outputs, args["cycles"])
+        separateTime = time.perf_counter() - tick
+        same = (all((expected[0][address] == results[address]).all() for address in outputs)
+                and (expected[1] == halted).all() and (expected[2] == executed).all())
+        print("Separate emulators: {:.3f} s, results {}, speedup {:.1f}x".format(
+            separateTime, "match" if same else "differ", separateTime / timeDelta if timeDelta else 0.0))
+        return 0 if same else 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,222 @@
+"""
+Packed binary ROM images for hack computer. Every instruction is stored as
+little-endian unsigned 16 bit word, so image is 2 bytes per instruction
+instead of 17 bytes per line of .hack text file. Conversion between words
+and .hack text is also here, it is vectorized when NumPy is installed.
+"""
+from array import array
+import mmap
+import sys
+
+try:
+    import numpy
+except ImportError:
+    # without NumPy .hack text is converted line by line
+    numpy = None
+
+WORD_TYPECODE = "H"
+CHUNK_SIZE = 1 << 16
+HACK_WORD_DIGITS = 16
+# words converted at once by hackTextChunks, small enough for reused buffer
+# to stay in cache
+HACK_TEXT_CHUNK_WORDS = 4096
+if numpy is not None:
+    # 8 ascii digits of every byte value, as little-endian 64 bit numbers
+    BYTE_DIGITS = numpy.frombuffer(b"".join(format(value, "08b").encode("ascii") for value in range(256)),
+                                   dtype = "<u8")
+
+
+def wordsToArray(words):
+    """
+    Packs iterable of integer opcodes into array('H')
+    """
+    if isinstance(words, array) and words.typecode == WORD_TYPECODE:
+        return words
+    return array(WORD_TYPECODE, words)
+
+
+def writeWords(outStream, words):
+    """
+    Writes words to binary stream in chunks, words can be any iterable
+    (e.g. generator) so whole program does not have to be in memory
+    """
+    chunk = array(WORD_TYPECODE)
+    for word in words:
+        chunk.append(word)
+        if len(chunk) >= CHUNK_SIZE:
+            writeChunk(outStream, chunk)
+            chunk = array(WORD_TYPECODE)
+    writeChunk(outStream, chunk)
+    return None
+
+
+def writeChunk(outStream, chunk):
+    if sys.byteorder == "big":
+        chunk.byteswap()
+    outStream.write(memoryview(chunk))
+    return None
+
+
+def writeBinaryRom(outFile, words):
+    with open(outFile, mode = "wb") as f:
+        writeWords(f, words)
+    return None
+
+
+class BinaryRom:
+    """
+    Read only view of packed ROM image. File is memory mapped, so words are
+    accessed without copying. Use as context manager or call close().
+    """
+    def __init__(self, inFile):
+        self.__file = open(inFile, mode = "rb")
+        self.__mmap = None
+        size = self.__file.seek(0, 2)
+        if size % 2 != 0:
+            self.__file.close()
+            raise ValueError("{} is not a valid ROM image, size must be even".format(inFile))
+        if size == 0:
+            # empty file can not be memory mapped
+            self.words = memoryview(array(WORD_TYPECODE))
+        elif sys.byteorder == "little":
+            self.__mmap = mmap.mmap(self.__file.fileno(), 0, access = mmap.ACCESS_READ)
+            self.words = memoryview(self.__mmap).cast(WORD_TYPECODE)
+        else:
+            # big endian host, words have to be swapped so zero copy is not possible
+            words = array(WORD_TYPECODE)
+            self.__file.seek(0)
+            words.frombytes(self.__file.read())
+            words.byteswap()
+            self.words = memoryview(words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, index):
+        return self.words[index]
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def toArray(self):
+        """
+        Returns copy of image as array('H')
+        """
+        return array(WORD_TYPECODE, self.words)
+
+    def close(self):
+        self.words.release()
+        if self.__mmap is not None:
+            self.__mmap.close()
+        self.__file.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+# End of class BinaryRom
+
+
+def loadBinaryRom(inFile):
+    """
+    Opens packed ROM image, returns BinaryRom
+    """
+    return BinaryRom(inFile)
+
+
+def hackTextChunks(words):
+    """
+    Yields .hack text of words as bytes-like chunks, lines are separated
+    (not terminated) by newline, same as "\\n".join of binary strings.
+    With NumPy chunks share one buffer, each is valid until next is yielded.
+    """
+    if numpy is None:
+        yield "\n".join(format(word, "016b") for word in words).encode("ascii")
+        return
+    words = numpy.frombuffer(wordsToArray(words), dtype = numpy.uint16)
+    if not len(words):
+        return
+    lineLength = HACK_WORD_DIGITS + 1
+    chunkWords = min(HACK_TEXT_CHUNK_WORDS, len(words))
+    buffer = numpy.empty(lineLength * chunkWords, dtype = numpy.uint8)
+    buffer[HACK_WORD_DIGITS::lineLength] = ord("\n")
+    # 8 digits of high and low byte of every word, as unaligned 64 bit views
+    highDigits = numpy.ndarray((chunkWords,), "<u8", buffer = buffer, offset = 0, strides = (lineLength,))
+    lowDigits = numpy.ndarray((chunkWords,), "<u8", buffer = buffer, offset = 8, strides = (lineLength,))
+    for first in range(0, len(words), chunkWords):
+        chunk = words[first:first + chunkWords]
+        count = len(chunk)
+        BYTE_DIGITS.take(chunk >> 8, out = highDigits[:count], mode = "clip")
+        BYTE_DIGITS.take(chunk & 0xFF, out = lowDigits[:count], mode = "clip")
+        last = first + count == len(words)
+        yield buffer[:lineLength * count - last]
+
+
+def wordsToHackText(words):
+    """
+    Returns .hack text of words as bytes, see hackTextChunks
+    """
+    return b"".join(bytes(chunk) for chunk in hackTextChunks(words))
+
+
+def hackTextToWords(data):
+    """
+    Converts .hack text (bytes) to array('H'), raises ValueError when some
+    line is not 16 binary digits
+    """
+    error = "not a valid .hack text, every line has to be 16 binary digits"
+    if numpy is None:
+        lines = data.split()
+        if any(len(line) != HACK_WORD_DIGITS for line in lines):
+            raise ValueError(error)
+        try:
+            return array(WORD_TYPECODE, (int(line, 2) for line in lines))
+        except ValueError:
+            raise ValueError(error) from None
+    lineLength = HACK_WORD_DIGITS + 1
+    isRegular = lambda data: (len(data) % lineLength in (0, HACK_WORD_DIGITS) and (numpy.frombuffer(
+        data, dtype = numpy.uint8)[HACK_WORD_DIGITS::lineLength] == ord("\n")).all())
+    if not isRegular(data):
+        # other whitespace than single newline after every line
+        data = b"\n".join(data.split())
+        if not isRegular(data):
+            raise ValueError(error)
+    lines = (len(data) + 1) // lineLength
+    if lines == 0:
+        return array(WORD_TYPECODE)
+    halves = []
+    for offset in (0, 8):
+        # 8 ascii digits as one 64 bit number, its lowest byte is first digit
+        half = numpy.ndarray((lines,), "<u8", buffer = data, offset = offset, strides = (lineLength,))
+        half = half.astype(numpy.uint64)
+        if ((half & 0xFEFEFEFEFEFEFEFE) != 0x3030303030303030).any():
+            raise ValueError(error)
+        # gathers lowest bits of all 8 bytes into top byte, first digit
+        # becomes highest bit; operations are in place, since fresh large
+        # temporaries cost more than arithmetic
+        half &= 0x0101010101010101
+        half *= 0x8040201008040201
+        half >>= 56
+        halves.append(half)
+    halves[0] <<= 8
+    halves[0] |= halves[1]
+    return array(WORD_TYPECODE, halves[0].astype(numpy.uint16).tobytes())
+
+
+def writeHackText(outFile, words):
+    with open(outFile, mode = "wb") as f:
+        for chunk in hackTextChunks(words):
+            f.write(chunk)
+    return None
+
+
+def loadHackText(inFile):
+    """
+    Reads .hack text file, returns array('H')
+    """
+    with open(inFile, mode = "rb") as f:
+        return hackTextToWords(f.read())
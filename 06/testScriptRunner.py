@@ -0,0 +1,681 @@
+"""
+Headless runner for test scripts (.tst) of nand2tetris tools. Script is
+interpreted against model of loaded program or chip, output lines are
+compared with .cmp file, and scripts of whole repository are run in
+process pool.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import importlib.util
+import json
+import logging
+from pathlib import Path
+import re
+import time
+
+from assembler import assemble
+from emulator import Emulator, WORD_MASK, ADDRESS_MASK, decodeInstruction, loadProgram, toSigned
+from hdlSimulator import HdlSimulator, loadNetlist
+
+# comments are matched, so they can be dropped, strings are kept whole
+TOKEN = re.compile(r'//[^\n]*|/\*.*?\*/|"[^"]*"|[{},;]|[^\s{},;]+', re.DOTALL)
+COLUMN = re.compile(r"(.+)%([BDSX])(\d+)\.(\d+)\.(\d+)")
+VARIABLE = re.compile(r"(\w+)(?:\[(\d*)\])?")
+CONDITIONS = {
+    "=": lambda x, y: x == y,
+    "<>": lambda x, y: x != y,
+    "<": lambda x, y: x < y,
+    ">": lambda x, y: x > y,
+    "<=": lambda x, y: x <= y,
+    ">=": lambda x, y: x >= y
+}
+VM_TRANSLATOR_PATH = Path(__file__).resolve().parent.parent.joinpath("07", "vmTranslator.py")
+
+__vmTranslator = None
+
+
+class ScriptError(Exception):
+    """
+    Invalid test script
+    """
+
+class UnsupportedScript(ScriptError):
+    """
+    Test script needs simulator which is not available here, e.g. VM
+    emulator or interactive input
+    """
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text) if not token.startswith(("//", "/*"))]
+
+
+def parseCommands(tokens, position = 0, nested = False):
+    """
+    Parses tokens to list of (words, body), body is list of commands of
+    repeat and while loops, None for simple commands. Returns (commands,
+    position after closing brace).
+    """
+    commands = []
+    words = []
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token in (",", ";"):
+            if words:
+                commands.append((words, None))
+            words = []
+        elif token == "{":
+            if not words or words[0] not in ("repeat", "while"):
+                raise ScriptError("unexpected {{ after {}".format(" ".join(words)))
+            body, position = parseCommands(tokens, position, nested = True)
+            commands.append((words, body))
+            words = []
+        elif token == "}":
+            if not nested:
+                raise ScriptError("unexpected }")
+            if words:
+                commands.append((words, None))
+            return commands, position
+        else:
+            words.append(token)
+    if nested:
+        raise ScriptError("missing }")
+    if words:
+        commands.append((words, None))
+    return commands, position
+
+
+def parseValue(text):
+    """
+    Parses "%B0101", "%XFF", "%D-3" or plain decimal to 16 bit value
+    """
+    bases = {"%B": 2, "%X": 16, "%D": 10}
+    if text[:2] in bases:
+        return int(text[2:], bases[text[:2]]) & WORD_MASK
+    return int(text) & WORD_MASK
+
+
+def parseVariable(name):
+    """
+    Parses "RAM[16]" to ("RAM", 16), "PC[]" and "A" to (name, None)
+    """
+    match = VARIABLE.fullmatch(name)
+    if match is None:
+        raise ScriptError("invalid variable {}".format(name))
+    return match.group(1), int(match.group(2)) if match.group(2) else None
+
+
+def matchLine(expected, actual):
+    """
+    Compares output line with line of .cmp file, where "*" matches any character
+    """
+    if expected == actual:
+        return True
+    return len(expected) == len(actual) and all(e == "*" or e == a for e, a in zip(expected, actual))
+
+
+class OutputColumn:
+    """
+    Column of output-list given as name%<format><left>.<width>.<right>,
+    format is B(inary), D(ecimal), X (hexadecimal) or S(tring)
+    """
+    def __init__(self, spec):
+        match = COLUMN.fullmatch(spec)
+        if match is None:
+            raise ScriptError("invalid output column {}".format(spec))
+        self.name = match.group(1)
+        self.format = match.group(2)
+        self.left, self.width, self.right = (int(group) for group in match.group(3, 4, 5))
+
+    def header(self):
+        # name is truncated to column width and centered
+        width = self.left + self.width + self.right
+        name = self.name[:width]
+        padding = width - len(name)
+        return " " * (padding // 2) + name + " " * (padding - padding // 2)
+
+    def cell(self, value):
+        if self.format == "S":
+            text = str(value).ljust(self.width)
+        elif self.format == "D":
+            text = str(toSigned(value & WORD_MASK)).rjust(self.width)
+        elif self.format == "B":
+            text = format(value & WORD_MASK, "016b")[-self.width:].rjust(self.width, "0")
+        else:
+            text = format(value & WORD_MASK, "04X")[-self.width:].rjust(self.width, "0")
+        return " " * self.left + text + " " * self.right
+
+# End of class OutputColumn
+
+
+class ClockedModel:
+    """
+    Time of chip simulation, tick starts clock cycle (time "n+") and tock
+    ends it (time "n+1")
+    """
+    def __init__(self):
+        self.time = 0
+        self.half = False
+
+    def timeText(self):
+        return "{}+".format(self.time) if self.half else str(self.time)
+
+    def command(self, words, directory):
+        if words == ["tick"]:
+            self.tick()
+            self.half = True
+        elif words == ["tock"]:
+            self.tock()
+            self.time += 1
+            self.half = False
+        elif words == ["eval"]:
+            self.evaluate()
+        else:
+            raise ScriptError("unknown command {}".format(" ".join(words)))
+        return None
+
+    def evaluate(self):
+        return None
+
+    def tick(self):
+        return None
+
+    def tock(self):
+        return None
+
+# End of class ClockedModel
+
+
+class ComputerChip(ClockedModel):
+    """
+    Computer.hdl, CPU with ROM32K and memory, executed by Emulator. Whole
+    instruction is executed on tick, so registers and RAM16K hold new
+    values when script outputs them after tock.
+    """
+    def __init__(self):
+        super().__init__()
+        self.emulator = Emulator()
+        self.reset = 0
+
+    def get(self, name):
+        variable, index = parseVariable(name)
+        emulator = self.emulator
+        values = {
+            "time": self.timeText,
+            "reset": lambda: self.reset,
+            "ARegister": lambda: emulator.A,
+            "DRegister": lambda: emulator.D,
+            "PC": lambda: emulator.PC,
+            "RAM16K": lambda: emulator[index],
+            "ROM32K": lambda: emulator.rom[index] if index < len(emulator.rom) else 0
+        }
+        if variable not in values:
+            raise ScriptError("unknown variable {}".format(name))
+        return values[variable]()
+
+    def set(self, name, value):
+        variable, index = parseVariable(name)
+        emulator = self.emulator
+        if variable == "reset":
+            self.reset = value & 1
+        elif variable == "ARegister":
+            emulator.A = value
+        elif variable == "DRegister":
+            emulator.D = value
+        elif variable == "PC":
+            emulator.PC = value & ADDRESS_MASK
+        elif variable == "RAM16K":
+            emulator[index] = value
+        else:
+            raise ScriptError("variable {} can not be set".format(name))
+        return None
+
+    def command(self, words, directory):
+        if words[:2] == ["ROM32K", "load"] and len(words) == 3:
+            self.emulator.loadRom(loadProgram(directory.joinpath(words[2])))
+            return None
+        return super().command(words, directory)
+
+    def tick(self):
+        # reset does not stop instruction from writing registers and memory
+        self.emulator.run(1, stopOnHalt = False)
+        if self.reset:
+            self.emulator.PC = 0
+        return None
+
+# End of class ComputerChip
+
+
+class CpuChip(ClockedModel):
+    """
+    CPU.hdl with inputs inM, instruction and reset. Registers store new
+    values on tick, outputs addressM and pc follow them on tock, outM and
+    writeM are combinational.
+    """
+    def __init__(self):
+        super().__init__()
+        self.inputs = {"inM": 0, "instruction": 0, "reset": 0}
+        self.A = self.D = self.PC = 0
+        self.outA = self.outD = self.outPC = 0
+
+    def aluOut(self):
+        entry = decodeInstruction(self.inputs["instruction"])
+        if entry.__class__ is int:
+            return entry, 0
+        comp, usesM, _, _, destM, _ = entry
+        return comp(self.outD, self.inputs["inM"] if usesM else self.outA), int(destM)
+
+    def get(self, name):
+        variable, _ = parseVariable(name)
+        values = {
+            "time": self.timeText,
+            "outM": lambda: self.aluOut()[0],
+            "writeM": lambda: self.aluOut()[1],
+            "addressM": lambda: self.outA & ADDRESS_MASK,
+            "pc": lambda: self.outPC,
+            "ARegister": lambda: self.A,
+            "DRegister": lambda: self.D,
+            "PC": lambda: self.PC
+        }
+        if variable in self.inputs:
+            return self.inputs[variable]
+        if variable not in values:
+            raise ScriptError("unknown variable {}".format(name))
+        return values[variable]()
+
+    def set(self, name, value):
+        variable, _ = parseVariable(name)
+        if variable not in self.inputs:
+            raise ScriptError("variable {} can not be set".format(name))
+        self.inputs[variable] = value
+        return None
+
+    def tick(self):
+        entry = decodeInstruction(self.inputs["instruction"])
+        nextPC = (self.outPC + 1) & WORD_MASK
+        if entry.__class__ is int:
+            self.A = entry
+        else:
+            _, _, destA, destD, _, jumpTable = entry
+            out, _ = self.aluOut()
+            if destA:
+                self.A = out
+            if destD:
+                self.D = out
+            if jumpTable is not None and jumpTable[out]:
+                nextPC = self.outA & ADDRESS_MASK
+        self.PC = 0 if self.inputs["reset"] else nextPC
+        return None
+
+    def tock(self):
+        self.outA, self.outD, self.outPC = self.A, self.D, self.PC
+        return None
+
+# End of class CpuChip
+
+
+class HdlChip(ClockedModel):
+    """
+    Chip simulated from its HDL file by HdlSimulator, memory part is
+    loaded by "<part> load <file>" (e.g. "ROM32K load Add.hack")
+    """
+    def __init__(self, inFilePath, cacheDirectory = None):
+        super().__init__()
+        self.simulator = HdlSimulator(loadNetlist(inFilePath, cacheDirectory))
+
+    def get(self, name):
+        if name == "time":
+            return self.timeText()
+        try:
+            return self.simulator.get(name)
+        except ValueError as error:
+            raise ScriptError(str(error))
+
+    def set(self, name, value):
+        try:
+            self.simulator.set(name, value)
+        except ValueError as error:
+            raise ScriptError(str(error))
+        return None
+
+    def command(self, words, directory):
+        if len(words) == 3 and words[1] == "load":
+            self.simulator.loadMemory(words[0], loadProgram(directory.joinpath(words[2])))
+            return None
+        return super().command(words, directory)
+
+    def evaluate(self):
+        return self.simulator.evaluate()
+
+    def tick(self):
+        return self.simulator.tick()
+
+    def tock(self):
+        return self.simulator.tock()
+
+# End of class HdlChip
+
+
+# behavioral models of chips, used when HDL file is missing
+CHIP_MODELS = {
+    "Computer": ComputerChip,
+    "CPU": CpuChip
+}
+
+
+class CpuEmulatorModel:
+    """
+    CPU emulator running .asm or .hack program, variables are RAM[n], A,
+    D, PC and time (executed instructions)
+    """
+    def __init__(self, rom):
+        self.emulator = Emulator(rom)
+        self.time = 0
+
+    def get(self, name):
+        variable, index = parseVariable(name)
+        emulator = self.emulator
+        values = {
+            "time": lambda: str(self.time),
+            "RAM": lambda: emulator[index],
+            "ROM": lambda: emulator.rom[index] if index < len(emulator.rom) else 0,
+            "A": lambda: emulator.A,
+            "D": lambda: emulator.D,
+            "PC": lambda: emulator.PC
+        }
+        if variable not in values:
+            raise ScriptError("unknown variable {}".format(name))
+        return values[variable]()
+
+    def set(self, name, value):
+        variable, index = parseVariable(name)
+        emulator = self.emulator
+        if variable == "RAM":
+            emulator[index] = value
+        elif variable == "A":
+            emulator.A = value
+        elif variable == "D":
+            emulator.D = value
+        elif variable == "PC":
+            emulator.PC = value & ADDRESS_MASK
+        else:
+            raise ScriptError("variable {} can not be set".format(name))
+        return None
+
+    def ticktock(self, count):
+        """
+        Executes count instructions in single emulator run
+        """
+        emulator = self.emulator
+        executed = emulator.run(count)
+        # halt loop "@n, 0;JMP" changes only PC, so only parity of
+        # remaining instructions matters
+        if emulator.halted and (count - executed) % 2:
+            emulator.run(1, stopOnHalt = False)
+        emulator.halted = False
+        self.time += count
+        return None
+
+    def command(self, words, directory):
+        if words != ["ticktock"]:
+            raise ScriptError("unknown command {}".format(" ".join(words)))
+        return self.ticktock(1)
+
+# End of class CpuEmulatorModel
+
+
+def translateVm(inFilePath):
+    """
+    Translates single .vm file with VM translator of project 7, returns
+    assembly text
+    """
+    global __vmTranslator
+    if __vmTranslator is None:
+        if not VM_TRANSLATOR_PATH.exists():
+            raise UnsupportedScript("VM translator {} not found".format(VM_TRANSLATOR_PATH))
+        # translator configures logging to file on import, handler of root
+        # logger keeps it from creating log file in working directory
+        if not logging.getLogger().handlers:
+            logging.getLogger().addHandler(logging.NullHandler())
+        spec = importlib.util.spec_from_file_location("vmTranslator", VM_TRANSLATOR_PATH)
+        __vmTranslator = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(__vmTranslator)
+    with open(inFilePath) as inFile:
+        lines = inFile.readlines()
+    return "\n".join(__vmTranslator.Parser(lines, Path(inFilePath).stem).parse())
+
+
+def loadModel(path, cacheDirectory = None):
+    """
+    Returns model for "load" command of script: HDL simulation of .hdl
+    (behavioral model when there is no such file), CPU emulator for .asm
+    and .hack. Missing .hack is assembled from .asm and missing .asm is
+    translated from .vm file of the same name.
+    """
+    if path.suffix == ".hdl":
+        if path.exists():
+            return HdlChip(path, cacheDirectory)
+        if path.stem not in CHIP_MODELS:
+            raise UnsupportedScript("no model of chip {}".format(path.stem))
+        return CHIP_MODELS[path.stem]()
+    if path.suffix == ".hack" and not path.exists() and path.with_suffix(".asm").exists():
+        path = path.with_suffix(".asm")
+    if path.suffix == ".asm" and not path.exists() and path.with_suffix(".vm").exists():
+        words, _ = assemble(translateVm(path.with_suffix(".vm")))
+        return CpuEmulatorModel(words)
+    if path.suffix in (".asm", ".hack"):
+        if not path.exists():
+            raise ScriptError("{} not found".format(path.name))
+        return CpuEmulatorModel(loadProgram(path))
+    raise UnsupportedScript("VM emulator scripts are not supported")
+
+
+class TestScript:
+    """
+    Interpreter of test script, output lines are collected in lines
+    """
+    def __init__(self, inFilePath, cacheDirectory = None):
+        self.path = Path(inFilePath)
+        self.cacheDirectory = cacheDirectory
+        self.directory = self.path.resolve().parent
+        self.commands, _ = parseCommands(tokenize(self.path.read_text()))
+        self.model = None
+        self.columns = []
+        self.lines = []
+        self.outputFile = None
+        self.compareFile = None
+
+    def run(self):
+        self.execute(self.commands)
+        return self.lines
+
+    def execute(self, commands):
+        for words, body in commands:
+            if body is None:
+                self.command(words)
+            elif words[0] == "repeat":
+                self.repeat(words, body)
+            else:
+                if all(bodyWords == ["eval"] for bodyWords, _ in body):
+                    # only input of user can change result of eval
+                    raise UnsupportedScript("while loop waits for interactive input")
+                while self.condition(words[1:]):
+                    self.execute(body)
+        return None
+
+    def repeat(self, words, body):
+        if len(words) == 1:
+            raise UnsupportedScript("endless repeat needs interactive simulator")
+        count = int(words[1])
+        if body == [(["ticktock"], None)] and hasattr(self.model, "ticktock"):
+            # common "repeat n { ticktock; }" is single emulator run
+            self.model.ticktock(count)
+        else:
+            for _ in range(count):
+                self.execute(body)
+        return None
+
+    def condition(self, words):
+        if len(words) != 3 or words[1] not in CONDITIONS:
+            raise ScriptError("invalid condition {}".format(" ".join(words)))
+        x, y = (toSigned(self.operand(word)) for word in (words[0], words[2]))
+        return CONDITIONS[words[1]](x, y)
+
+    def operand(self, word):
+        try:
+            return parseValue(word)
+        except ValueError:
+            return self.requireModel().get(word)
+
+    def requireModel(self):
+        if self.model is None:
+            raise ScriptError("nothing is loaded")
+        return self.model
+
+    def command(self, words):
+        name = words[0]
+        if name == "load":
+            if len(words) == 1:
+                raise UnsupportedScript("VM emulator scripts are not supported")
+            self.model = loadModel(self.directory.joinpath(words[1]), self.cacheDirectory)
+        elif name == "output-file":
+            self.outputFile = self.directory.joinpath(words[1])
+        elif name == "compare-to":
+            self.compareFile = self.directory.joinpath(words[1])
+        elif name == "output-list":
+            self.columns = [OutputColumn(spec) for spec in words[1:]]
+            self.lines.append("|" + "|".join(column.header() for column in self.columns) + "|")
+        elif name == "output":
+            model = self.requireModel()
+            self.lines.append("|" + "|".join(column.cell(model.get(column.name))
+                                             for column in self.columns) + "|")
+        elif name == "set":
+            if len(words) != 3:
+                raise ScriptError("invalid command {}".format(" ".join(words)))
+            self.requireModel().set(words[1], parseValue(words[2]))
+        elif name in ("echo", "clear-echo"):
+            pass
+        else:
+            self.requireModel().command(words, self.directory)
+        return None
+
+# End of class TestScript
+
+
+def runScript(task):
+    """
+    Runs single script and compares its output, runs in worker process.
+    Status is "passed", "failed", "skipped" (unsupported script or no
+    compare file) or "error". Netlists of HDL chips are cached in
+    cacheDirectory, when given.
+    """
+    inFilePath, writeOutput, cacheDirectory = task
+    result = {
+        "script": str(inFilePath),
+        "status": None,
+        "message": None,
+        "lines": None,
+        "timeMs": None
+    }
+    tick = time.perf_counter()
+    try:
+        script = TestScript(inFilePath, cacheDirectory)
+        lines = script.run()
+        result["lines"] = len(lines)
+        if writeOutput and script.outputFile is not None:
+            script.outputFile.write_text("\n".join(lines) + "\n")
+        if script.compareFile is None:
+            result["status"] = "skipped"
+            result["message"] = "no compare-to file"
+        else:
+            expectedLines = script.compareFile.read_text().splitlines()
+            result["status"] = "passed"
+            for number, (expected, actual) in enumerate(zip(expectedLines, lines), start = 1):
+                if not matchLine(expected.rstrip(), actual):
+                    result["status"] = "failed"
+                    result["message"] = "line {}: expected '{}', got '{}'".format(number, expected.rstrip(), actual)
+                    break
+            else:
+                if len(expectedLines) != len(lines):
+                    result["status"] = "failed"
+                    result["message"] = "output has {} lines, {} has {}".format(
+                        len(lines), script.compareFile.name, len(expectedLines))
+    except UnsupportedScript as error:
+        result["status"] = "skipped"
+        result["message"] = str(error)
+    except Exception as error:
+        result["status"] = "error"
+        result["message"] = ": ".join([type(error).__name__] + [str(error)] * bool(str(error)))
+    result["timeMs"] = round((time.perf_counter() - tick) * 1000, 3)
+    return result
+
+
+def collectScripts(patterns):
+    """
+    Expands directories (recursively) and glob patterns to sorted list of .tst files
+    """
+    scripts = set()
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            scripts.update(path.rglob("*.tst"))
+        elif path.is_file():
+            scripts.add(path)
+        else:
+            scripts.update(Path(match) for match in glob.glob(pattern, recursive = True)
+                           if match.endswith(".tst"))
+    return sorted(script.resolve() for script in scripts)
+
+
+def runScripts(scripts, writeOutput = False, cacheDirectory = None, jobs = None):
+    """
+    Runs all scripts in process pool, returns summary dict
+    """
+    tick = time.perf_counter()
+    tasks = [(script, writeOutput, cacheDirectory) for script in scripts]
+    if jobs == 1:
+        results = [runScript(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers = jobs) as executor:
+            results = list(executor.map(runScript, tasks))
+    summary = {"scripts": len(results)}
+    for status in ("passed", "failed", "skipped", "error"):
+        summary[status] = sum(1 for result in results if result["status"] == status)
+    summary["timeMs"] = round((time.perf_counter() - tick) * 1000, 3)
+    summary["results"] = results
+    return summary
+
+
+def main():
+    argumentParser = argparse.ArgumentParser(description = "Runs .tst test scripts and compares output with .cmp files.")
+    argumentParser.add_argument("inputs", metavar = "input", type = str, nargs = "*",
+                                help = "directories, .tst files or glob patterns, default is whole repository")
+    argumentParser.add_argument("--jobs", type = int, default = None,
+                                help = "number of worker processes, default is number of cores")
+    argumentParser.add_argument("--json", action = "store_const", const = True,
+                                help = "print JSON summary instead of text")
+    argumentParser.add_argument("--write-output", action = "store_const", const = True,
+                                help = "write output of every script to its output-file")
+    argumentParser.add_argument("--cache", type = str, default = None, metavar = "DIR",
+                                help = "directory of cached netlists of HDL chips")
+
+    args = vars(argumentParser.parse_args())
+    inputs = args["inputs"] or [str(Path(__file__).resolve().parent.parent)]
+    summary = runScripts(collectScripts(inputs), bool(args["write_output"]), args["cache"], args["jobs"])
+
+    if args["json"]:
+        print(json.dumps(summary, indent = 2))
+    else:
+        for result in summary["results"]:
+            print("{:<8} {}{}".format(result["status"], result["script"],
+                                      ": " + result["message"] if result["message"] else ""))
+        print("{} scripts: {} passed, {} failed, {} skipped, {} errors in {} ms".format(
+            summary["scripts"], summary["passed"], summary["failed"], summary["skipped"],
+            summary["error"], int(summary["timeMs"])))
+    return 1 if summary["failed"] or summary["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,112 @@
+"""
+Instruction count benchmark of vm translator. Every program is translated
+in each code generation mode, assembled and run on emulator of project 6
+until it reaches its end. Final memory of every mode is compared with
+baseline mode.
+"""
+import argparse
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("06")))
+from assembler import assemble
+from emulator import Emulator
+
+from vmTranslator import Parser
+
+# translator options of benchmarked modes
+MODES = {
+    "baseline": {},
+    "cacheTop": {"cacheTop": True},
+    "sharedCompare": {"shareComparisons": True},
+    "cacheShared": {"cacheTop": True, "shareComparisons": True},
+    "fused": {"fuse": True},
+    "cacheFused": {"cacheTop": True, "fuse": True}
+}
+# stack and segment pointers as set by test scripts of project 7
+INITIAL_RAM = {0: 256, 1: 300, 2: 400, 3: 3000, 4: 3010}
+STACK_END = 2048
+MAX_CYCLES = 10_000_000
+END_LABEL = "VM_BENCHMARK_END"
+
+
+def countCommands(lines):
+    return sum(1 for line in lines if line.strip() and not line.strip().startswith("//"))
+
+
+def runTranslated(lines, fileName, **options):
+    """
+    Translates, assembles and runs program until its end, returns (ROM
+    words, executed instructions, memory). Memory is dict of nonzero RAM
+    words outside of scratch registers, variables and free stack, plus
+    static variables by name, because translator variables may get
+    different addresses in each mode.
+    """
+    program = Parser(lines, fileName, **options).parse()
+    program.append("({})\n@{}\n0;JMP\n".format(END_LABEL, END_LABEL))
+    words, symbolTable = assemble(program)
+    hack = Emulator(words)
+    for address, value in INITIAL_RAM.items():
+        hack[address] = value
+    cycles = hack.run(MAX_CYCLES)
+    if not hack.halted:
+        raise ValueError("{} did not finish in {} instructions".format(fileName, MAX_CYCLES))
+    # stack above SP is dead and R13-R15 are scratch registers of
+    # translator, modes may leave different values there. Free stack ends
+    # at first segment placed above it
+    stackPointer = hack[0]
+    stackEnd = min([hack[pointer] for pointer in range(1, 5) if hack[pointer] > stackPointer] + [STACK_END])
+    memory = {address: value for address, value in enumerate(hack.ram)
+              if value and not 13 <= address < 256 and not stackPointer <= address < stackEnd}
+    for name, address in symbolTable.symbolsDict.items():
+        if name.startswith(fileName + "."):
+            memory[name] = hack[address]
+    # end loop is not part of program
+    return len(words) - 2, cycles - 2, memory
+
+
+def benchmark(inFilePaths, modes = MODES):
+    """
+    Returns list of (program, commands, mode, ROM words, cycles, same
+    memory as baseline) rows
+    """
+    rows = []
+    for inFilePath in inFilePaths:
+        lines = Path(inFilePath).read_text().splitlines()
+        commands = countCommands(lines)
+        baseline = None
+        for mode, options in modes.items():
+            romWords, cycles, memory = runTranslated(lines, Path(inFilePath).stem, **options)
+            if baseline is None:
+                baseline = memory
+            rows.append((Path(inFilePath).stem, commands, mode, romWords, cycles, memory == baseline))
+    return rows
+
+
+def main():
+    argumentParser = argparse.ArgumentParser(description = "Instruction count benchmark of vm translator.")
+    argumentParser.add_argument("inputFiles", metavar = "inFile", type = str, nargs = "*",
+                                help = "vm programs, default are test programs of project 7")
+    args = vars(argumentParser.parse_args())
+    inFilePaths = args["inputFiles"] or sorted(Path(__file__).resolve().parent.rglob("*.vm"))
+
+    rows = benchmark(inFilePaths)
+    print("{:<16} {:>8} {:<13} {:>8} {:>8} {:>10}  {}".format(
+        "program", "commands", "mode", "ROM", "cycles", "cycles/op", "result"))
+    for program, commands, mode, romWords, cycles, same in rows:
+        print("{:<16} {:>8} {:<13} {:>8} {:>8} {:>10.1f}  {}".format(
+            program, commands, mode, romWords, cycles, cycles / commands, "ok" if same else "DIFFERS"))
+    print()
+    baseline = None
+    for mode in MODES:
+        romWords = sum(row[3] for row in rows if row[2] == mode)
+        cycles = sum(row[4] for row in rows if row[2] == mode)
+        if baseline is None:
+            baseline = (romWords, cycles)
+        print("{:<13} ROM {:>7} ({:>5.1f}%)  cycles {:>8} ({:>5.1f}%)".format(
+            mode, romWords, 100 * romWords / baseline[0], cycles, 100 * cycles / baseline[1]))
+    return 0 if all(row[5] for row in rows) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -10,10 +10,28 @@ logging.basicConfig(filename = "./vmTranslator.log",
     format = "%(asctime)s - %(levelname)s: %(message)s",
     level = logging.DEBUG)
 
+# hack comps of fused operations, with constant y: (x in D and y in A,
+# x in M and y in D), with operands: x in D and y in M
+CONSTANT_COMPUTATIONS = {
+    "add": ("D+A", "D+M"),
+    "sub": ("D-A", "M-D"),
+    "and": ("D&A", "D&M"),
+    "or": ("D|A", "D|M")
+}
+OPERAND_COMPUTATIONS = {"add": "D+M", "sub": "D-M", "and": "D&M", "or": "D|M"}
+COMPARISON_CONDITIONS = {"eq": "JEQ", "gt": "JGT", "lt": "JLT"}
+
 class Stack:
-    def __init__(self):
+    """
+    With cacheTop, value pushed last is kept in D register instead of
+    memory, it is written to the stack only when next value is pushed
+    or on flush
+    """
+    def __init__(self, *, cacheTop = False):
         self.__stackLength = 0
         self.__pointer = "SP"
+        self.__cacheTop = cacheTop
+        self.__topInD = False
 
     def __increaseStackPointer(self) -> str:
         command = "@{}\nM=M+1\n".format(self.__pointer)
@@ -48,6 +66,10 @@ class Stack:
         """
         We place poped value to D register
         """
+        if self.__topInD:
+            self.__topInD = False
+            self.__stackLength -= 1
+            return ""
         command = ""
         command += self.__decreaseStackPinter()
         command += self.__dereferencePointer()
@@ -57,6 +79,72 @@ class Stack:
         """
         We assume the value we wish to push is located in D register
         """
+        if self.__cacheTop:
+            if self.__topInD:
+                logging.error("pushing over cached top of stack, flush is missing")
+                raise ValueError
+            self.__topInD = True
+            self.__stackLength += 1
+            return ""
+        command = ""
+        command += self.__injectToAddress()
+        command += self.__increaseStackPointer()
+        return command
+
+    def operateOnTop(self, operator):
+        """
+        Replaces top of stack with unary operator ("-" or "!") applied to
+        it, in place
+        """
+        if self.__topInD:
+            return "D={}D\n".format(operator)
+        command = "@{}\nA=M-1\nM={}M\n".format(self.__pointer, operator)
+        return command
+
+    def combineTopTwo(self, computation):
+        """
+        Replaces two values on top of stack with computation of them, in
+        place. Computation is hack comp with x (below top) in M and y (top)
+        in D, e.g. "M-D"
+        """
+        self.__stackLength -= 1
+        logging.debug("SP: {}".format(self.__stackLength))
+        if self.__topInD:
+            # result stays cached in D
+            return "@{}\nAM=M-1\nD={}\n".format(self.__pointer, computation)
+        command = "@{}\nAM=M-1\nD=M\nA=A-1\nM={}\n".format(self.__pointer, computation)
+        return command
+
+    def combineTopWithConstant(self, constant, cachedComputation, computation):
+        """
+        Replaces top of stack x with computation of x and constant y, in
+        place. cachedComputation has x in D and y in A (e.g. "D-A"),
+        computation has x in M and y in D (e.g. "M-D")
+        """
+        if self.__topInD:
+            return "@{}\nD={}\n".format(constant, cachedComputation)
+        command = "@{}\nD=A\n@{}\nA=M-1\nM={}\n".format(constant, self.__pointer, computation)
+        return command
+
+    def replaceTopTwo(self):
+        """
+        Used before calling code which replaces two values on top of stack
+        with one in memory, cached top is written to memory first
+        """
+        command = self.flush()
+        self.__stackLength -= 1
+        logging.debug("SP: {}".format(self.__stackLength))
+        return command
+
+    def flush(self):
+        """
+        Writes cached top of stack to memory, must precede any command
+        which changes D register while top is cached
+        """
+        if not self.__topInD:
+            return ""
+        self.__topInD = False
+        self.__stackLength -= 1
         command = ""
         command += self.__injectToAddress()
         command += self.__increaseStackPointer()
@@ -83,6 +171,10 @@ class MemorySegmentManager:
     """
     docstring
     """
+    # numeric offsets up to these limits are reached by incrementing A
+    # register (A=M+1, A=A+1...), larger ones by adding offset to base
+    GET_CHAIN_LIMIT = 2
+    SET_CHAIN_LIMIT = 6
 
     def __init__(self, fileName, *, tempAddress = 5) -> None:
         self.__fileName = fileName
@@ -141,6 +233,34 @@ class MemorySegmentManager:
         command += self.__readFromPointer(aux0)
         return command
 
+    def __offsetAddress(self, segment, numOffset):
+        """
+        Places segment base + offset to A register, D register is kept
+        only for offsets up to SET_CHAIN_LIMIT
+        """
+        if numOffset == 0:
+            return "@{}\nA=M\n".format(segment)
+        if numOffset <= self.SET_CHAIN_LIMIT:
+            return "@{}\nA=M+1\n".format(segment) + "A=A+1\n" * (numOffset - 1)
+        return "@{}\nD=A\n@{}\nA=D+M\n".format(numOffset, segment)
+
+    def __offsetGetSegment(self, segment, numOffset):
+        if numOffset <= self.GET_CHAIN_LIMIT:
+            return self.__offsetAddress(segment, numOffset) + "D=M\n"
+        return "@{}\nD=A\n@{}\nA=D+M\nD=M\n".format(numOffset, segment)
+
+    def __offsetSetSegment(self, segment, numOffset):
+        if numOffset <= self.SET_CHAIN_LIMIT:
+            return self.__offsetAddress(segment, numOffset) + "M=D\n"
+        # value is spilled while address is computed
+        command = ""
+        command += self.__writeToAddress("R13")
+        command += self.__resolveAddress(segment, numOffset)
+        command += self.__writeToAddress("R14")
+        command += self.__readFromAddress("R13")
+        command += self.__writeToPointer("R14")
+        return command
+
     def __constGetSegment(self, offset):
         command = ""
         command += self.__readValue(offset)
@@ -208,6 +328,8 @@ class MemorySegmentManager:
         """
         if rawSegment in self.__segmentsConverterDict.keys():
             segment = self.__segmentsConverterDict[rawSegment]
+            if offset.isdigit():
+                return self.__offsetSetSegment(segment, int(offset))
             return self.__genericSetSegment(segment, offset)
         elif rawSegment == SegmentType.STATIC_SEGMENT:
             return self.__staticSetSegment(offset)
@@ -225,6 +347,8 @@ class MemorySegmentManager:
         """
         if rawSegment in self.__segmentsConverterDict.keys():
             segment = self.__segmentsConverterDict[rawSegment]
+            if offset.isdigit():
+                return self.__offsetGetSegment(segment, int(offset))
             return self.__genericGetSegment(segment, offset)
         elif rawSegment == SegmentType.CONST_SEGMENT:
             return self.__constGetSegment(offset)
@@ -238,6 +362,24 @@ class MemorySegmentManager:
             logging.error("invalid segment passed")
             raise ValueError
 
+    def popToSegment(self, rawSegment, offset, popCommand):
+        """
+        Moves value from top of stack to given segment and offset,
+        popCommand places value to D register, it is empty when value is
+        already there. For large offsets address is computed before pop,
+        so value does not have to be spilled.
+        """
+        if (rawSegment in self.__segmentsConverterDict.keys() and popCommand and offset.isdigit()
+                and int(offset) > self.SET_CHAIN_LIMIT):
+            segment = self.__segmentsConverterDict[rawSegment]
+            command = ""
+            command += self.__resolveAddress(segment, offset)
+            command += self.__writeToAddress("R13")
+            command += popCommand
+            command += self.__writeToPointer("R13")
+            return command
+        return popCommand + self.setSegment(rawSegment, offset)
+
     def __auxResolveOffset(self, offset):
         if int(offset) >= len(self.__auxLabels):
             logging.error("invalid Aux offset specified.")
@@ -269,72 +411,26 @@ class MemorySegmentManager:
 # end of class MemorySegmentManager
 
 class OperationsManager:
-    def __init__(self, stack, memorySegmentManager):
+    def __init__(self, stack, memorySegmentManager, *, shareComparisons = False):
         self.__stack = stack
         self.__memorySegmentManager = memorySegmentManager
         self.__labelId = 0
+        self.__shareComparisons = shareComparisons
+        self.__usedComparisons = []
 
     def __getNextLabelId(self):
         nextLabelId = str(self.__labelId)
         self.__labelId += 1
         return nextLabelId
 
-    def __addMemoryRegister(self):
-        command = "D=D+M\n"
-        return command
-
-    def __subMemoryRegister(self):
-        command = "D=D-M\n"
-        return command
-
-    def __logicalAndMemoryRegister(self):
-        command = "D=D&M\n"
-        return command
-
-    def __logicalOrMemoryRegister(self):
-        command = "D=D|M\n"
-        return command
-
-    def __logicalNotMemoryRegister(self):
-        command = "D=!D\n"
-        return command
-    
     def opAdd(self):
-        msm = self.__memorySegmentManager
-        stack = self.__stack
-        command = ""
-        command += stack.pop()
-        command += msm.setAuxValue("0")
-        command += stack.pop()
-        command += msm.setAuxValue("1")
-        command += msm.getAuxValue("0")
-        command += msm.getAuxReference("1")
-        command += self.__addMemoryRegister()
-        command += stack.push()
-        return command
-
+        return self.__stack.combineTopTwo("D+M")
 
     def opSub(self):
-        msm = self.__memorySegmentManager
-        stack = self.__stack
-        command = ""
-        command += stack.pop()
-        command += msm.setAuxValue("0")
-        command += stack.pop()
-        command += msm.setAuxValue("1")
-        command += msm.getAuxValue("1")
-        command += msm.getAuxReference("0")
-        command += self.__subMemoryRegister()
-        command += stack.push()
-        return command
+        return self.__stack.combineTopTwo("M-D")
     
     def opNeg(self):
-        stack = self.__stack
-        command = ""
-        command += stack.pop()
-        command += "D=-D\n"
-        command += stack.push()
-        return command
+        return self.__stack.operateOnTop("-")
 
     def __ifElseBranch(self, labelId, condition):
         if condition not in ["JEQ", "JLT", "JGT"]:
@@ -346,13 +442,10 @@ class OperationsManager:
             labelId, labelId)
         return ifBranch, elseBranch
 
-    def opEq(self):
-        """
-        puts -1 in D registar if equal, else 0
-        """
+    def __inlineCompare(self, condition):
         stack = self.__stack
         ifLabelId = self.__getNextLabelId()
-        ifBranch, elseBranch = self.__ifElseBranch(ifLabelId, "JEQ")
+        ifBranch, elseBranch = self.__ifElseBranch(ifLabelId, condition)
         command = ""
         command += self.opSub()
         command += stack.pop()
@@ -361,76 +454,125 @@ class OperationsManager:
         command += stack.push()
         return command
 
-    
-    def opGt(self):
-        stack = self.__stack
-        ifLabelId = self.__getNextLabelId()
+    def __sharedCompare(self, condition):
+        """
+        Calls comparison subroutine with return address in D register
+        """
+        if condition not in self.__usedComparisons:
+            self.__usedComparisons.append(condition)
+        returnLabel = "CMP_RETURN.{}".format(self.__getNextLabelId())
         command = ""
-        ifBranch, elseBranch = self.__ifElseBranch(ifLabelId, "JGT")
-        command += self.opSub()
-        command += stack.pop()
-        command += ifBranch
-        command += elseBranch
-        command += stack.push()
+        command += self.__stack.replaceTopTwo()
+        command += "@{}\nD=A\n@VM_COMPARE_{}\n0;JMP\n({})\n".format(returnLabel, condition, returnLabel)
         return command
 
-    def opLt(self):
-        stack = self.__stack
-        ifLabelId = self.__getNextLabelId()
-        ifBranch, elseBranch = self.__ifElseBranch(ifLabelId, "JLT")
-        command = ""
-        command += self.opSub()
-        command += stack.pop()
-        command += ifBranch
-        command += elseBranch
-        command += stack.push()
+    def __compare(self, condition):
+        if self.__shareComparisons:
+            return self.__sharedCompare(condition)
+        return self.__inlineCompare(condition)
+
+    def getComparisonSubroutines(self):
+        """
+        Returns code of comparison subroutines which were called, preceded
+        by jump over them. Subroutine saves return address to R13, replaces
+        x and y on top of stack with -1 if x - y meets condition, else 0
+        """
+        if not self.__usedComparisons:
+            return ""
+        command = "@VM_PROGRAM_START\n0;JMP\n"
+        for condition in self.__usedComparisons:
+            command += "(VM_COMPARE_{})\n".format(condition)
+            command += "@R13\nM=D\n@SP\nAM=M-1\nD=M\nA=A-1\nD=M-D\nM=-1\n"
+            command += "@VM_COMPARE_{}_TRUE\nD;{}\n".format(condition, condition)
+            command += "@SP\nA=M-1\nM=0\n"
+            command += "(VM_COMPARE_{}_TRUE)\n@R13\nA=M\n0;JMP\n".format(condition)
+        command += "(VM_PROGRAM_START)\n"
         return command
 
+    def opEq(self):
+        """
+        puts -1 on stack if equal, else 0
+        """
+        return self.__compare("JEQ")
+
+    def opGt(self):
+        return self.__compare("JGT")
+
+    def opLt(self):
+        return self.__compare("JLT")
+
     def opAnd(self):
-        stack = self.__stack
-        msm = self.__memorySegmentManager
-        command = ""
-        command += stack.pop()
-        command += msm.setAuxValue("0")
-        command += stack.pop()
-        command += msm.setAuxValue("1")
-        command += msm.getAuxValue("0")
-        command += msm.getAuxReference("1")
-        command += self.__logicalAndMemoryRegister()
-        command += stack.push()
-        return command
+        return self.__stack.combineTopTwo("D&M")
 
     def opOr(self):
+        return self.__stack.combineTopTwo("D|M")
+
+    def opNot(self):
+        return self.__stack.operateOnTop("!")
+
+    def opConstantOperand(self, operation, value):
+        """
+        Binary operation with constant as second operand (y), x is taken
+        from top of stack
+        """
         stack = self.__stack
-        msm = self.__memorySegmentManager
+        if operation in CONSTANT_COMPUTATIONS:
+            cachedComputation, computation = CONSTANT_COMPUTATIONS[operation]
+            return stack.combineTopWithConstant(value, cachedComputation, computation)
+        ifBranch, elseBranch = self.__ifElseBranch(self.__getNextLabelId(), COMPARISON_CONDITIONS[operation])
         command = ""
         command += stack.pop()
-        command += msm.setAuxValue("0")
-        command += stack.pop()
-        command += msm.setAuxValue("1")
-        command += msm.getAuxValue("0")
-        command += msm.getAuxReference("1")
-        command += self.__logicalOrMemoryRegister()
+        command += "@{}\nD=D-A\n".format(value)
+        command += ifBranch
+        command += elseBranch
         command += stack.push()
         return command
 
-    def opNot(self):
+    def opConstantUnary(self, operation, value):
+        """
+        Pushes neg or not of constant, computed at translation
+        """
+        result = -int(value) if operation == "neg" else ~int(value)
+        if result in (-1, 0):
+            command = "D={}\n".format(result)
+        else:
+            command = "@{}\nD={}A\n".format(value, "-" if operation == "neg" else "!")
+        return self.__stack.flush() + command + self.__stack.push()
+
+    def opOperands(self, operation, getX, getY):
+        """
+        Binary operation on operands read by getX and getY (commands which
+        place value to D register) instead of from stack, y is kept in R13
+        """
         stack = self.__stack
         command = ""
-        command += stack.pop()
-        command += self.__logicalNotMemoryRegister()
+        command += stack.flush()
+        command += getY
+        command += "@R13\nM=D\n"
+        command += getX
+        command += "@R13\n"
+        if operation in OPERAND_COMPUTATIONS:
+            command += "D={}\n".format(OPERAND_COMPUTATIONS[operation])
+        else:
+            ifBranch, elseBranch = self.__ifElseBranch(self.__getNextLabelId(), COMPARISON_CONDITIONS[operation])
+            command += "D=D-M\n"
+            command += ifBranch
+            command += elseBranch
         command += stack.push()
         return command
 
 # end of class OperationsManager
 
 class Parser:
-    def __init__(self, lineList, fileName):
+    def __init__(self, lineList, fileName, *, cacheTop = False, shareComparisons = False, fuse = False):
         self.__lineList = lineList
         self.__fileName = fileName
-        self.__stack = Stack()
+        self.__fuse = fuse
+        self.__shareComparisons = shareComparisons
+        self.__fusionStatistics = {}
+        self.__stack = Stack(cacheTop = cacheTop)
         self.__msm = MemorySegmentManager(fileName)
-        self.__opManager = OperationsManager(self.__stack, self.__msm)
+        self.__opManager = OperationsManager(self.__stack, self.__msm, shareComparisons = shareComparisons)
         self.__validStackOps = ["push", "pop"]
         self.__validALOps = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]
         self.__validMemorySegments = ["argument", "local", "static", "constant",
@@ -438,17 +580,29 @@ class Parser:
         self.__memoryOpDict = None
         self.__stackOpDict = None
         self.__alOpDict = None
+        self.__fusionPatterns = None
+        self.__segmentTypes = {
+            "argument" : SegmentType.ARG_SEGMENT,
+            "local" : SegmentType.LCL_SEGMENT,
+            "static" : SegmentType.STATIC_SEGMENT,
+            "constant" : SegmentType.CONST_SEGMENT,
+            "this" : SegmentType.THIS_SEGMENT,
+            "that" : SegmentType.THAT_SEGMENT,
+            "pointer" : SegmentType.POINTER_SEGMENT,
+            "temp" : SegmentType.TEMP_SEGMENT
+        }
 
     def __getMemoryOpDict(self):
         if self.__memoryOpDict is None:
+            pop = self.__stack.pop
             memoryOpDictSet = {
-                "argument" : lambda offset: self.__msm.setSegment(SegmentType.ARG_SEGMENT, offset),
-                "local" : lambda offset: self.__msm.setSegment(SegmentType.LCL_SEGMENT, offset),
-                "static" : lambda offset: self.__msm.setSegment(SegmentType.STATIC_SEGMENT, offset),
-                "this" : lambda offset: self.__msm.setSegment(SegmentType.THIS_SEGMENT, offset),
-                "that" : lambda offset: self.__msm.setSegment(SegmentType.THAT_SEGMENT, offset),
-                "pointer" : lambda offset: self.__msm.setSegment(SegmentType.POINTER_SEGMENT, offset),
-                "temp" : lambda offset: self.__msm.setSegment(SegmentType.TEMP_SEGMENT, offset)
+                "argument" : lambda offset: self.__msm.popToSegment(SegmentType.ARG_SEGMENT, offset, pop()),
+                "local" : lambda offset: self.__msm.popToSegment(SegmentType.LCL_SEGMENT, offset, pop()),
+                "static" : lambda offset: self.__msm.popToSegment(SegmentType.STATIC_SEGMENT, offset, pop()),
+                "this" : lambda offset: self.__msm.popToSegment(SegmentType.THIS_SEGMENT, offset, pop()),
+                "that" : lambda offset: self.__msm.popToSegment(SegmentType.THAT_SEGMENT, offset, pop()),
+                "pointer" : lambda offset: self.__msm.popToSegment(SegmentType.POINTER_SEGMENT, offset, pop()),
+                "temp" : lambda offset: self.__msm.popToSegment(SegmentType.TEMP_SEGMENT, offset, pop())
             }
 
             memoryOpDictGet = {
@@ -495,6 +649,76 @@ class Parser:
             self.__alOpDict = alOpDict
         return self.__alOpDict.copy()
 
+    def __isPush(self, words):
+        return len(words) == 3 and words[0] == "push" and words[1] in self.__validMemorySegments
+
+    def __isPushConstant(self, words):
+        return self.__isPush(words) and words[1] == "constant"
+
+    def __isPop(self, words):
+        return len(words) == 3 and words[0] == "pop" and words[1] in self.__validMemorySegments \
+            and words[1] != "constant"
+
+    def __getSegmentValue(self, words):
+        return self.__msm.getSegment(self.__segmentTypes[words[1]], words[2])
+
+    def __moveSegment(self, push, pop):
+        command = ""
+        command += self.__stack.flush()
+        command += self.__getSegmentValue(push)
+        command += self.__msm.setSegment(self.__segmentTypes[pop[1]], pop[2])
+        return command
+
+    def __getFusionPatterns(self):
+        """
+        Returns list of (name, command matchers, emitter) for fused command
+        sequences, longer patterns first. Emitter gets words of matched
+        commands.
+        """
+        if self.__fusionPatterns is None:
+            opManager = self.__opManager
+            binaryOps = list(CONSTANT_COMPUTATIONS)
+            if not self.__shareComparisons:
+                # shared subroutine call is smaller than fused comparison
+                binaryOps += list(COMPARISON_CONDITIONS)
+            isBinaryOp = lambda words: len(words) == 1 and words[0] in binaryOps
+            self.__fusionPatterns = [
+                ("operands",
+                    (self.__isPush, lambda words: self.__isPush(words) and not self.__isPushConstant(words),
+                     isBinaryOp),
+                    lambda x, y, op: opManager.opOperands(op[0], self.__getSegmentValue(x), self.__getSegmentValue(y))),
+                ("constant operand",
+                    (self.__isPushConstant, isBinaryOp),
+                    lambda y, op: opManager.opConstantOperand(op[0], y[2])),
+                ("constant unary",
+                    (self.__isPushConstant, lambda words: words in (["neg"], ["not"])),
+                    lambda x, op: opManager.opConstantUnary(op[0], x[2])),
+                ("move",
+                    (self.__isPush, self.__isPop),
+                    self.__moveSegment)
+            ]
+        return self.__fusionPatterns
+
+    def __fuseLines(self, lines):
+        """
+        Matches fusion patterns against window of lines starting with
+        first one, returns (command, matched line count) or None
+        """
+        words = [line.split() for line in lines]
+        for name, matchers, emitter in self.__getFusionPatterns():
+            if len(words) < len(matchers):
+                continue
+            if all(match(commandWords) for match, commandWords in zip(matchers, words)):
+                self.__fusionStatistics[name] = self.__fusionStatistics.get(name, 0) + 1
+                return emitter(*words[:len(matchers)]), len(matchers)
+        return None
+
+    def getFusionStatistics(self):
+        """
+        Returns dict of fusion pattern name to number of fused sequences
+        """
+        return self.__fusionStatistics.copy()
+
     def __shouldBeProcessed(self, line):
         line = line.strip()
         if line == "":
@@ -527,15 +751,16 @@ class Parser:
                 logging.error("invalid memory segment on line: {}".format(lineNumber))
                 raise ValueError
             
-            # check if order is ok, for instance if we do:
+            # for instance if we do:
             #       > pop local 0
             # we pop from stack to D register and and set
             # local segment with offset 0 to value from D
-            # register (previous value poped from stack)
+            # register (previous value poped from stack),
+            # pop is part of command returned by memory op dict
             command += self.__getMemoryOpDict()[stackOp][segment](offset)
-            if stackOp == "pop":
-                command = self.__getStackOpDict()["pop"]() + command
-            else:
+            if stackOp == "push":
+                # reading segment overwrites D, so cached top is spilled first
+                command = self.__stack.flush() + command
                 command += self.__getStackOpDict()["push"]()
         else:
             logging.error("invalid command on line: {}".format(lineNumber))
@@ -545,15 +770,44 @@ class Parser:
     def parse(self):
         lines = self.__lineList
         newLines = []
-        for lineNumber, line in enumerate(lines):
-            command = self.__parseLine(line, lineNumber)
-            if command is not None:
+        commandLines = [(lineNumber, line) for lineNumber, line in enumerate(lines)
+                        if self.__shouldBeProcessed(line)]
+        window = max(len(matchers) for name, matchers, emitter in self.__getFusionPatterns())
+        index = 0
+        while index < len(commandLines):
+            fused = None
+            if self.__fuse:
+                fused = self.__fuseLines([line for lineNumber, line in commandLines[index:index + window]])
+            if fused is not None:
+                command, count = fused
+            else:
+                command, count = self.__parseLine(commandLines[index][1], commandLines[index][0]), 1
+            for lineNumber, line in commandLines[index:index + count]:
                 newLines.append("// {}".format(line))
-                newLines.append(command)
+            newLines.append(command)
+            index += count
+        flush = self.__stack.flush()
+        if flush:
+            newLines.append("// flush cached top of stack")
+            newLines.append(flush)
+        subroutines = self.__opManager.getComparisonSubroutines()
+        if subroutines:
+            newLines = ["// shared comparison subroutines", subroutines] + newLines
         return newLines
 
 # end of class Parser
 
+def countInstructions(lines):
+    """
+    Counts ROM words of translated lines, labels and comments take none
+    """
+    count = 0
+    for line in "\n".join(lines).splitlines():
+        line = line.strip()
+        if line and not line.startswith("//") and not line.startswith("("):
+            count += 1
+    return count
+
 
 def main():
     argumentParser = argparse.ArgumentParser(description = "Virtual machine translator.")
@@ -562,6 +816,12 @@ def main():
 
     argumentParser.add_argument("--keep", action = "store_const", const = True,
                                 help = "keep temporary preprocessed file")
+    argumentParser.add_argument("--cache-top", action = "store_const", const = True,
+                                help = "keep top of stack in D register between commands")
+    argumentParser.add_argument("--shared-compare", action = "store_const", const = True,
+                                help = "emit eq, gt and lt once as subroutines")
+    argumentParser.add_argument("--fuse", action = "store_const", const = True,
+                                help = "translate common command sequences as one")
 
     args = vars(argumentParser.parse_args())
     inFilePath = Path(args["inputFile"][0])
@@ -573,7 +833,17 @@ def main():
     with open(inFilePath) as f:
         lines = f.readlines()
 
-    processedFile = Parser(lines, fileName).parse()
+    options = {"cacheTop": bool(args["cache_top"]), "fuse": bool(args["fuse"])}
+    parser = Parser(lines, fileName, shareComparisons = bool(args["shared_compare"]), **options)
+    processedFile = parser.parse()
+    if args["fuse"]:
+        for name, count in sorted(parser.getFusionStatistics().items()):
+            print("fused {}: {}".format(name, count))
+    if args["shared_compare"]:
+        inlineWords = countInstructions(Parser(lines, fileName, **options).parse())
+        sharedWords = countInstructions(processedFile)
+        print("shared comparisons: {} ROM words, inline: {}, saved: {}".format(
+            sharedWords, inlineWords, inlineWords - sharedWords))
     
     open(outFile, mode = "w").write("\n".join(processedFile))
     return None
@@ -1,6 +1,8 @@
+from pathlib import Path
 import unittest
 
-from vmTranslator import Stack, MemorySegmentManager, SegmentType
+from vmTranslator import Stack, MemorySegmentManager, SegmentType, OperationsManager, Parser, countInstructions
+from vmBenchmark import MODES, runTranslated
 
 class StackTest(unittest.TestCase):
 
@@ -14,6 +16,36 @@ class StackTest(unittest.TestCase):
         expectedCommand = "@SP\nM=M-1\n@SP\nA=M\nD=M\n"
         self.assertEqual(command, expectedCommand, msg = "stack pop test")
 
+    def test_cacheTop(self):
+        stack = Stack(cacheTop = True)
+        self.assertEqual(stack.push(), "", msg = "cached push")
+        self.assertRaises(ValueError, stack.push)
+        self.assertEqual(stack.flush(), "@SP\nA=M\nM=D\n@SP\nM=M+1\n", msg = "flush spills top")
+        self.assertEqual(stack.flush(), "", msg = "nothing left to flush")
+        stack.push()
+        self.assertEqual(stack.pop(), "", msg = "pop of cached top")
+        self.assertEqual(stack.pop(), "@SP\nM=M-1\n@SP\nA=M\nD=M\n", msg = "pop from memory")
+
+class OperationsManagerTest(unittest.TestCase):
+
+    def test_add(self):
+        command = OperationsManager(Stack(), MemorySegmentManager("testFile")).opAdd()
+        expectedCommand = "@SP\nAM=M-1\nD=M\nA=A-1\nM=D+M\n"
+        self.assertEqual(command, expectedCommand, msg = "in place add test")
+
+    def test_neg(self):
+        command = OperationsManager(Stack(), MemorySegmentManager("testFile")).opNeg()
+        expectedCommand = "@SP\nA=M-1\nM=-M\n"
+        self.assertEqual(command, expectedCommand, msg = "in place neg test")
+
+    def test_cachedSub(self):
+        stack = Stack(cacheTop = True)
+        stack.push()
+        command = OperationsManager(stack, MemorySegmentManager("testFile")).opSub()
+        expectedCommand = "@SP\nAM=M-1\nD=M-D\n"
+        self.assertEqual(command, expectedCommand, msg = "sub with cached top test")
+        self.assertEqual(stack.pop(), "", msg = "result stays cached")
+
 class MemorySegmentManagerTest(unittest.TestCase):
 
     def test_getLCL(self):
@@ -64,6 +96,22 @@ class MemorySegmentManagerTest(unittest.TestCase):
         expectedCommand = "@aux0\nM=D\n@offset\nD=A\n@THAT\nD=D+M\n@aux1\nM=D\n@aux0\nD=M\n@aux1\nA=M\nM=D\n"
         self.assertEqual(command, expectedCommand)
 
+    def test_getOffsetLCL(self):
+        msm = MemorySegmentManager("testFile")
+        self.assertEqual(msm.getSegment(SegmentType.LCL_SEGMENT, "0"), "@LCL\nA=M\nD=M\n")
+        self.assertEqual(msm.getSegment(SegmentType.LCL_SEGMENT, "2"), "@LCL\nA=M+1\nA=A+1\nD=M\n")
+        self.assertEqual(msm.getSegment(SegmentType.LCL_SEGMENT, "9"), "@9\nD=A\n@LCL\nA=D+M\nD=M\n")
+
+    def test_setOffsetTHAT(self):
+        msm = MemorySegmentManager("testFile")
+        self.assertEqual(msm.setSegment(SegmentType.THAT_SEGMENT, "1"), "@THAT\nA=M+1\nM=D\n")
+
+    def test_popToOffsetARG(self):
+        msm = MemorySegmentManager("testFile")
+        command = msm.popToSegment(SegmentType.ARG_SEGMENT, "9", "POP\n")
+        expectedCommand = "@9\nD=A\n@ARG\nD=D+M\n@R13\nM=D\nPOP\n@R13\nA=M\nM=D\n"
+        self.assertEqual(command, expectedCommand, msg = "address is resolved before pop")
+
     def test_getCONST(self):
         msm = MemorySegmentManager("testFile")
         command = msm.getSegment(SegmentType.CONST_SEGMENT, "value")
@@ -130,5 +178,50 @@ class MemorySegmentManagerTest(unittest.TestCase):
             expectedCommand = "@aux{}\n".format(i)
             self.assertEqual(command, expectedCommand)
 
+class ModesTest(unittest.TestCase):
+
+    def test_sameMemory(self):
+        for inFilePath in sorted(Path(__file__).resolve().parent.rglob("*.vm")):
+            lines = inFilePath.read_text().splitlines()
+            romWords, cycles, expectedMemory = runTranslated(lines, inFilePath.stem)
+            for mode, options in MODES.items():
+                modeRomWords, modeCycles, memory = runTranslated(lines, inFilePath.stem, **options)
+                self.assertEqual(memory, expectedMemory, msg = "{} {}".format(inFilePath.stem, mode))
+                if options.get("cacheTop") and not options.get("shareComparisons"):
+                    self.assertLessEqual(modeCycles, cycles, msg = "{} {}".format(inFilePath.stem, mode))
+
+    def test_segmentOffsets(self):
+        lines = []
+        for segment, base in (("local", 300), ("argument", 400), ("this", 3000), ("that", 3010)):
+            for offset in (0, 1, 6, 7, 20):
+                lines += ["push constant {}".format(base + offset), "pop {} {}".format(segment, offset),
+                          "push {} {}".format(segment, offset), "pop temp 1"]
+        for mode, options in MODES.items():
+            romWords, cycles, memory = runTranslated(lines, "testFile", **options)
+            for base in (300, 400, 3000, 3010):
+                for offset in (0, 1, 6, 7, 20):
+                    self.assertEqual(memory[base + offset], base + offset, msg = mode)
+            self.assertEqual(memory[6], 3030, msg = mode)
+
+    def test_fusion(self):
+        lines = ["push constant 0", "not", "push local 1", "pop that 2", "push constant 3", "add",
+                 "push local 0", "push argument 1", "lt", "pop temp 1"]
+        parser = Parser(lines, "testFile", fuse = True)
+        translated = "\n".join(parser.parse())
+        self.assertIn("D=-1\n", translated, msg = "not of constant is folded")
+        expectedStatistics = {"constant unary": 1, "move": 1, "constant operand": 1, "operands": 1}
+        self.assertEqual(parser.getFusionStatistics(), expectedStatistics)
+        self.assertEqual(Parser(lines, "testFile").getFusionStatistics(), {}, msg = "fusion is off by default")
+
+    def test_sharedComparisons(self):
+        lines = ["push constant {}\npush constant 7\n{}".format(i, op) for i in range(3) for op in ("eq", "lt")]
+        lines = "\n".join(lines).splitlines()
+        inline = Parser(lines, "testFile").parse()
+        shared = Parser(lines, "testFile", shareComparisons = True).parse()
+        sharedText = "\n".join(shared)
+        self.assertEqual(sharedText.count("(VM_COMPARE_JEQ)"), 1, msg = "subroutine emitted once")
+        self.assertNotIn("(VM_COMPARE_JGT)", sharedText, msg = "unused subroutine")
+        self.assertLess(countInstructions(shared), countInstructions(inline), msg = "shared form is smaller")
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file